@@ -21,10 +21,31 @@
 #
 
 """simple_geo.py toolkit"""
-from .wfs import WFS
-from .coverage import Coverage
-from .predicates import Predicates
-from .feature import Feature
-from .simple_geo import SimpleGeo
-from .time_series import TimeSeries
+import importlib
 
+# the public classes and the module they are defined in, imported on first access (PEP 562) so that importing
+# the package does not import pandas, geopandas, shapely, requests or wtss
+_exports = {
+    'WFS': 'wfs',
+    'Coverage': 'coverage',
+    'Predicates': 'predicates',
+    'Feature': 'feature',
+    'SimpleGeo': 'simple_geo',
+    'TimeSeries': 'time_series',
+    'TimeSeriesArray': 'time_series',
+    'AsyncSimpleGeo': 'async_simple_geo',
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+    value = getattr(importlib.import_module('.' + _exports[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports))
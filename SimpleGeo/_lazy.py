@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright (C) 2017 National Institute For Space Research (INPE) - Brazil.
+#
+#  This file is part of simple_geo.py toolkit.
+#
+#  simple_geo.py toolkit is free software: you can
+#  redistribute it and/or modify it under the terms of the
+#  GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License,
+#  or (at your option) any later version.
+#
+#  simple_geo.py toolkit is distributed in the hope that
+#  it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with simple_geo.py toolkit. See LICENSE. If not, write to
+#  e-sensing team at <esensing-team@dpi.inpe.br>.
+#
+
+
+import importlib
+import importlib.util
+import types
+
+
+class LazyModule(types.ModuleType):
+    """A stand-in for a module that imports it on first attribute access.
+
+    Heavy dependencies (pandas, geopandas, shapely, requests, ...) are bound at module level to LazyModule objects,
+    so importing SimpleGeo only pays for them when a request actually needs them. Attributes are cached on the
+    stand-in after their first access, and submodules (e.g. pyarrow.parquet) are imported when they are not
+    attributes of the loaded module.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__module = None
+
+    def __load(self):
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name__)
+        return self.__module
+
+    def __getattr__(self, attribute):
+        if attribute.startswith('__') and attribute.endswith('__'):
+            raise AttributeError(attribute)
+        module = self.__load()
+        try:
+            value = getattr(module, attribute)
+        except AttributeError:
+            try:
+                value = importlib.import_module('{}.{}'.format(self.__name__, attribute))
+            except ImportError:
+                raise AttributeError("module '{}' has no attribute '{}'".format(self.__name__, attribute))
+        setattr(self, attribute, value)
+        return value
+
+    def __dir__(self):
+        return dir(self.__load())
+
+    def __repr__(self):
+        return "<lazy module '{}'{}>".format(self.__name__, '' if self.__module is None else ' (loaded)')
+
+
+def lazy_import(name):
+    """Returns a LazyModule of the given module name"""
+    return LazyModule(name)
+
+
+def optional_import(name):
+    """Returns a LazyModule of an optional dependency, or None when it is not installed"""
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        spec = None
+    return None if spec is None else LazyModule(name)
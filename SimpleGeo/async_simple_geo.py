@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright (C) 2017 National Institute For Space Research (INPE) - Brazil.
+#
+#  This file is part of simple_geo.py toolkit.
+#
+#  simple_geo.py toolkit is free software: you can
+#  redistribute it and/or modify it under the terms of the
+#  GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License,
+#  or (at your option) any later version.
+#
+#  simple_geo.py toolkit is distributed in the hope that
+#  it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with simple_geo.py toolkit. See LICENSE. If not, write to
+#  e-sensing team at <esensing-team@dpi.inpe.br>.
+#
+
+from SimpleGeo import Feature
+from SimpleGeo import Coverage
+from SimpleGeo import WFS
+from SimpleGeo._lazy import optional_import
+from SimpleGeo.metrics import Metrics, print_hook
+from SimpleGeo.simple_geo import SimpleGeo
+from SimpleGeo.time_series import TimeSeries
+
+import asyncio
+import datetime
+import json
+import time
+from http.client import responses
+
+# optional, required by AsyncSimpleGeo
+aiohttp = optional_import('aiohttp')
+
+
+class AsyncSimpleGeo:
+    """asyncio client for WFS and WTSS servers.
+
+    Feature and TimeSeries objects created by this client describe queries as usual and are run with
+    await feature.aget(), await time_series.aget(pos) or async for chunk in feature.aiter(). Coverage regions
+    (Coverage.get) are only available from SimpleGeo. All requests share one connection pool, which also bounds
+    how many of them are sent at the same time.
+
+    Example:
+        async with AsyncSimpleGeo(wfs="http://wfs_server/geoserver", wtss="http://wtss_server") as s:
+            estados = await s.feature('esensing:estados_bra').aget()
+    """
+
+    def __init__(self, **kwargs):
+        """Create asynchronous wfs and wtss clients attached to given host addresses.
+        Args:
+            wfs (str): WFS server URL
+            wtss (str): WTSS server URL
+            auth (tuple, optional): the ("user", "pass") credentials of the WFS server
+            debug (boolean, optional): print every request and processing stage
+            hooks (list, optional): functions called as hook(event, fields) on every event (see Metrics)
+            concurrency (int, optional): the maximum number of requests sent at the same time
+            timeout (float, optional): the total timeout of each request, in seconds
+            wfs_version (str, optional): the WFS protocol version, '1.0.0' (the default) or '2.0.0'
+            snap (bool, optional): snap time series positions to the centre of the coverage pixel, so points in
+                the same pixel share one request
+        """
+        if aiohttp is None:
+            raise ImportError('AsyncSimpleGeo requires the aiohttp package')
+
+        invalid_parameters = set(kwargs) - {"debug", "wfs", "wtss", "auth", "concurrency", "timeout", "hooks",
+                                            "wfs_version", "snap"}
+        if invalid_parameters:
+            raise AttributeError('invalid parameter(s): {}'.format(invalid_parameters))
+
+        self.__debug = False
+        if 'debug' in kwargs:
+            if not type(kwargs['debug']) is bool:
+                raise AttributeError('debug must be a boolean')
+            self.__debug = kwargs['debug']
+
+        self.__metrics = Metrics()
+        if self.__debug:
+            self.__metrics.add_hook(print_hook)
+        if 'hooks' in kwargs:
+            if type(kwargs['hooks']) is not list:
+                raise AttributeError('hooks must be a list of functions')
+            for hook in kwargs['hooks']:
+                self.__metrics.add_hook(hook)
+
+        self.__concurrency = 10
+        if 'concurrency' in kwargs:
+            if type(kwargs['concurrency']) is not int or kwargs['concurrency'] < 1:
+                raise AttributeError('concurrency must be an integer greater than 0')
+            self.__concurrency = kwargs['concurrency']
+
+        self.__timeout = None
+        if 'timeout' in kwargs:
+            if kwargs['timeout'] is not None and type(kwargs['timeout']) not in (int, float):
+                raise AttributeError('timeout must be a number')
+            self.__timeout = kwargs['timeout']
+
+        self.__auth = None
+        if 'auth' in kwargs:
+            if kwargs['auth'] is not None:
+                if not type(kwargs['auth']) is tuple:
+                    raise AttributeError('auth must be a tuple ("user", "pass")')
+                if len(kwargs['auth']) != 2:
+                    raise AttributeError('auth must be a tuple with 2 values ("user", "pass")')
+                self.__auth = kwargs['auth']
+
+        # the WFS client builds the requests, decodes the responses and keeps the schema cache
+        self.__wfs = None
+        if 'wfs' in kwargs:
+            if type(kwargs['wfs']) is not str:
+                raise AttributeError('wfs must be a string')
+            # 'auto' is not offered, as the negotiation is a blocking request
+            if kwargs.get('wfs_version', '1.0.0') not in ('1.0.0', '2.0.0'):
+                raise AttributeError("wfs_version must be '1.0.0' or '2.0.0'")
+            self.__wfs = WFS(kwargs['wfs'], auth=self.__auth, metrics=self.__metrics,
+                             version=kwargs.get('wfs_version', '1.0.0'))
+
+        self.__wtss_server = None
+        if 'wtss' in kwargs:
+            if type(kwargs['wtss']) is not str:
+                raise AttributeError('wtss must be a string')
+            self.__wtss_server = kwargs['wtss']
+
+        self.__snap = False
+        if 'snap' in kwargs:
+            if not type(kwargs['snap']) is bool:
+                raise AttributeError('snap must be a boolean')
+            self.__snap = kwargs['snap']
+        self.__grids = {}
+
+        self.__session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """Closes the connections kept alive to the servers."""
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+        if self.__wfs is not None:
+            self.__wfs.close()
+
+    def _session(self):
+        if self.__session is None:
+            connector = aiohttp.TCPConnector(limit=self.__concurrency)
+            self.__session = aiohttp.ClientSession(connector=connector,
+                                                   timeout=aiohttp.ClientTimeout(total=self.__timeout),
+                                                   headers={'Accept-Encoding': 'gzip, deflate'})
+        return self.__session
+
+    async def _request(self, method, uri, data=None, params=None, auth=None, event='wfs.request'):
+        headers = {}
+        if data is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        start = time.perf_counter()
+        async with self._session().request(method, uri, data=data, params=params, headers=headers,
+                                           auth=auth) as r:
+            if r.status != 200:
+                self.__metrics.emit(event, method=method, uri=uri, status=r.status,
+                                    seconds=time.perf_counter() - start)
+                raise Exception("HTTP {} request failed: {}".format(method, responses[r.status]))
+            content = await r.read()
+        self.__metrics.emit(event, method=method, uri=uri, status=r.status, seconds=time.perf_counter() - start,
+                            bytes=len(content))
+        return content
+
+    def _wfs_request(self, method, request, data=None):
+        if self.__wfs is None:
+            raise AttributeError('wfs server is not defined')
+        auth = aiohttp.BasicAuth(*self.__auth) if self.__auth else None
+        uri = "{}/{}&request={}".format(self.__wfs.host, self.__wfs.base_path, request)
+        return self._request(method, uri, data=data, auth=auth)
+
+    def _wtss_request(self, operation, **params):
+        if self.__wtss_server is None:
+            raise AttributeError('wtss server is not defined')
+        return self._request('GET', "{}/wtss/{}".format(self.__wtss_server, operation), params=params,
+                             event='wtss.request')
+
+    def stats(self):
+        """Returns the totals of every event (see Metrics.snapshot)"""
+        return self.__metrics.snapshot()
+
+    def reset_stats(self):
+        self.__metrics.reset()
+
+    def add_hook(self, hook):
+        """Registers a function called as hook(event, fields) on every event (see Metrics)"""
+        self.__metrics.add_hook(hook)
+
+    def remove_hook(self, hook):
+        self.__metrics.remove_hook(hook)
+
+    def feature(self, name):
+        return Feature(self, name)
+
+    async def features(self):
+        doc = await self._wfs_request('GET', 'GetCapabilities')
+        return WFS._parse_capabilities(doc)
+
+    async def describe_feature(self, name):
+        if not name:
+            raise ValueError("Missing feature name.")
+        feature = self.__wfs.get_schema(name)
+        if feature is None:
+            doc = await self._wfs_request('GET', 'DescribeFeatureType&{}={}'.format(self.__wfs._type_names(), name))
+            feature = WFS._parse_description(json.loads(doc))
+            self.__wfs.set_schema(name, feature)
+        return feature
+
+    def coverage(self, name):
+        return Coverage(self, name)
+
+    async def coverages(self):
+        return json.loads(await self._wtss_request('list_coverages'))
+
+    async def describe_coverage(self, name):
+        return json.loads(await self._wtss_request('describe_coverage', name=name))
+
+    def time_series(self, coverage):
+        return TimeSeries(self, coverage)
+
+    async def aget(self, resource, **kwargs):
+        if resource.__class__.__name__ == "Feature":
+            return await self.__get_feature(resource, **kwargs)
+        elif resource.__class__.__name__ == "TimeSeries":
+            return await self.__get_time_series(resource, **kwargs)
+        else:
+            raise NotImplementedError("Not implemented")
+
+    async def aiter(self, resource, page_size=1000):
+        """Iterate over the result of a query in DataFrame chunks of at most page_size rows.
+
+        Args:
+            resource (Feature): the query to be run
+            page_size (int, optional): the number of features fetched on each request
+
+        Yields:
+            DataFrame: a GeoDataFrame (or DataFrame, for features without geometry) for each page
+        """
+        if resource.__class__.__name__ != "Feature":
+            raise NotImplementedError("Not implemented")
+        if type(page_size) is not int or page_size < 1:
+            raise AttributeError('page_size must be an integer greater than 0')
+
+        args, ts_attributes = SimpleGeo._feature_args(resource)
+        feature_desc = await self.describe_feature(resource['name'])
+        max_features = args.pop('max_features', None)
+        fetched = 0
+        while not max_features or fetched < max_features:
+            count = min(page_size, max_features - fetched) if max_features else page_size
+            fc = await self.__get_page(resource['name'], feature_desc, args, start_index=fetched,
+                                       max_features=count)
+            if fc['total'] == 0:
+                break
+            yield await self.__feature_data(fc, ts_attributes)
+            fetched += fc['total']
+            if fc['total'] < count:
+                break
+
+    async def __get_feature(self, feature, **kwargs):
+        invalid_parameters = set(kwargs) - {"page_size"}
+        if invalid_parameters:
+            raise AttributeError('invalid parameter(s): {}'.format(invalid_parameters))
+
+        args, ts_attributes = SimpleGeo._feature_args(feature)
+        feature_desc = await self.describe_feature(feature['name'])
+
+        page_size = kwargs.get('page_size')
+        if page_size is None:
+            fc = await self.__get_page(feature['name'], feature_desc, args)
+            return await self.__feature_data(fc, ts_attributes)
+
+        if type(page_size) is not int or page_size < 1:
+            raise AttributeError('page_size must be an integer greater than 0')
+
+        # the first page tells how many features match, the others are requested concurrently
+        max_features = args.pop('max_features', None)
+        count = min(page_size, max_features) if max_features else page_size
+        first = await self.__get_page(feature['name'], feature_desc, args, start_index=0, max_features=count)
+        pages = [first]
+        if first['total'] == count and type(first['total_features']) is int:
+            end = min(first['total_features'], max_features) if max_features else first['total_features']
+            pages += await asyncio.gather(*[
+                self.__get_page(feature['name'], feature_desc, args, start_index=start,
+                                max_features=min(page_size, end - start))
+                for start in range(count, end, page_size)])
+        fc = WFS._merge_feature_collections(page for page in pages if page['total'] > 0)
+        return await self.__feature_data(fc, ts_attributes)
+
+    async def __get_page(self, ft_name, feature_desc, args, **kwargs):
+        request = dict(args)
+        request.update(kwargs)
+        data = self.__wfs._get_feature_data(ft_name, feature_desc, **request)
+        doc = await self._wfs_request('POST', 'GetFeature', data=WFS._get_feature_body(data))
+        # parsing and decoding are CPU bound, so they run away from the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: WFS._decode_collection(json.loads(doc), feature_desc,
+                                                                               self.__metrics))
+
+    async def __feature_data(self, fc, ts_attributes):
+        with self.__metrics.timer('frame.build', features=fc['total']):
+            geo_data = SimpleGeo._feature_frame(fc)
+        if len(geo_data) == 0:
+            return geo_data
+        for ts_att in ts_attributes:
+            coverage = ts_att['time_series']['coverage']['name']
+            attributes = ts_att['time_series']['coverage']['attributes']
+            keys, distinct = SimpleGeo._distinct_time_series_keys(SimpleGeo._time_series_keys(geo_data, ts_att),
+                                                                  await self.__grid(coverage))
+            series = await asyncio.gather(*[self.__fetch_time_series(coverage, attributes, *key)
+                                            for key in distinct])
+            SimpleGeo._assign_time_series(geo_data, keys, dict(zip(distinct, series)))
+        return geo_data
+
+    async def gather_time_series(self, time_series, positions):
+        """Retrieve the time series of many positions concurrently, in the order of positions. Positions in the
+        same pixel (with snap) are requested once, and a failed position does not stop the others.
+
+        Returns:
+            list: a (time series, None), or (None, error) if the request failed, for each position
+        """
+        if time_series['start_date'] is None:
+            raise AttributeError('it is necessary to set period/date of the time serie')
+        coverage = time_series['coverage']['name']
+        attributes = time_series['coverage']['attributes']
+        keys, distinct = SimpleGeo._distinct_time_series_keys([(pos.y, pos.x) for pos in positions],
+                                                              await self.__grid(coverage))
+
+        async def fetch(key):
+            try:
+                return await self.__fetch_time_series(coverage, attributes, *key, time_series['start_date'],
+                                                      time_series['end_date']), None
+            except Exception as e:
+                return None, e
+
+        fetched = dict(zip(distinct, await asyncio.gather(*[fetch(key) for key in distinct])))
+        return [fetched[key] for key in keys]
+
+    async def __grid(self, coverage):
+        """Returns the grid of a coverage (see SimpleGeo._grid) when positions are snapped, otherwise None"""
+        if not self.__snap:
+            return None
+        if coverage not in self.__grids:
+            self.__grids[coverage] = SimpleGeo._grid(await self.describe_coverage(coverage))
+        return self.__grids[coverage]
+
+    async def __get_time_series(self, time_series, **kwargs):
+        coverage = time_series['coverage']['name']
+        attributes = time_series['coverage']['attributes']
+        if time_series['start_date'] is None:
+            raise AttributeError('it is necessary to set period/date of the time serie')
+        return await self.__fetch_time_series(coverage, attributes, kwargs['pos'].y, kwargs['pos'].x,
+                                              time_series['start_date'], time_series['end_date'])
+
+    async def __fetch_time_series(self, coverage, attributes, latitude, longitude, start_date, end_date):
+        grid = await self.__grid(coverage)
+        if grid is not None:
+            latitude, longitude = SimpleGeo._snap(grid, latitude, longitude)
+        doc = await self._wtss_request('time_series', coverage=coverage, attributes=",".join(attributes),
+                                       latitude=str(latitude), longitude=str(longitude),
+                                       start_date=start_date, end_date=end_date)
+        result = json.loads(doc)['result']
+        values = {attr['attribute']: attr['values'] for attr in result['attributes']}
+        timeline = [datetime.datetime.strptime(date, "%Y-%m-%d").date() for date in result['timeline']]
+        return SimpleGeo._time_series_frame(values, timeline)
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright (C) 2017 National Institute For Space Research (INPE) - Brazil.
+#
+#  This file is part of simple_geo.py toolkit.
+#
+#  simple_geo.py toolkit is free software: you can
+#  redistribute it and/or modify it under the terms of the
+#  GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License,
+#  or (at your option) any later version.
+#
+#  simple_geo.py toolkit is distributed in the hope that
+#  it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with simple_geo.py toolkit. See LICENSE. If not, write to
+#  e-sensing team at <esensing-team@dpi.inpe.br>.
+#
+
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from ._lazy import lazy_import, optional_import
+from .geojson import geometry_size
+from .metrics import Metrics, print_hook
+
+try:
+    # For Python < 3.0 and later
+    import cPickle
+except ImportError:
+    # For Python  3.0 and later
+    import _pickle as cPickle
+
+shapely = lazy_import('shapely')
+
+# optional, used by the columnar cache format
+pyarrow = optional_import('pyarrow')
+
+
+# the number of items of a container that are measured to estimate the size of all its items
+SIZE_SAMPLE = 100
+
+
+def memory_size(content, sample=SIZE_SAMPLE):
+    """Estimates the memory, in bytes, taken by a cache entry once loaded.
+
+    Feature collection geometries are measured by their number of coordinates (see geojson.geometry_size). The
+    items of lists, tuples, sets, dicts and object arrays are estimated from a sample of at most sample items (and
+    their own items from smaller samples), so large entries are measured quickly.
+    """
+    if isinstance(content, dict) and 'properties' in content and 'ids' in content:
+        size = sys.getsizeof(content) + memory_size(content['ids'], sample)
+        for values in content['properties'].values():
+            size += memory_size(values, sample)
+        if content.get('geometry') is not None:
+            size += sys.getsizeof(content['geometry']) + geometry_size(content['geometry'])
+        return size
+    if isinstance(content, dict):
+        # keys and values
+        return sys.getsizeof(content) + _items_size(itertools.chain.from_iterable(content.items()), 2 * len(content),
+                                                    sample)
+    if isinstance(content, (list, tuple, set)) or getattr(content, 'dtype', None) == object and \
+            not hasattr(content, 'memory_usage'):
+        # lists and object arrays only hold references to their items
+        return sys.getsizeof(content) + _items_size(content, len(content), sample)
+    # strings, numbers, numeric arrays, pandas objects (which measure their items) and objects with __sizeof__
+    return sys.getsizeof(content)
+
+
+def _items_size(items, count, sample):
+    """Estimates the size of count items from the first sample ones"""
+    measured = list(itertools.islice(items, sample))
+    if not measured:
+        return 0
+    nested = max(1, sample // 10)
+    return sum(memory_size(item, nested) for item in measured) * count // len(measured)
+
+
+class PickleCodec:
+    """Stores any picklable entry"""
+    extension = 'pkl'
+
+    @staticmethod
+    def dump(content, file_path):
+        with open(file_path, 'wb') as handle:
+            cPickle.dump(content, handle, -1)
+
+    @staticmethod
+    def load(file_path, columns=None):
+        with open(file_path, 'rb') as handle:
+            return cPickle.load(handle)
+
+
+class ParquetCodec:
+    """Stores feature collections (see WFS.feature_collection) as Parquet files.
+
+    Each attribute is a column, geometries are stored as WKB and the remaining keys of the collection in the
+    file metadata. Files are memory mapped when read, only the requested attributes are read, and geometries
+    are decoded at once with shapely.from_wkb.
+    """
+    extension = 'parquet'
+    geometry_column = '__geometry'
+    id_column = '__id'
+
+    @staticmethod
+    def dump(fc, file_path):
+        columns = {}
+        for name, values in fc['properties'].items():
+            columns[name] = pyarrow.array(values)
+        columns[ParquetCodec.id_column] = pyarrow.array(fc['ids'], type=pyarrow.string())
+        if 'geometry' in fc:
+            columns[ParquetCodec.geometry_column] = pyarrow.array(shapely.to_wkb(fc['geometry']),
+                                                                  type=pyarrow.binary())
+        metadata = {k: v for k, v in fc.items() if k not in ('properties', 'ids', 'geometry')}
+        metadata['geometry'] = 'geometry' in fc
+        table = pyarrow.table(columns).replace_schema_metadata({'simple_geo': json.dumps(metadata)})
+        pyarrow.parquet.write_table(table, file_path)
+
+    @staticmethod
+    def load(file_path, columns=None):
+        if columns is not None:
+            schema = pyarrow.parquet.read_schema(file_path)
+            columns = [c for c in schema.names if c in set(columns) or c.startswith('__')]
+        table = pyarrow.parquet.read_table(file_path, columns=columns, memory_map=True)
+        fc = json.loads(table.schema.metadata[b'simple_geo'])
+        has_geometry = fc.pop('geometry')
+        fc['ids'] = table.column(ParquetCodec.id_column).to_pylist()
+        if has_geometry:
+            wkb = table.column(ParquetCodec.geometry_column).to_numpy(zero_copy_only=False)
+            fc['geometry'] = shapely.from_wkb(wkb)
+        fc['properties'] = {name: table.column(name).to_pandas() for name in table.column_names
+                            if not name.startswith('__')}
+        return fc
+
+
+class Cache:
+    """Two tier cache of request results.
+
+    Entries are kept in a bounded in-memory LRU in front of a store on disk
+    (<cache_dir>/<resource_type>/<key>.<extension>). Entries are pickled unless a codec is given for their
+    resource type (an entry the codec cannot store is pickled as well). Entries older than ttl are discarded from
+    both tiers, and when the disk store grows beyond disk_quota the least recently used files are removed. The
+    modification time of a file is its write time and its access time, set explicitly on every hit, is its last
+    use.
+    """
+
+    def __init__(self, cache_dir, memory_size=256 * 2 ** 20, ttl=None, disk_quota=None, codecs=None, debug=False,
+                 metrics=None, pinned=None):
+        """Create a cache.
+        Args:
+            cache_dir (str): the directory of the disk store
+            memory_size (int, optional): the maximum size, in bytes, of the entries kept in memory (the size of
+                an entry is estimated from its loaded content, see memory_size), 0 disables the memory tier
+            ttl (float, optional): the number of seconds an entry is valid, None for no expiration
+            disk_quota (int, optional): the maximum size, in bytes, of the disk store, None for no limit
+            codecs (dict, optional): the codec (PickleCodec, ParquetCodec) of each resource type
+            debug (bool, optional): enable debug messages
+            metrics (Metrics, optional): receives the cache.hit, cache.miss and cache.set events; their bytes are
+                the size of the entry in the disk store, also for hits of the memory tier (misses have none)
+            pinned (set, optional): the resource types never removed to enforce disk_quota, e.g. metadata that
+                other entries depend on
+        """
+        self.cache_dir = cache_dir
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self.disk_quota = disk_quota
+        self.codecs = codecs or {}
+        self.pinned = set(pinned or ())
+        if metrics is None and debug:
+            metrics = Metrics()
+            metrics.add_hook(print_hook)
+        self.metrics = metrics
+
+        self.__memory = OrderedDict()
+        self.__memory_bytes = 0
+        self.__disk_bytes = None
+        self.__lock = threading.RLock()
+        self.__stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'memory_evictions': 0,
+                        'disk_evictions': 0, 'expirations': 0}
+
+    def _path(self, resource_type, key, codec=PickleCodec):
+        return "{}/{}/{}.{}".format(self.cache_dir, resource_type, key, codec.extension)
+
+    def __codecs(self, resource_type):
+        codec = self.codecs.get(resource_type, PickleCodec)
+        return [codec] if codec is PickleCodec else [codec, PickleCodec]
+
+    def __expired(self, stored_at):
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def get(self, resource_type, key, columns=None):
+        """Returns a cached entry, or None if there is no valid entry for the given key.
+
+        Args:
+            resource_type (str): the type of the entry
+            key (str): the key of the entry
+            columns (list, optional): the attributes needed from a feature collection, the others may be left
+                out when the entry is read from a columnar file
+        """
+        with self.__lock:
+            entry = self.__memory.get((resource_type, key))
+            if entry is not None:
+                if not self.__expired(entry[2]):
+                    self.__memory.move_to_end((resource_type, key))
+                    self.__used(resource_type, key, entry[2])
+                    self.__stats['memory_hits'] += 1
+                    self.__emit('cache.hit', resource_type=resource_type, tier='memory', bytes=entry[3])
+                    return entry[0]
+                self.__stats['expirations'] += 1
+                self.delete(resource_type, key)
+
+            for codec in self.__codecs(resource_type):
+                file_path = self._path(resource_type, key, codec)
+                if not os.path.isfile(file_path) or os.path.getsize(file_path) == 0:
+                    continue
+                stat = os.stat(file_path)
+                if self.__expired(stat.st_mtime):
+                    self.__stats['expirations'] += 1
+                    self.delete(resource_type, key)
+                    break
+                content = codec.load(file_path, columns)
+                os.utime(file_path, (time.time(), stat.st_mtime))
+                if columns is None or codec is PickleCodec:
+                    self.__remember(resource_type, key, content, memory_size(content), stat.st_mtime, stat.st_size)
+                self.__stats['disk_hits'] += 1
+                self.__emit('cache.hit', resource_type=resource_type, tier='disk', bytes=stat.st_size)
+                return content
+
+            self.__stats['misses'] += 1
+            self.__emit('cache.miss', resource_type=resource_type)
+            return None
+
+    def set(self, resource_type, key, content):
+        """Stores an entry on both tiers."""
+        with self.__lock:
+            path_cache = "{}/{}".format(self.cache_dir, resource_type)
+            if not os.path.exists(path_cache):
+                os.makedirs(path_cache)
+            self.delete(resource_type, key)
+            for codec in self.__codecs(resource_type):
+                file_path = self._path(resource_type, key, codec)
+                try:
+                    codec.dump(content, file_path + '.tmp')
+                except Exception:
+                    if os.path.isfile(file_path + '.tmp'):
+                        os.remove(file_path + '.tmp')
+                    if codec is PickleCodec:
+                        raise
+                    continue
+                os.replace(file_path + '.tmp', file_path)
+                break
+            size = os.path.getsize(file_path)
+            if self.__disk_bytes is not None:
+                self.__disk_bytes += size
+            self.__remember(resource_type, key, content, memory_size(content), time.time(), size)
+            self.__enforce_quota()
+        self.__emit('cache.set', resource_type=resource_type, bytes=size)
+
+    def touch(self, resource_type, key):
+        """Renews the write time of an entry, e.g. after the server confirmed it did not change, so it does not
+        expire before ttl from now."""
+        with self.__lock:
+            now = time.time()
+            entry = self.__memory.get((resource_type, key))
+            if entry is not None:
+                self.__memory[(resource_type, key)] = (entry[0], entry[1], now, entry[3])
+            for codec in self.__codecs(resource_type):
+                file_path = self._path(resource_type, key, codec)
+                if os.path.isfile(file_path):
+                    os.utime(file_path, (now, now))
+
+    def delete(self, resource_type, key):
+        """Removes an entry from both tiers."""
+        with self.__lock:
+            entry = self.__memory.pop((resource_type, key), None)
+            if entry is not None:
+                self.__memory_bytes -= entry[1]
+            for codec in self.__codecs(resource_type):
+                file_path = self._path(resource_type, key, codec)
+                if os.path.isfile(file_path):
+                    if self.__disk_bytes is not None:
+                        self.__disk_bytes -= os.path.getsize(file_path)
+                    os.remove(file_path)
+
+    def clear(self, resource_type=None):
+        """Removes all entries, or all entries of a given resource type."""
+        with self.__lock:
+            if resource_type is None:
+                self.__memory.clear()
+                self.__memory_bytes = 0
+                root_dir = self.cache_dir
+            else:
+                for entry_key in [k for k in self.__memory if k[0] == resource_type]:
+                    self.__memory_bytes -= self.__memory.pop(entry_key)[1]
+                root_dir = "{}/{}".format(self.cache_dir, resource_type)
+            if os.path.exists(root_dir):
+                for root, dirs, files in os.walk(root_dir, topdown=False):
+                    for name in files:
+                        os.remove(os.path.join(root, name))
+                    for name in dirs:
+                        os.rmdir(os.path.join(root, name))
+            self.__disk_bytes = None
+        self.__emit('cache.clear', resource_type=resource_type)
+
+    def stats(self):
+        """Returns the hit/miss/eviction counters and the size of both tiers."""
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats['hits'] = stats['memory_hits'] + stats['disk_hits']
+            stats['memory_entries'] = len(self.__memory)
+            stats['memory_bytes'] = self.__memory_bytes
+            stats['disk_bytes'] = self.__disk_usage()
+            return stats
+
+    def __used(self, resource_type, key, stored_at):
+        """Sets the access time of the file of an entry served from memory, so the disk quota, which removes the
+        least recently used files, keeps it"""
+        for codec in self.__codecs(resource_type):
+            try:
+                os.utime(self._path(resource_type, key, codec), (time.time(), stored_at))
+                return
+            except FileNotFoundError:
+                continue
+
+    def __emit(self, event, **fields):
+        if self.metrics is not None:
+            self.metrics.emit(event, **fields)
+
+    def __remember(self, resource_type, key, content, size, stored_at, stored_size):
+        entry = self.__memory.pop((resource_type, key), None)
+        if entry is not None:
+            self.__memory_bytes -= entry[1]
+        if size > self.memory_size:
+            return
+        self.__memory[(resource_type, key)] = (content, size, stored_at, stored_size)
+        self.__memory_bytes += size
+        while self.__memory_bytes > self.memory_size:
+            _, evicted = self.__memory.popitem(last=False)
+            self.__memory_bytes -= evicted[1]
+            self.__stats['memory_evictions'] += 1
+
+    def __files(self):
+        files = []
+        if os.path.exists(self.cache_dir):
+            for root, dirs, names in os.walk(self.cache_dir):
+                for name in names:
+                    file_path = os.path.join(root, name)
+                    files.append((file_path, os.stat(file_path)))
+        return files
+
+    def __disk_usage(self):
+        if self.__disk_bytes is None:
+            self.__disk_bytes = sum(stat.st_size for _, stat in self.__files())
+        return self.__disk_bytes
+
+    def __enforce_quota(self):
+        if self.disk_quota is None or self.__disk_usage() <= self.disk_quota:
+            return
+        # least recently used first
+        for file_path, stat in sorted(self.__files(), key=lambda f: f[1].st_atime):
+            if self.__disk_bytes <= self.disk_quota:
+                break
+            resource_type = os.path.relpath(os.path.dirname(file_path), self.cache_dir)
+            if resource_type in self.pinned:
+                continue
+            os.remove(file_path)
+            self.__disk_bytes -= stat.st_size
+            self.__stats['disk_evictions'] += 1
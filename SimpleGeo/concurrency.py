@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright (C) 2017 National Institute For Space Research (INPE) - Brazil.
+#
+#  This file is part of simple_geo.py toolkit.
+#
+#  simple_geo.py toolkit is free software: you can
+#  redistribute it and/or modify it under the terms of the
+#  GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License,
+#  or (at your option) any later version.
+#
+#  simple_geo.py toolkit is distributed in the hope that
+#  it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with simple_geo.py toolkit. See LICENSE. If not, write to
+#  e-sensing team at <esensing-team@dpi.inpe.br>.
+#
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def ordered_map(fn, items, workers=4, max_in_flight=None):
+    """Apply fn to every item using a pool of threads, yielding the results in the order of items.
+
+    Args:
+        fn (callable): the function to be applied
+        items (iterable): the arguments of each call
+        workers (int, optional): the number of threads
+        max_in_flight (int, optional): the maximum number of calls submitted but not yet yielded,
+            2 * workers by default
+
+    Yields:
+        the result of each call, in input order
+
+    Raises:
+        AttributeError: if workers or max_in_flight are not positive integers
+    """
+    if type(workers) is not int or workers < 1:
+        raise AttributeError('workers must be an integer greater than 0')
+    if max_in_flight is None:
+        max_in_flight = 2 * workers
+    if type(max_in_flight) is not int or max_in_flight < 1:
+        raise AttributeError('max_in_flight must be an integer greater than 0')
+
+    if workers == 1:
+        for item in items:
+            yield fn(item)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+class RateLimiter:
+    """Spaces calls so that at most rate of them start per second, across threads."""
+
+    def __init__(self, rate):
+        """Create a rate limiter.
+        Args:
+            rate (float): the maximum number of calls per second
+        """
+        if type(rate) not in (int, float) or rate <= 0:
+            raise AttributeError('rate must be a positive number')
+        self.rate = rate
+        self.__next = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until the next call is allowed to start."""
+        with self.__lock:
+            now = time.monotonic()
+            wait = self.__next - now
+            self.__next = max(now, self.__next) + 1.0 / self.rate
+        if wait > 0:
+            time.sleep(wait)
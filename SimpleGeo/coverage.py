@@ -56,8 +56,20 @@ class Coverage:
         self.attr['attributes'] = attr
         return self
 
-    def get(self):
-        return self.__simple_geo.get(self)
+    def get(self, **kwargs):
+        """Retrieve a region of the coverage as a lazy (x, y, time, attribute) array.
+
+        Args:
+            **kwargs: Keyword arguments:
+                bbox (tuple): the (minx, miny, maxx, maxy) of the region
+                period (tuple): the (start_date, end_date) of the region (YYYY-MM-DD)
+                chunks (tuple, optional): the number of (columns, rows) of pixels of a chunk
+                workers (int, optional): the number of pixels requested concurrently
+
+        Returns:
+            CoverageArray: the array, whose chunks are fetched when needed
+        """
+        return self.__simple_geo.get(self, **kwargs)
 
     def describe(self):
         return self.__simple_geo.describe_coverage(self.attr['name'])
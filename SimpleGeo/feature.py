@@ -59,8 +59,8 @@ class Feature:
         return self
 
     def filter(self, ftr):
-        if type(ftr) is not str:
-            raise AttributeError('attributes must a string')
+        if not isinstance(ftr, str):
+            raise AttributeError('filter must be a string or a Predicates expression')
         self.attr['filter'] = ftr
         return self
 
@@ -78,8 +78,23 @@ class Feature:
         self.attr['sort_by'] = sb
         return self
 
-    def get(self):
-        return self.__simple_geo.get(self)
+    def get(self, **kwargs):
+        return self.__simple_geo.get(self, **kwargs)
+
+    def iter(self, page_size=1000):
+        return self.__simple_geo.iter(self, page_size=page_size)
+
+    def sync(self, watermark, **kwargs):
+        return self.__simple_geo.sync(self, watermark, **kwargs)
+
+    def count(self):
+        return self.__simple_geo.count(self)
+
+    async def aget(self, **kwargs):
+        return await self.__simple_geo.aget(self, **kwargs)
+
+    def aiter(self, page_size=1000):
+        return self.__simple_geo.aiter(self, page_size=page_size)
 
     def describe(self):
         return self.__simple_geo.describe_feature(self.attr['name'])
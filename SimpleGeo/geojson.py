@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright (C) 2017 National Institute For Space Research (INPE) - Brazil.
+#
+#  This file is part of simple_geo.py toolkit.
+#
+#  simple_geo.py toolkit is free software: you can
+#  redistribute it and/or modify it under the terms of the
+#  GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License,
+#  or (at your option) any later version.
+#
+#  simple_geo.py toolkit is distributed in the hope that
+#  it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with simple_geo.py toolkit. See LICENSE. If not, write to
+#  e-sensing team at <esensing-team@dpi.inpe.br>.
+#
+
+import time
+
+from SimpleGeo._lazy import lazy_import
+
+np = lazy_import('numpy')
+shapely = lazy_import('shapely')
+
+# the shapely.GeometryType of each supported geometry type
+GEOMETRY_TYPES = {
+    'gml:Point': 'POINT',
+    'gml:Polygon': 'POLYGON',
+    'gml:MultiPolygon': 'MULTIPOLYGON'
+}
+
+
+class FeatureDecoder:
+    """Decodes GeoJSON features into columns.
+
+    Properties are appended to one list per attribute. Coordinates are buffered as flat arrays with their ring,
+    polygon and part offsets, and every chunk_size features the buffered geometries are built at once with
+    shapely.from_ragged_array.
+    """
+
+    def __init__(self, geometry_type=None, chunk_size=10000, metrics=None):
+        """Create a decoder.
+        Args:
+            geometry_type (str, optional): the geometry type of the feature ('gml:Point', 'gml:Polygon' or
+                'gml:MultiPolygon'), None for features without geometry
+            chunk_size (int, optional): the number of features whose geometries are built at once
+            metrics (Metrics, optional): receives a geometry.build event for every chunk of geometries
+        """
+        if geometry_type is not None and geometry_type not in GEOMETRY_TYPES:
+            raise Exception('Unsupported geometry type.')
+
+        self.geometry_type = geometry_type
+        self.chunk_size = chunk_size
+        self.metrics = metrics
+        self.count = 0
+        self.ids = []
+        self.properties = {}
+        self.__geometries = []
+        self.__reset_buffers()
+
+    def __reset_buffers(self):
+        self.__coords = []
+        self.__nulls = []
+        self.__rings = [0]
+        self.__polygons = [0]
+        self.__parts = [0]
+
+    def extend(self, items):
+        """Decodes a sequence of GeoJSON features."""
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        """Decodes a GeoJSON feature."""
+        self.ids.append(item.get('id'))
+        self.__add_properties(item.get('properties') or {})
+        if self.geometry_type is not None:
+            self.__add_geometry(item.get('geometry'))
+        self.count += 1
+        if self.geometry_type is not None and len(self.__nulls) >= self.chunk_size:
+            self.__build_geometries()
+
+    def __add_properties(self, props):
+        columns = self.properties
+        # the usual case: the item has every attribute seen so far, and no other
+        if props.keys() == columns.keys():
+            for key, value in props.items():
+                columns[key].append(value)
+            return
+
+        # a new set of attributes: the missing values are filled with None
+        for key, value in props.items():
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [None] * self.count
+            column.append(value)
+        for column in columns.values():
+            if len(column) == self.count:
+                column.append(None)
+
+    def __add_geometry(self, geometry):
+        geometry_type = self.geometry_type
+        self.__nulls.append(geometry is None)
+        if geometry is None:
+            if geometry_type == 'gml:Point':
+                self.__coords.append((np.nan, np.nan))
+            elif geometry_type == 'gml:Polygon':
+                self.__polygons.append(self.__polygons[-1])
+            else:
+                self.__parts.append(self.__parts[-1])
+            return
+
+        coordinates = geometry['coordinates']
+        if geometry_type == 'gml:Point':
+            self.__coords.append(coordinates[:2])
+        elif geometry_type == 'gml:Polygon':
+            self.__add_polygon(coordinates)
+        else:
+            if geometry['type'] == 'Polygon':
+                coordinates = [coordinates]
+            for polygon in coordinates:
+                self.__add_polygon(polygon)
+            self.__parts.append(len(self.__polygons) - 1)
+
+    def __add_polygon(self, polygon):
+        rings = self.__rings
+        for ring in polygon:
+            self.__coords.extend(ring)
+            rings.append(rings[-1] + len(ring))
+        self.__polygons.append(len(rings) - 1)
+
+    def __build_geometries(self):
+        if not self.__nulls:
+            return
+        start = time.perf_counter()
+        geometry_type = self.geometry_type
+        coords = np.array(self.__coords, dtype=float).reshape(-1, 2) if self.__coords else np.empty((0, 2))
+        if geometry_type == 'gml:Point':
+            offsets = None
+        elif geometry_type == 'gml:Polygon':
+            offsets = (np.array(self.__rings), np.array(self.__polygons))
+        else:
+            offsets = (np.array(self.__rings), np.array(self.__polygons), np.array(self.__parts))
+        geometries = shapely.from_ragged_array(shapely.GeometryType[GEOMETRY_TYPES[geometry_type]], coords,
+                                               offsets)
+        geometries[np.array(self.__nulls)] = None
+        self.__geometries.append(geometries)
+        self.__reset_buffers()
+        if self.metrics is not None:
+            self.metrics.emit('geometry.build', seconds=time.perf_counter() - start, features=len(geometries))
+
+    def finish(self):
+        """Builds the remaining geometries and returns the decoded columns.
+
+        Returns:
+            dict: 'ids' (list), 'properties' (dict of lists) and, for features with geometry, 'geometry'
+                (numpy array of shapely geometries)
+        """
+        columns = {'ids': self.ids, 'properties': self.properties}
+        if self.geometry_type is not None:
+            self.__build_geometries()
+            columns['geometry'] = concat_geometries(self.__geometries)
+            self.__geometries = [columns['geometry']]
+        return columns
+
+
+def concat_geometries(chunks):
+    """Concatenates arrays of shapely geometries"""
+    if len(chunks) == 0:
+        return np.empty(0, dtype=object)
+    if len(chunks) == 1:
+        return chunks[0]
+    return np.concatenate(chunks)
+
+
+def geometry_size(geometries):
+    """Estimates the memory, in bytes, taken by an array of shapely geometries: GEOS stores 3 doubles per
+    coordinate, and each part of a geometry takes about 350 bytes of shapely and GEOS objects"""
+    geometries = np.asarray(geometries, dtype=object)
+    return int(shapely.get_num_coordinates(geometries).sum()) * 24 + \
+        int(shapely.get_num_geometries(geometries).sum()) * 350
+
+
+def concat_properties(chunks):
+    """Concatenates the properties columns (dicts of lists) of a sequence of collections"""
+    properties = {}
+    count = 0
+    for chunk, size in chunks:
+        for key, values in chunk.items():
+            if key not in properties:
+                properties[key] = [None] * count
+            properties[key] += values
+        count += size
+        for values in properties.values():
+            if len(values) < count:
+                values += [None] * (count - len(values))
+    return properties
+
+
+def crs_name(crs):
+    """Returns the name of a GeoJSON crs member (e.g. 'urn:ogc:def:crs:EPSG::4326'), or None"""
+    if type(crs) is dict:
+        return crs.get('properties', {}).get('name')
+    return crs
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright (C) 2017 National Institute For Space Research (INPE) - Brazil.
+#
+#  This file is part of simple_geo.py toolkit.
+#
+#  simple_geo.py toolkit is free software: you can
+#  redistribute it and/or modify it under the terms of the
+#  GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License,
+#  or (at your option) any later version.
+#
+#  simple_geo.py toolkit is distributed in the hope that
+#  it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with simple_geo.py toolkit. See LICENSE. If not, write to
+#  e-sensing team at <esensing-team@dpi.inpe.br>.
+#
+
+
+import datetime
+
+from SimpleGeo._lazy import lazy_import
+from SimpleGeo.concurrency import ordered_map
+
+np = lazy_import('numpy')
+
+
+class CoverageArray:
+    """Lazily evaluated (x, y, time, attribute) array of a region of a coverage.
+
+    The region is split in chunks of pixels. A chunk is only fetched when it is needed: the time series of its
+    pixels are requested to WTSS concurrently (the pixels of all the chunks needed at a time share the pool of
+    workers) and the chunk is stored in the cache, so it is fetched a single time. Indexing returns a NumPy array,
+    and iter_chunks and the reductions (sum, mean, min, max, count) only keep a few chunks in memory at a time.
+    Missing values are NaN.
+    """
+
+    def __init__(self, fetch, columns, rows, timeline, attributes, grid, chunks=(32, 32), workers=4, store=None,
+                 key=None):
+        """Create a coverage array.
+        Args:
+            fetch (callable): fetch(latitude, longitude) returns the (timeline, {attribute: values}) of a pixel
+            columns (range): the coverage pixel columns of the region, west to east
+            rows (range): the coverage pixel rows of the region, north to south
+            timeline (list): the dates of the region
+            attributes (list): the attributes of the region
+            grid (tuple): the (xmin, ymax, x resolution, y resolution) of the coverage
+            chunks (tuple, optional): the number of (columns, rows) of a chunk
+            workers (int, optional): the number of pixels requested concurrently
+            store (Cache, optional): the cache of chunks
+            key (callable, optional): key(columns, rows) returns the cache key of the chunk with the given
+                coverage pixel columns and rows
+        """
+        if type(chunks) is not tuple or len(chunks) != 2 or not all(type(c) is int and c > 0 for c in chunks):
+            raise AttributeError('chunks must be a tuple of 2 positive integers')
+        self.__fetch = fetch
+        self.columns = columns
+        self.rows = rows
+        self.timeline = [self._as_date(date) for date in timeline]
+        self.attributes = list(attributes)
+        self.chunks = chunks
+        self.workers = workers
+        self.__store = store
+        self.__key = key
+        self.__dates = {date: i for i, date in enumerate(self.timeline)}
+
+        xmin, ymax, res_x, res_y = grid
+        self.x = xmin + (np.arange(columns.start, columns.stop) + 0.5) * res_x
+        self.y = ymax - (np.arange(rows.start, rows.stop) + 0.5) * res_y
+
+    @property
+    def shape(self):
+        return len(self.x), len(self.y), len(self.timeline), len(self.attributes)
+
+    @property
+    def ndim(self):
+        return 4
+
+    @property
+    def dtype(self):
+        return np.dtype(float)
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return "CoverageArray(shape={}, chunks={}, attributes={})".format(self.shape, self.chunks, self.attributes)
+
+    @staticmethod
+    def _as_date(value):
+        if isinstance(value, str):
+            return datetime.date.fromisoformat(value[:10])
+        if isinstance(value, datetime.datetime):
+            return value.date()
+        return value
+
+    def __chunk_ids(self, x0=0, x1=None, y0=0, y1=None):
+        """Returns the (i, j) ids of the chunks that overlap a range of x and y positions"""
+        x1 = self.shape[0] if x1 is None else x1
+        y1 = self.shape[1] if y1 is None else y1
+        if x1 <= x0 or y1 <= y0:
+            return []
+        return [(i, j) for i in range(x0 // self.chunks[0], (x1 - 1) // self.chunks[0] + 1)
+                for j in range(y0 // self.chunks[1], (y1 - 1) // self.chunks[1] + 1)]
+
+    def chunk_slices(self, chunk_id):
+        """Returns the (x, y) slices of the array covered by a chunk"""
+        i, j = chunk_id
+        return (slice(i * self.chunks[0], min((i + 1) * self.chunks[0], self.shape[0])),
+                slice(j * self.chunks[1], min((j + 1) * self.chunks[1], self.shape[1])))
+
+    def __chunk_key(self, chunk_id):
+        xs, ys = self.chunk_slices(chunk_id)
+        return self.__key([self.columns[xs.start], self.columns[xs.stop - 1] + 1],
+                          [self.rows[ys.start], self.rows[ys.stop - 1] + 1])
+
+    def _load(self, chunk_ids):
+        """Returns the arrays of the given chunks, fetching the ones that are not cached"""
+        loaded = {}
+        missing = []
+        for chunk_id in chunk_ids:
+            if self.__store is not None:
+                loaded[chunk_id] = self.__store.get("coverage_chunk", self.__chunk_key(chunk_id))
+            if loaded.get(chunk_id) is None:
+                missing.append(chunk_id)
+
+        pixels = []
+        for chunk_id in missing:
+            xs, ys = self.chunk_slices(chunk_id)
+            loaded[chunk_id] = np.full((xs.stop - xs.start, ys.stop - ys.start) + self.shape[2:], np.nan)
+            pixels += [(chunk_id, x, y) for x in range(xs.start, xs.stop) for y in range(ys.start, ys.stop)]
+
+        def fetch(pixel):
+            return self.__fetch(self.y[pixel[2]], self.x[pixel[1]])
+
+        for (chunk_id, x, y), (timeline, values) in zip(pixels, ordered_map(fetch, pixels, workers=self.workers)):
+            xs, ys = self.chunk_slices(chunk_id)
+            chunk = loaded[chunk_id]
+            for t, date in enumerate(timeline):
+                position = self.__dates.get(self._as_date(date))
+                if position is None:
+                    continue
+                for a, attribute in enumerate(self.attributes):
+                    value = values[attribute][t]
+                    chunk[x - xs.start, y - ys.start, position, a] = np.nan if value is None else value
+
+        if self.__store is not None:
+            for chunk_id in missing:
+                self.__store.set("coverage_chunk", self.__chunk_key(chunk_id), loaded[chunk_id])
+        return loaded
+
+    def iter_chunks(self, x0=0, x1=None, y0=0, y1=None):
+        """Iterate over the chunks of the array (or of a range of x and y positions).
+
+        Chunks are fetched a few at a time, so their pixels are requested concurrently.
+
+        Yields:
+            tuple: the (x, y) slices of the array covered by the chunk and the chunk array
+        """
+        chunk_ids = self.__chunk_ids(x0, x1, y0, y1)
+        # enough chunks at a time to keep the workers busy
+        batch = max(1, -(-self.workers // (self.chunks[0] * self.chunks[1])))
+        for start in range(0, len(chunk_ids), batch):
+            loaded = self._load(chunk_ids[start:start + batch])
+            for chunk_id in chunk_ids[start:start + batch]:
+                yield self.chunk_slices(chunk_id), loaded[chunk_id]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > 4:
+            raise IndexError('too many indices for a 4 dimensional array')
+        key = key + (slice(None),) * (4 - len(key))
+
+        # the x and y ranges to be loaded, and the indices relative to them
+        ranges = []
+        local = []
+        for axis in (0, 1):
+            index = key[axis]
+            size = self.shape[axis]
+            if isinstance(index, slice):
+                start, stop, step = index.indices(size)
+                if step > 0:
+                    low, high = start, max(start, stop)
+                    local.append(slice(0, high - low, step))
+                else:
+                    low, high = stop + 1, max(start, stop) + 1
+                    local.append(slice(start - low, None if stop < low else stop - low, step))
+                ranges.append((low, high))
+            elif isinstance(index, (int, np.integer)):
+                position = int(index) + size if index < 0 else int(index)
+                if not 0 <= position < size:
+                    raise IndexError('index {} is out of bounds for axis {} with size {}'.format(index, axis, size))
+                ranges.append((position, position + 1))
+                local.append(0)
+            else:
+                raise IndexError('only integers and slices are valid indices of the x and y axes')
+
+        (x0, x1), (y0, y1) = ranges
+        region = np.full((x1 - x0, y1 - y0) + self.shape[2:], np.nan)
+        for (xs, ys), chunk in self.iter_chunks(x0, x1, y0, y1):
+            cx0, cx1 = max(xs.start, x0), min(xs.stop, x1)
+            cy0, cy1 = max(ys.start, y0), min(ys.stop, y1)
+            region[cx0 - x0:cx1 - x0, cy0 - y0:cy1 - y0] = chunk[cx0 - xs.start:cx1 - xs.start,
+                                                                 cy0 - ys.start:cy1 - ys.start]
+        return region[tuple(local) + key[2:]]
+
+    def compute(self):
+        """Loads the whole array"""
+        return self[:]
+
+    @staticmethod
+    def _axes(axis):
+        return tuple(range(4)) if axis is None else tuple(sorted(set(int(a) % 4 for a in np.atleast_1d(axis))))
+
+    def __reduce_chunks(self, axis, reduce, combine, initial, extra=()):
+        """Reduces the chunks one at a time and combines the partial results of the chunks"""
+        axes = self._axes(axis)
+        out = np.full([1 if a in axes else n for a, n in enumerate(self.shape)] + list(extra), initial, dtype=float)
+        for (xs, ys), chunk in self.iter_chunks():
+            partial = reduce(chunk, axis=axes, keepdims=True)
+            target = (slice(None) if 0 in axes else xs, slice(None) if 1 in axes else ys)
+            out[target] = combine(out[target], partial)
+        return np.squeeze(out, axis=axes)
+
+    @staticmethod
+    def _count(chunk, axis=None, keepdims=False):
+        return np.sum(~np.isnan(chunk), axis=axis, keepdims=keepdims)
+
+    @staticmethod
+    def _scalar(out):
+        return out[()] if out.ndim == 0 else out
+
+    def sum(self, axis=None):
+        """Sum of the values over the given axes (all by default), ignoring missing values"""
+        return self._scalar(self.__reduce_chunks(axis, np.nansum, np.add, 0))
+
+    def count(self, axis=None):
+        """Number of values that are not missing over the given axes (all by default)"""
+        return self._scalar(self.__reduce_chunks(axis, self._count, np.add, 0).astype(np.int64))
+
+    def mean(self, axis=None):
+        """Mean of the values over the given axes (all by default), ignoring missing values"""
+        def sum_count(chunk, axis=None, keepdims=False):
+            return np.stack([np.nansum(chunk, axis=axis, keepdims=keepdims),
+                             self._count(chunk, axis=axis, keepdims=keepdims)], axis=-1)
+
+        # sums and counts are reduced together, on an extra last axis
+        total = self.__reduce_chunks(axis, sum_count, np.add, 0, extra=(2,))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._scalar(total[..., 0] / total[..., 1])
+
+    def min(self, axis=None):
+        """Minimum of the values over the given axes (all by default), ignoring missing values"""
+        return self._scalar(self.__reduce_chunks(axis, np.fmin.reduce, np.fmin, np.nan))
+
+    def max(self, axis=None):
+        """Maximum of the values over the given axes (all by default), ignoring missing values"""
+        return self._scalar(self.__reduce_chunks(axis, np.fmax.reduce, np.fmax, np.nan))
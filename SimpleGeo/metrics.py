@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright (C) 2017 National Institute For Space Research (INPE) - Brazil.
+#
+#  This file is part of simple_geo.py toolkit.
+#
+#  simple_geo.py toolkit is free software: you can
+#  redistribute it and/or modify it under the terms of the
+#  GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License,
+#  or (at your option) any later version.
+#
+#  simple_geo.py toolkit is distributed in the hope that
+#  it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with simple_geo.py toolkit. See LICENSE. If not, write to
+#  e-sensing team at <esensing-team@dpi.inpe.br>.
+#
+
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """Collects the events of a client: requests, processing stages and cache lookups.
+
+    Every event has a name and a dict of fields; seconds, bytes and features are added up per event name, and
+    each event is passed to the registered hooks, e.g. to export it to a monitoring system. The events are:
+
+        wfs.request: an HTTP request to the WFS server (method, uri, status, seconds, bytes)
+        wfs.parse: the JSON parsing of a response (seconds, bytes)
+        wfs.decode: the decoding of the features of a response (seconds, features)
+        geometry.build: the creation of a chunk of shapely geometries (seconds, features)
+        frame.build: the assembly of the resulting DataFrame (seconds, features)
+        feature.get: a whole SimpleGeo.get of a feature (name, seconds, features)
+        wtss.request: a time series request to the WTSS server (coverage, latitude, longitude, seconds, dates)
+        cache.hit, cache.miss, cache.set: cache lookups and writes (resource_type, tier, and bytes, the size of
+            the entry in the disk store, for hits and writes)
+        cache.clear: the removal of all entries, or of the entries of a resource_type
+        cache.revalidate: the conditional request of a stale entry (resource_type, modified)
+    """
+
+    def __init__(self):
+        self.__hooks = []
+        self.__events = {}
+        self.__lock = threading.Lock()
+
+    def add_hook(self, hook):
+        """Registers a function called as hook(event, fields) on every event"""
+        if not callable(hook):
+            raise AttributeError('hook must be callable')
+        with self.__lock:
+            self.__hooks.append(hook)
+
+    def remove_hook(self, hook):
+        with self.__lock:
+            if hook in self.__hooks:
+                self.__hooks.remove(hook)
+
+    def emit(self, event, **fields):
+        """Records an event and passes it to the hooks"""
+        with self.__lock:
+            totals = self.__events.get(event)
+            if totals is None:
+                totals = self.__events[event] = {'count': 0}
+            totals['count'] += 1
+            for field in ('seconds', 'bytes', 'features'):
+                value = fields.get(field)
+                if value is None:
+                    continue
+                totals[field] = totals.get(field, 0) + value
+                if field == 'seconds':
+                    totals['min_seconds'] = min(totals.get('min_seconds', value), value)
+                    totals['max_seconds'] = max(totals.get('max_seconds', value), value)
+            hooks = list(self.__hooks)
+        for hook in hooks:
+            hook(event, fields)
+
+    @contextmanager
+    def timer(self, event, **fields):
+        """Emits an event with the seconds spent in the with block. The yielded dict holds the fields of the event,
+        so the block can add some (e.g. bytes)."""
+        start = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            fields['seconds'] = time.perf_counter() - start
+            self.emit(event, **fields)
+
+    def snapshot(self):
+        """Returns the totals of every event name: count, seconds (with min, max and mean), bytes and features"""
+        with self.__lock:
+            snapshot = {event: dict(totals) for event, totals in self.__events.items()}
+        for totals in snapshot.values():
+            if 'seconds' in totals:
+                totals['mean_seconds'] = totals['seconds'] / totals['count']
+        return snapshot
+
+    def reset(self):
+        with self.__lock:
+            self.__events.clear()
+
+
+def print_hook(event, fields):
+    """A hook that prints every event, used by the debug mode"""
+    print(event, ' '.join('{}={}'.format(key, value) for key, value in fields.items()))
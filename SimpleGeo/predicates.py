@@ -19,32 +19,317 @@
 #  along with simple_geo.py toolkit. See LICENSE. If not, write to
 #  e-sensing team at <esensing-team@dpi.inpe.br>.
 #
-import shapely
+import re
+
+from SimpleGeo._lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+shapely = lazy_import('shapely')
+
+
+class Expression(str):
+    """Node of a filter expression tree.
+
+    An expression is the CQL string sent to the server (so it can be used wherever a filter string is
+    expected), and it can also be inspected, normalized and evaluated over a DataFrame.
+    """
+
+    def __new__(cls, cql, *args):
+        self = str.__new__(cls, cql)
+        self._args = args
+        return self
+
+    def __reduce__(self):
+        return self.__class__, self._args
+
+    def attributes(self):
+        """Returns the set of attributes needed to evaluate the expression locally ('geometry' for spatial
+        predicates), or None if it can not be evaluated locally."""
+        return set()
+
+    def evaluate(self, frame, index=None):
+        """Evaluates the expression over a DataFrame (or GeoDataFrame, for spatial predicates).
+
+        Args:
+            frame (DataFrame): the features
+            index (SpatialIndex, optional): a spatial index over the geometries of frame
+
+        Returns:
+            Series: a boolean mask aligned with frame
+        """
+        raise NotImplementedError("Not implemented")
+
+    def normalize(self):
+        """Returns an equivalent expression in canonical form: nested AND/OR are flattened and their operands
+        are deduplicated and sorted, so equivalent filters render the same CQL."""
+        return self
+
+    def conjuncts(self):
+        """Returns the AND-ed terms of the normalized expression."""
+        return [self.normalize()]
+
+
+class Raw(Expression):
+    """A CQL filter that is not understood by the expression tree; it can only be evaluated by the server"""
+
+    def __new__(cls, cql):
+        return Expression.__new__(cls, cql, cql)
+
+    def attributes(self):
+        return None
+
+    def evaluate(self, frame, index=None):
+        raise ValueError("filter can not be evaluated locally: {}".format(str(self)))
+
+
+class Comparison(Expression):
+    """Compares an attribute with a value (operators =, <>, <, >, <=, >=)"""
+
+    def __new__(cls, operator, attribute, value):
+        self = Expression.__new__(cls, "{}{}'{}'".format(attribute, operator, value), operator, attribute, value)
+        self.operator = operator
+        self.attribute = attribute
+        self.value = value
+        return self
+
+    def attributes(self):
+        return {self.attribute}
+
+    def evaluate(self, frame, index=None):
+        column, value = _comparable(frame[self.attribute], self.value)
+        if value is None:
+            return pd.Series(False, index=frame.index)
+        if self.operator == '=':
+            mask = column == value
+        elif self.operator == '<>':
+            mask = column != value
+        elif self.operator == '<':
+            mask = column < value
+        elif self.operator == '>':
+            mask = column > value
+        elif self.operator == '<=':
+            mask = column <= value
+        else:
+            mask = column >= value
+        # as the server, null attributes match no comparison
+        return mask & column.notna()
+
+
+class Between(Expression):
+    """Checks if an attribute is in a closed interval"""
+
+    def __new__(cls, attribute, low, high):
+        self = Expression.__new__(cls, "{} BETWEEN '{}' AND '{}'".format(attribute, low, high), attribute, low, high)
+        self.attribute = attribute
+        self.low = low
+        self.high = high
+        return self
+
+    def attributes(self):
+        return {self.attribute}
+
+    def evaluate(self, frame, index=None):
+        column, low = _comparable(frame[self.attribute], self.low)
+        column, high = _comparable(frame[self.attribute], self.high)
+        if low is None or high is None:
+            return pd.Series(False, index=frame.index)
+        return (column >= low) & (column <= high) & column.notna()
+
+
+class Spatial(Expression):
+    """Relates the geometry of the features with a given geometry (WITHIN, INTERSECTS)"""
+
+    def __new__(cls, operator, geometry):
+        wkt = convert_shapely_to_wkt(geometry)
+        self = Expression.__new__(cls, "{}(#geom#, {})".format(operator, wkt), operator, wkt)
+        self.operator = operator
+        self.wkt = wkt
+        return self
+
+    @property
+    def geometry(self):
+        return shapely.wkt.loads(self.wkt)
+
+    def attributes(self):
+        return {'geometry'}
+
+    def evaluate(self, frame, index=None):
+        predicate = self.operator.lower()
+        if index is not None:
+            mask = np.zeros(len(frame), dtype=bool)
+            mask[index.query(self.geometry, predicate='contains' if predicate == 'within' else predicate)] = True
+            return pd.Series(mask, index=frame.index)
+        return getattr(frame.geometry, predicate)(self.geometry)
+
+
+class BBox(Expression):
+    """Checks if the geometry of the features intersects a bounding box"""
+
+    def __new__(cls, minx, miny, maxx, maxy):
+        bounds = tuple(float(v) for v in (minx, miny, maxx, maxy))
+        self = Expression.__new__(cls, "BBOX(#geom#, {!r}, {!r}, {!r}, {!r})".format(*bounds), *bounds)
+        self.bounds = bounds
+        return self
+
+    @property
+    def geometry(self):
+        return shapely.box(*self.bounds)
+
+    def attributes(self):
+        return {'geometry'}
+
+    def evaluate(self, frame, index=None):
+        if index is not None:
+            mask = np.zeros(len(frame), dtype=bool)
+            mask[index.bbox(*self.bounds)] = True
+            return pd.Series(mask, index=frame.index)
+        return frame.geometry.intersects(self.geometry)
+
+
+class Logical(Expression):
+    """AND/OR of two or more expressions"""
+
+    def __new__(cls, operator, operands):
+        if len(operands) < 2:
+            raise AttributeError('It is necessary at least 2 operators for {} operator'.format(operator))
+        operands = tuple(Predicates.parse(op) if type(op) is str else op for op in operands)
+        cql = "+{}+".format(operator).join("({})".format(op) for op in operands)
+        self = Expression.__new__(cls, cql, operator, operands)
+        self.operator = operator
+        self.operands = operands
+        return self
+
+    def attributes(self):
+        attributes = set()
+        for op in self.operands:
+            needed = op.attributes()
+            if needed is None:
+                return None
+            attributes |= needed
+        return attributes
+
+    def evaluate(self, frame, index=None):
+        masks = [op.evaluate(frame, index) for op in self.operands]
+        reduce = np.logical_and if self.operator == 'AND' else np.logical_or
+        return pd.Series(reduce.reduce([np.asarray(m, dtype=bool) for m in masks]), index=frame.index)
+
+    def normalize(self):
+        operands = []
+        for op in self.operands:
+            op = op.normalize()
+            if isinstance(op, Logical) and op.operator == self.operator:
+                operands += op.operands
+            else:
+                operands.append(op)
+        operands = sorted(set(operands), key=str)
+        if len(operands) == 1:
+            return operands[0]
+        return Logical(self.operator, operands)
+
+    def conjuncts(self):
+        normalized = self.normalize()
+        if isinstance(normalized, Logical) and normalized.operator == 'AND':
+            return list(normalized.operands)
+        return [normalized]
+
+
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+# quoted values end at the first quote that is not doubled ('' is an escaped quote)
+_COMPARISON = re.compile(r"^(\w+)\s*(<>|<=|>=|=|<|>)\s*'((?:[^']|'')*)'$", re.DOTALL)
+_BETWEEN = re.compile(r"^(\w+)\s+BETWEEN\s+'((?:[^']|'')*)'\s+AND\s+'((?:[^']|'')*)'$", re.DOTALL)
+_BETWEEN_KEYWORD = re.compile(r"\s+BETWEEN\s+", re.IGNORECASE)
+_BBOX = re.compile(r"^BBOX\(#geom#,\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^,]+)\)$")
+_SPATIAL = re.compile(r"^(WITHIN|INTERSECTS)\(#geom#,\s*(.*)\)$", re.DOTALL)
+
+
+def _comparable(column, value):
+    """Converts a filter value (always rendered as a string) to the type of the column it is compared with. The
+    value is None when it can not be converted, e.g. a word compared with a numeric column, which the server
+    evaluates to false."""
+    value = str(value).replace("''", "'")
+    if pd.api.types.is_bool_dtype(column):
+        return column, {'true': True, 'false': False}.get(value.lower())
+    if pd.api.types.is_numeric_dtype(column):
+        try:
+            return column, float(value)
+        except ValueError:
+            return column, None
+    if _DATE.match(value) and column.astype(str).str.match(_DATE).all():
+        try:
+            return pd.to_datetime(column, utc=True), pd.to_datetime(value, utc=True)
+        except ValueError:
+            # not a valid date, e.g. month 13: compared as text
+            pass
+    return column, value
+
+
+def _split(cql, operator):
+    """Splits a CQL string on an AND/OR operator (surrounded by whitespace, or by '+' as rendered by Logical)
+    found outside parentheses and quotes. The AND of a BETWEEN is not an operator."""
+    separator = re.compile(r"\s+{0}\s+|\+{0}\+".format(operator), re.IGNORECASE)
+    parts = []
+    depth = 0
+    quoted = False
+    between = False
+    start = 0
+    i = 0
+    while i < len(cql):
+        c = cql[i]
+        if c == "'":
+            quoted = not quoted
+        elif not quoted and c == '(':
+            depth += 1
+        elif not quoted and c == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and c.isspace() and _BETWEEN_KEYWORD.match(cql, i):
+            between = True
+        elif not quoted and depth == 0 and c in ' \t\r\n+':
+            match = separator.match(cql, i)
+            if match and between and operator == 'AND':
+                between = False
+                i = match.end()
+                continue
+            if match:
+                parts.append(cql[start:i])
+                start = i = match.end()
+                continue
+        i += 1
+    parts.append(cql[start:])
+    return parts
+
+
+def _strip_parentheses(cql):
+    cql = cql.strip()
+    while cql.startswith('(') and cql.endswith(')') and _closing(cql, 0) == len(cql) - 1:
+        cql = cql[1:-1].strip()
+    return cql
+
+
+def _closing(text, position):
+    depth = 0
+    quoted = False
+    for i in range(position, len(text)):
+        if text[i] == "'":
+            quoted = not quoted
+        elif not quoted and text[i] == '(':
+            depth += 1
+        elif not quoted and text[i] == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
 
 
 class Predicates:
 
     @staticmethod
     def AND(*arg):
-        if len(arg) < 2:
-            raise AttributeError('It is necessary at least 2 operators for AND operator')
-        str_and = ""
-        for a in arg:
-            if str_and != "":
-                str_and += "+AND+"
-            str_and += "({})".format(a)
-        return str_and
+        return Logical('AND', arg)
 
     @staticmethod
     def OR(*arg):
-        if len(arg) < 2:
-            raise AttributeError('It is necessary at least 2 operators for OR operator')
-        str_or = ""
-        for a in arg:
-            if str_or != "":
-                str_or += "+OR+"
-            str_or += "({})".format(a)
-        return str_or
+        return Logical('OR', arg)
 
     @staticmethod
     def ASC(op1):
@@ -56,39 +341,70 @@ class Predicates:
 
     @staticmethod
     def EQ(op1, op2):
-        return "{}='{}'".format(op1, op2)
+        return Comparison('=', op1, op2)
 
     @staticmethod
     def NE(op1, op2):
-        return "{}<>'{}'".format(op1, op2)
+        return Comparison('<>', op1, op2)
 
     @staticmethod
     def LT(op1, op2):
-        return "{}<'{}'".format(op1, op2)
+        return Comparison('<', op1, op2)
 
     @staticmethod
     def GT(op1, op2):
-        return "{}>'{}'".format(op1, op2)
+        return Comparison('>', op1, op2)
 
     @staticmethod
     def LE(op1, op2):
-        return "{}<='{}'".format(op1, op2)
+        return Comparison('<=', op1, op2)
 
     @staticmethod
     def GE(op1, op2):
-        return "{}>='{}'".format(op1, op2)
+        return Comparison('>=', op1, op2)
 
     @staticmethod
     def BT(op1, op2, op3):
-        return "{}>='{}'".format(op1, op2)
+        return Between(op1, op2, op3)
 
     @staticmethod
     def WITHIN(wkt):
-        return "WITHIN(#geom#, {})".format(convert_shapely_to_wkt(wkt))
+        return Spatial('WITHIN', wkt)
 
     @staticmethod
     def INTERSECTS(wkt):
-        return "INTERSECTS(#geom#, {})".format(convert_shapely_to_wkt(wkt))
+        return Spatial('INTERSECTS', wkt)
+
+    @staticmethod
+    def BBOX(minx, miny, maxx, maxy):
+        return BBox(minx, miny, maxx, maxy)
+
+    @staticmethod
+    def parse(cql):
+        """Builds the expression tree of a CQL filter, rendered by Predicates or written by hand (AND/OR separated
+        by spaces). Parts that are not understood are kept as Raw expressions. Returns None for an empty filter."""
+        if isinstance(cql, Expression):
+            return cql
+        cql = _strip_parentheses(cql or "")
+        if not cql:
+            return None
+        for operator in ('OR', 'AND'):
+            parts = _split(cql, operator)
+            if len(parts) > 1:
+                return Logical(operator, [Predicates.parse(part) or Raw(part) for part in parts])
+        match = _COMPARISON.match(cql)
+        if match:
+            return Comparison(match.group(2), match.group(1), match.group(3))
+        match = _BETWEEN.match(cql)
+        if match:
+            return Between(*match.groups())
+        match = _BBOX.match(cql)
+        if match:
+            return BBox(*match.groups())
+        match = _SPATIAL.match(cql)
+        if match:
+            return Spatial(match.group(1), match.group(2).strip())
+        return Raw(cql)
 
 
 def convert_shapely_to_wkt(obj):
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright (C) 2017 National Institute For Space Research (INPE) - Brazil.
+#
+#  This file is part of simple_geo.py toolkit.
+#
+#  simple_geo.py toolkit is free software: you can
+#  redistribute it and/or modify it under the terms of the
+#  GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License,
+#  or (at your option) any later version.
+#
+#  simple_geo.py toolkit is distributed in the hope that
+#  it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with simple_geo.py toolkit. See LICENSE. If not, write to
+#  e-sensing team at <esensing-team@dpi.inpe.br>.
+#
+
+import functools
+import threading
+
+from SimpleGeo._lazy import lazy_import
+from SimpleGeo.predicates import Predicates
+
+pd = lazy_import('pandas')
+
+
+def conjuncts(cql):
+    """Returns the normalized top level AND-ed terms of a CQL filter"""
+    return list(_conjuncts(cql))
+
+
+@functools.lru_cache(maxsize=1024)
+def _conjuncts(cql):
+    # the filters of the index are parsed on every lookup
+    expression = Predicates.parse(cql)
+    return () if expression is None else tuple(expression.conjuncts())
+
+
+class SemanticCache:
+    """Answers feature queries from cached results of broader queries.
+
+    Every cached feature collection query is recorded in an index per server and feature. A new query is
+    contained in a cached one when it has the same sort_by, asks for a subset of its attributes, and its filter
+    is the cached filter AND-ed with terms that can be evaluated locally. A cached result limited by
+    max_features only answers queries with the same filter and a smaller or equal max_features. The answer is
+    built locally by filtering, projecting and truncating the cached result. The index keeps the max_queries most
+    recent queries, and queries whose result is no longer in the cache are removed from it.
+    """
+
+    def __init__(self, store, key, frame_builder, max_queries=128):
+        """Create a semantic cache.
+        Args:
+            store (Cache): the cache of feature collections
+            key (callable): builds the cache key of a request, as SimpleGeo._get_cache_hash
+            frame_builder (callable): builds the DataFrame of a feature collection
+            max_queries (int, optional): the maximum number of queries recorded per server and feature
+        """
+        if type(max_queries) is not int or max_queries < 1:
+            raise AttributeError('max_queries must be an integer greater than 0')
+        self.__store = store
+        self.__key = key
+        self.__frame_builder = frame_builder
+        self.__max_queries = max_queries
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def canonical(args):
+        """Returns the canonical form of feature collection arguments"""
+        return {'attributes': list(args.get('attributes') or []),
+                'filter': args.get('filter') or "",
+                'max_features': args.get('max_features') or None,
+                'sort_by': list(args.get('sort_by') or [])}
+
+    def __index_key(self, server, name):
+        return self.__key(server, "query_index", name, {})
+
+    def register(self, server, name, args, fc):
+        """Records a cached feature collection query"""
+        canonical = self.canonical(args)
+        complete = canonical['max_features'] is None or fc['total'] < canonical['max_features'] or \
+            fc['total'] == fc['total_features']
+        with self.__lock:
+            index = self.__store.get("query_index", self.__index_key(server, name)) or []
+            index = [entry for entry in index if entry[0] != canonical]
+            index.append((canonical, complete, args))
+            self.__store.set("query_index", self.__index_key(server, name), index[-self.__max_queries:])
+
+    def __forget(self, server, name, canonicals):
+        """Removes queries from the index"""
+        with self.__lock:
+            index = self.__store.get("query_index", self.__index_key(server, name)) or []
+            kept = [entry for entry in index if entry[0] not in canonicals]
+            if len(kept) < len(index):
+                self.__store.set("query_index", self.__index_key(server, name), kept)
+
+    def lookup(self, server, name, args, fresh=None):
+        """Returns the DataFrame of a query answered from a cached broader query, or None. When fresh is given,
+        only the cached queries whose request arguments pass fresh(args) are used."""
+        args = self.canonical(args)
+        with self.__lock:
+            index = self.__store.get("query_index", self.__index_key(server, name)) or []
+        missing = []
+        try:
+            for cached_args, complete, request_args in reversed(index):
+                plan = self._plan(cached_args, complete, args)
+                if plan is None or (fresh is not None and not fresh(request_args)):
+                    continue
+                # only the requested attributes and those of the local terms are read, also from a cached query
+                # of every attribute
+                fc = self.__store.get("feature_collection",
+                                      self.__key(server, "feature_collection", name, request_args),
+                                      columns=plan['columns'])
+                if fc is None:
+                    # expired or evicted
+                    missing.append(cached_args)
+                    continue
+                return self.narrow(self.__frame_builder(fc), plan, args)
+            return None
+        finally:
+            if missing:
+                self.__forget(server, name, missing)
+
+    @staticmethod
+    def _plan(cached, complete, args):
+        """Checks if a query is contained in a cached one, returning the terms to be evaluated locally and the
+        columns needed from the cached result, or None"""
+        if cached['sort_by'] != args['sort_by']:
+            return None
+
+        if args['attributes']:
+            if cached['attributes'] and not set(args['attributes']) <= set(cached['attributes']):
+                return None
+        elif cached['attributes']:
+            return None
+
+        cached_terms = conjuncts(cached['filter'])
+        terms = conjuncts(args['filter'])
+        extra = list(terms)
+        for term in cached_terms:
+            if term not in extra:
+                return None
+            extra.remove(term)
+
+        columns = set(args['attributes'])
+        for term in extra:
+            needed = term.attributes()
+            if needed is None:
+                return None
+            needed.discard('geometry')
+            if cached['attributes'] and not needed <= set(cached['attributes']):
+                return None
+            columns.update(needed)
+
+        if not complete:
+            if extra or args['max_features'] is None or args['max_features'] > cached['max_features']:
+                return None
+
+        return {'terms': extra, 'columns': sorted(columns) if args['attributes'] else None}
+
+    @staticmethod
+    def narrow(geo_data, plan, args, index=None):
+        """Builds the answer of a query from the DataFrame of a broader one, following a plan of _plan. Spatial
+        terms are evaluated with index, a SpatialIndex of geo_data, when it is given."""
+        if len(geo_data) == 0:
+            return geo_data
+        total_features = geo_data.total_features
+        if plan['terms']:
+            mask = pd.Series(True, index=geo_data.index)
+            for term in plan['terms']:
+                mask &= term.evaluate(geo_data, index).values
+            geo_data = geo_data[mask.values]
+            total_features = len(geo_data)
+        if args['attributes']:
+            columns = ['geometry'] if 'geometry' in geo_data else []
+            geo_data = geo_data[columns + list(args['attributes'])]
+        if args['max_features'] is not None:
+            geo_data = geo_data.head(args['max_features'])
+        geo_data = geo_data.reset_index(drop=True)
+        geo_data.total_features = total_features
+        return geo_data
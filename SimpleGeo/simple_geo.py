@@ -22,24 +22,27 @@
 
 from SimpleGeo import Feature
 from SimpleGeo import Coverage
-#from SimpleGeo import TimeSerie
+from SimpleGeo.time_series import TimeSeries
 from SimpleGeo import WFS
-from wtss import wtss
+from SimpleGeo.geojson import crs_name
+from SimpleGeo.concurrency import RateLimiter, ordered_map
+from SimpleGeo.cache import Cache, ParquetCodec, pyarrow
+from SimpleGeo.predicates import Expression, Predicates
+from SimpleGeo.semantic_cache import SemanticCache
+from SimpleGeo.spatial_index import Layer, SpatialIndex
+from SimpleGeo.lazy_coverage import CoverageArray
+from SimpleGeo.metrics import Metrics, print_hook
+from SimpleGeo.wtss_client import WTSSClient
+from SimpleGeo._lazy import lazy_import, optional_import
 
-import pandas as pd
-from geopandas import GeoDataFrame
-
-import os
+import datetime
 import hashlib
 import json
-import datetime
-
-try:
-    # For Python < 3.0 and later
-    import cPickle
-except ImportError:
-    # For Python  3.0 and later
-    import _pickle as cPickle
+import math
+import numbers
+import threading
+import time
+import uuid
 
 try:
     # For Python 3.0 and later
@@ -48,6 +51,11 @@ except ImportError:
     # Fall back to Python 2's urllib2
     from urllib2 import quote
 
+pd = lazy_import('pandas')
+gpd = lazy_import('geopandas')
+# optional: WTSSClient is used when its wtss.wtss client is not installed
+wtss = optional_import('wtss')
+
 
 class SimpleGeo:
     def __init__(self, **kwargs):
@@ -55,10 +63,36 @@ class SimpleGeo:
         Args:
             wfs (str): WFS server URL
             wtss (str): WTSS server URL
-            debug (boolean, optional): enable debug messages
+            debug (boolean, optional): print every request, processing stage and cache lookup
+            hooks (list, optional): functions called as hook(event, fields) on every event (see Metrics)
+            page_size (int, optional): request features in pages of page_size records
+            workers (int, optional): the number of requests run concurrently
+            max_in_flight (int, optional): the maximum number of requests run but not yet consumed
+            timeout (float, tuple, optional): the connect/read timeout of each WFS request, in seconds
+            retries (int, optional): the number of retries of a failed WFS request
+            stream (bool, optional): decode GetFeature responses while they are read (requires ijson)
+            wfs_version (str, optional): the WFS protocol version, '1.0.0' (the default), '2.0.0' or 'auto' to
+                negotiate it with the server (see WFS)
+            cache (boolean, optional): enable the cache of requests
+            cache_dir (str, optional): the directory of the disk cache
+            cache_memory (int, optional): the size limit, in bytes, of the in-memory cache tier
+            cache_ttl (float, optional): the number of seconds a cached entry is valid
+            cache_revalidate (float, optional): the number of seconds after which a cached feature list, feature
+                description or feature collection is revalidated with a conditional request (If-None-Match,
+                If-Modified-Since) before it is used, 0 to revalidate on every use, None (the default) to trust it
+                until it expires. Only a 304 Not Modified response keeps the entry.
+            cache_quota (int, optional): the size limit, in bytes, of the disk cache (sync copies and cache metadata
+                are never removed to enforce it)
+            cache_format (str, optional): the disk format of feature collections, 'parquet' (columnar, requires
+                pyarrow, the default when it is installed) or 'pickle'
+            snap (bool, optional): snap time series positions to the centre of the coverage pixel, so points in
+                the same pixel share one request and one cache entry
         """
 
-        invalid_parameters = set(kwargs) - {"debug", "wfs", "wtss", "cache", "cache_dir", "auth"}
+        invalid_parameters = set(kwargs) - {"debug", "wfs", "wtss", "cache", "cache_dir", "auth", "page_size",
+                                            "workers", "max_in_flight", "timeout", "retries", "stream",
+                                            "cache_memory", "cache_ttl", "cache_quota", "cache_format", "snap", "hooks",
+                                            "cache_revalidate", "wfs_version"}
         if invalid_parameters:
             raise AttributeError('invalid parameter(s): {}'.format(invalid_parameters))
 
@@ -68,6 +102,15 @@ class SimpleGeo:
                 raise AttributeError('debug must be a boolean')
             self.__debug = kwargs['debug']
 
+        self.__metrics = Metrics()
+        if self.__debug:
+            self.__metrics.add_hook(print_hook)
+        if 'hooks' in kwargs:
+            if type(kwargs['hooks']) is not list:
+                raise AttributeError('hooks must be a list of functions')
+            for hook in kwargs['hooks']:
+                self.__metrics.add_hook(hook)
+
         self.__cache = False
         if 'cache' in kwargs:
             if not type(kwargs['cache']) is bool:
@@ -80,6 +123,61 @@ class SimpleGeo:
                 raise AttributeError('cache_dir must be a str')
             self.__cache_dir = kwargs['cache_dir']
 
+        cache_options = {}
+        if 'cache_memory' in kwargs:
+            if type(kwargs['cache_memory']) is not int or kwargs['cache_memory'] < 0:
+                raise AttributeError('cache_memory must be a non negative integer')
+            cache_options['memory_size'] = kwargs['cache_memory']
+        if 'cache_ttl' in kwargs:
+            if kwargs['cache_ttl'] is not None and (type(kwargs['cache_ttl']) not in (int, float) or
+                                                    kwargs['cache_ttl'] <= 0):
+                raise AttributeError('cache_ttl must be a positive number or None')
+            cache_options['ttl'] = kwargs['cache_ttl']
+        if 'cache_quota' in kwargs:
+            if kwargs['cache_quota'] is not None and (type(kwargs['cache_quota']) is not int or
+                                                      kwargs['cache_quota'] < 1):
+                raise AttributeError('cache_quota must be a positive integer or None')
+            cache_options['disk_quota'] = kwargs['cache_quota']
+        cache_format = 'pickle' if pyarrow is None else 'parquet'
+        if 'cache_format' in kwargs:
+            if kwargs['cache_format'] not in ('parquet', 'pickle'):
+                raise AttributeError("cache_format must be 'parquet' or 'pickle'")
+            if kwargs['cache_format'] == 'parquet' and pyarrow is None:
+                raise ImportError('the parquet cache format requires the pyarrow package')
+            cache_format = kwargs['cache_format']
+        self.__revalidate_after = None
+        if 'cache_revalidate' in kwargs:
+            if kwargs['cache_revalidate'] is not None and (type(kwargs['cache_revalidate']) not in (int, float) or
+                                                           kwargs['cache_revalidate'] < 0):
+                raise AttributeError('cache_revalidate must be a non negative number or None')
+            self.__revalidate_after = kwargs['cache_revalidate']
+        if cache_format == 'parquet':
+            cache_options['codecs'] = {'feature_collection': ParquetCodec, 'layer': ParquetCodec}
+        # the disk quota does not remove sync copies (layer), revalidation validators or the semantic query index
+        self.__cache_store = Cache(self.__cache_dir, metrics=self.__metrics,
+                                   pinned={'layer', 'validators', 'query_index'}, **cache_options)
+        self.__semantic_cache = SemanticCache(self.__cache_store, SimpleGeo._get_cache_hash, SimpleGeo._feature_frame)
+        self.__layers = {}
+
+        self.__page_size = None
+        if 'page_size' in kwargs:
+            if kwargs['page_size'] is not None and (type(kwargs['page_size']) is not int or kwargs['page_size'] < 1):
+                raise AttributeError('page_size must be an integer greater than 0')
+            self.__page_size = kwargs['page_size']
+
+        self.__workers = 4
+        if 'workers' in kwargs:
+            if type(kwargs['workers']) is not int or kwargs['workers'] < 1:
+                raise AttributeError('workers must be an integer greater than 0')
+            self.__workers = kwargs['workers']
+
+        self.__max_in_flight = None
+        if 'max_in_flight' in kwargs:
+            if kwargs['max_in_flight'] is not None and (type(kwargs['max_in_flight']) is not int or
+                                                        kwargs['max_in_flight'] < 1):
+                raise AttributeError('max_in_flight must be an integer greater than 0')
+            self.__max_in_flight = kwargs['max_in_flight']
+
         self.__auth = None
         if 'auth' in kwargs:
             if kwargs['auth'] is not None:
@@ -93,27 +191,74 @@ class SimpleGeo:
         if 'wfs' in kwargs:
             if type(kwargs['wfs'] is str):
                 self.__wfs_server = kwargs['wfs']
-                self.__wfs = WFS(kwargs['wfs'], debug=self.__debug, auth=self.__auth)
+                wfs_options = {k: kwargs[k] for k in ("timeout", "retries", "stream") if k in kwargs}
+                if 'wfs_version' in kwargs:
+                    wfs_options['version'] = kwargs['wfs_version']
+                self.__wfs = WFS(kwargs['wfs'], auth=self.__auth, pool_size=max(10, self.__workers),
+                                 metrics=self.__metrics, **wfs_options)
             else:
                 raise AttributeError('wfs must be a string')
 
+        self.__snap = False
+        if 'snap' in kwargs:
+            if not type(kwargs['snap']) is bool:
+                raise AttributeError('snap must be a boolean')
+            self.__snap = kwargs['snap']
+        self.__grids = {}
+        self.__grids_lock = threading.Lock()
+        self.__time_series_lock = threading.Lock()
+
         self.__wtss = None
         if 'wtss' in kwargs:
             if type(kwargs['wtss'] is str):
                 self.__wtss_server = kwargs['wtss']
-                self.__wtss = wtss(kwargs['wtss'])
+                self.__wtss = SimpleGeo._wtss_client(kwargs['wtss'])
             else:
                 raise AttributeError('wtss must be a string')
 
+    @staticmethod
+    def _wtss_client(url):
+        """Returns the wtss.wtss client of a WTSS server, or a WTSSClient when the installed wtss package does not
+        provide it"""
+        if wtss is not None and callable(getattr(wtss, 'wtss', None)):
+            return wtss.wtss(url)
+        return WTSSClient(url)
+
     def feature(self, name):
         return Feature(self, name)
 
     def features(self):
-        return self.__wfs.list_features()
+        # the feature list is only cached when it is revalidated, so it is never older than cache_revalidate
+        if not self.__cache or self.__revalidate_after is None:
+            return self.__wfs.list_features()
+        features = self._get_cache(self.__wfs_server, "list_features", "capabilities", {})
+        features, _ = self.__revalidated(self.__wfs_server, "list_features", "capabilities", {}, features,
+                                         self.__wfs.list_features)
+        return features
 
     def describe_feature(self, name):
+        self.__load_schema(name)
         return self.__wfs.describe_feature(name)
 
+    def invalidate_schema(self, name=None):
+        """Removes the description of a given feature, or of all features when name is None, from the memory
+        and disk caches."""
+        self.__wfs.invalidate_schema(name)
+        if name is None:
+            self.__cache_store.clear("describe_feature")
+        else:
+            hash_params = SimpleGeo._get_cache_hash(self.__wfs_server, "describe_feature", name, {})
+            self.__cache_store.delete("describe_feature", hash_params)
+
+    def __load_schema(self, name):
+        """Makes the feature description available on the WFS schema cache, using the disk cache when enabled"""
+        if not self.__cache or self.__wfs.get_schema(name) is not None:
+            return
+        schema = self._get_cache(self.__wfs_server, "describe_feature", name, {})
+        schema, _ = self.__revalidated(self.__wfs_server, "describe_feature", name, {}, schema,
+                                       lambda validators: self.__wfs.describe_feature(name, validators))
+        self.__wfs.set_schema(name, schema)
+
     def coverage(self, name):
         return Coverage(self, name)
 
@@ -124,20 +269,236 @@ class SimpleGeo:
         return self.__wtss.describe_coverage(name)
 
     def time_series(self, coverage):
-        return TimeSerie(self, coverage)
+        return TimeSeries(self, coverage)
 
     def get(self, resource, **kwargs):
-        if resource.__class__.__name__ is "Feature":
+        if resource.__class__.__name__ == "Feature":
             return self.__get_feature(resource, **kwargs)
-        elif resource.__class__.__name__ is "Coverage":
+        elif resource.__class__.__name__ == "Coverage":
             return self.__get_coverage(resource, **kwargs)
-        elif resource.__class__.__name__ is "TimeSerie":
+        elif resource.__class__.__name__ == "TimeSeries":
             return self.__get_time_series(resource, **kwargs)
         else:
             raise NotImplementedError("Not implemented")
 
+    def iter(self, resource, page_size=1000):
+        """Iterate over the result of a query in DataFrame chunks of at most page_size rows.
+
+        Args:
+            resource (Feature): the query to be run
+            page_size (int, optional): the number of features fetched on each request
+
+        Yields:
+            DataFrame: a GeoDataFrame (or DataFrame, for features without geometry) for each page
+        """
+        if resource.__class__.__name__ != "Feature":
+            raise NotImplementedError("Not implemented")
+
+        args, ts_attributes = self._feature_args(resource)
+        self.__load_schema(resource['name'])
+        for fc in self.__wfs.iter_features(resource['name'], page_size=page_size, **args):
+            yield self.__feature_data(fc, ts_attributes)
+
     def __get_feature(self, feature, **kwargs):
+        with self.__metrics.timer('feature.get', name=feature['name']) as event:
+            geo_data = self.__query_feature(feature, **kwargs)
+            event['features'] = len(geo_data)
+        return geo_data
+
+    def __query_feature(self, feature, **kwargs):
+        invalid_parameters = set(kwargs) - {"page_size", "workers", "max_in_flight", "tiles", "tile_bbox",
+                                            "tile_features"}
+        if invalid_parameters:
+            raise AttributeError('invalid parameter(s): {}'.format(invalid_parameters))
+
+        args, ts_attributes = self._feature_args(feature)
+
+        geo_data = self.__materialized(feature['name'], args)
+        if geo_data is not None:
+            return self.__enrich(geo_data, ts_attributes)
+
+        def fetch(validators=None):
+            fc = fetch_collection(validators)
+            if fc is not None:
+                # identifies this response, so an index built from it is reused until the layer is requested again
+                fc['fingerprint'] = uuid.uuid4().hex
+            return fc
+
+        def fetch_collection(validators):
+            self.__load_schema(feature['name'])
+            if kwargs.get('tiles') is None:
+                return self.__wfs.feature_collection(feature['name'],
+                                                     page_size=kwargs.get('page_size', self.__page_size),
+                                                     workers=kwargs.get('workers', self.__workers),
+                                                     max_in_flight=kwargs.get('max_in_flight', self.__max_in_flight),
+                                                     validators=validators, **args)
+            if args['sort_by']:
+                raise AttributeError('sort_by is not supported by tiled queries')
+            # a tiled result is made of many responses, so it has no validators
+            if validators:
+                validators.clear()
+            return self.__wfs.tiled_feature_collection(feature['name'], tiles=kwargs['tiles'],
+                                                       bbox=kwargs.get('tile_bbox'),
+                                                       tile_features=kwargs.get('tile_features', 10000),
+                                                       page_size=kwargs.get('page_size', self.__page_size),
+                                                       workers=kwargs.get('workers', self.__workers),
+                                                       max_in_flight=kwargs.get('max_in_flight', self.__max_in_flight),
+                                                       **{k: v for k, v in args.items() if k != 'sort_by'})
+
+        if not self.__cache:
+            return self.__feature_data(fetch(), ts_attributes)
+
+        fc = self._get_cache(self.__wfs_server, "feature_collection", feature['name'], args)
+        if fc is None:
+            geo_data = self.__semantic_cache.lookup(
+                self.__wfs_server, feature['name'], args,
+                fresh=lambda cached_args: self.__stale_validators(self.__wfs_server, "feature_collection",
+                                                                  feature['name'], cached_args) is None)
+            if geo_data is not None:
+                return self.__enrich(geo_data, ts_attributes)
+        fc, fetched = self.__revalidated(self.__wfs_server, "feature_collection", feature['name'], args, fc, fetch)
+        if fetched:
+            self.__semantic_cache.register(self.__wfs_server, feature['name'], args, fc)
+
+        return self.__feature_data(fc, ts_attributes)
+
+    def count(self, feature):
+        """Returns the number of features of a query, without requesting them (with WFS 2.0.0, a resultType=hits
+        request). It is limited by max_features, and may be 'unknown' when the server does not count them."""
+        args, _ = self._feature_args(feature)
+        kwargs = {}
+        if args['filter']:
+            kwargs['filter'] = args['filter']
+            if '#geom#' in args['filter']:
+                self.__load_schema(feature['name'])
+        total = self.__wfs.feature_collection_len(feature['name'], **kwargs)
+        if args['max_features'] and type(total) is int:
+            total = min(total, args['max_features'])
+        return total
+
+    def materialize(self, feature, **kwargs):
+        """Keeps a feature layer locally with a spatial index.
+
+        The layer is fetched as by get (or read from the cache), and its STRtree index is built once and saved in
+        the cache. Later queries of the same feature whose filter is the layer filter AND-ed with terms that can be
+        evaluated locally (comparisons, WITHIN, INTERSECTS) are answered from the layer.
+
+        Args:
+            feature (Feature): the layer to be materialized, usually with no filter
+            **kwargs: the options of get (page_size, workers, max_in_flight)
 
+        Returns:
+            Layer: the layer, which can also be queried directly
+        """
+        args, ts_attributes = self._feature_args(feature)
+        if ts_attributes:
+            raise AttributeError('features with time series attributes can not be materialized')
+
+        self.__layers.pop((feature['name'], json.dumps(args, sort_keys=True)), None)
+        geo_data = self.__get_feature(feature, **kwargs)
+        if 'geometry' not in geo_data:
+            raise AttributeError('only features with geometry can be materialized')
+
+        # the fingerprint of a collection is assigned when it is requested (see __query_feature), only the layers
+        # answered from the semantic cache have to be hashed
+        fingerprint = vars(geo_data).get('fingerprint') or SpatialIndex.fingerprint_of(geo_data.geometry.values)
+        index = None
+        if self.__cache:
+            index = self._get_cache(self.__wfs_server, "spatial_index", feature['name'], args)
+        # the stored index is stale when the layer was requested again
+        if index is not None and index.fingerprint == fingerprint:
+            index = index.rebuild(geo_data.geometry.values)
+        else:
+            index = SpatialIndex(geo_data.geometry.values, fingerprint=fingerprint)
+            if self.__cache:
+                self._set_cache(self.__wfs_server, "spatial_index", feature['name'], args, index)
+
+        max_features = SemanticCache.canonical(args)['max_features']
+        complete = max_features is None or len(geo_data) < max_features or len(geo_data) == geo_data.total_features
+        layer = Layer(geo_data, index, args, complete)
+        self.__layers[(feature['name'], json.dumps(args, sort_keys=True))] = layer
+        return layer
+
+    def sync(self, feature, watermark, **kwargs):
+        """Keeps a local copy of a feature layer up to date, fetching only its new and changed features.
+
+        The first sync fetches the whole layer and stores it in the cache directory, with the greatest value of
+        the watermark attribute (e.g. a timestamp or an increasing id). The next ones only request the features
+        whose watermark is greater than or equal to the stored one, and merge them into the copy: features with
+        an id already in the copy replace it, the others are appended. Features deleted from the layer are not
+        detected, use clear_cache to fetch it again.
+
+        Args:
+            feature (Feature): the layer to be synchronized
+            watermark (str): the attribute that increases when a feature is created or changed
+            **kwargs: the options of get (page_size, workers, max_in_flight)
+
+        Returns:
+            DataFrame: the local copy of the layer, with the number of fetched features in delta_features
+        """
+        if not self.__cache:
+            raise AttributeError('sync requires the cache (cache=True)')
+        if type(watermark) is not str or not watermark:
+            raise AttributeError('watermark must be the name of an attribute')
+        invalid_parameters = set(kwargs) - {"page_size", "workers", "max_in_flight"}
+        if invalid_parameters:
+            raise AttributeError('invalid parameter(s): {}'.format(invalid_parameters))
+
+        args, ts_attributes = self._feature_args(feature)
+        if args['max_features']:
+            raise AttributeError('max_features can not be used with sync')
+        if args['attributes'] and watermark not in args['attributes']:
+            raise AttributeError('the watermark attribute must be one of the selected attributes')
+
+        layer_args = dict(args, watermark=watermark)
+        layer = self._get_cache(self.__wfs_server, "layer", feature['name'], layer_args)
+        request = dict(args)
+        if layer is not None and layer['watermark'] is not None:
+            request['filter'] = str(Predicates.AND(args['filter'], Predicates.GE(watermark, layer['watermark']))
+                                    if args['filter'] else Predicates.GE(watermark, layer['watermark']))
+
+        self.__load_schema(feature['name'])
+        delta = self.__wfs.feature_collection(feature['name'],
+                                              page_size=kwargs.get('page_size', self.__page_size),
+                                              workers=kwargs.get('workers', self.__workers),
+                                              max_in_flight=kwargs.get('max_in_flight', self.__max_in_flight),
+                                              **request)
+
+        if layer is None:
+            fc = delta
+        else:
+            # changed features replace their previous version
+            changed = set(fid for fid in delta['ids'] if fid is not None)
+            kept = [i for i, fid in enumerate(layer['ids']) if fid is None or fid not in changed]
+            layer['properties'] = {key: list(values) for key, values in layer['properties'].items()}
+            fc = WFS._merge_feature_collections([WFS._take_features(layer, kept), delta])
+        fc['total_features'] = fc['total']
+
+        values = pd.Series(fc['properties'].get(watermark, [])).dropna()
+        fc['watermark'] = values.max() if len(values) > 0 else None
+        if hasattr(fc['watermark'], 'item'):
+            fc['watermark'] = fc['watermark'].item()
+        if layer is None or delta['total'] > 0:
+            self._set_cache(self.__wfs_server, "layer", feature['name'], layer_args, fc)
+
+        geo_data = self.__feature_data(fc, ts_attributes)
+        geo_data.delta_features = delta['total']
+        return geo_data
+
+    def __materialized(self, name, args):
+        """Answers a query from a materialized layer that contains it, or returns None"""
+        canonical = SemanticCache.canonical(args)
+        for (layer_name, _), layer in reversed(list(self.__layers.items())):
+            if layer_name != name:
+                continue
+            plan = SemanticCache._plan(SemanticCache.canonical(layer.args), layer.complete, canonical)
+            if plan is not None:
+                return SemanticCache.narrow(layer.frame, plan, canonical, index=layer.index)
+        return None
+
+    @staticmethod
+    def _feature_args(feature):
+        """Splits the feature attributes in WFS request arguments and time series attributes"""
         attributes = []
         ts_attributes = []
         # checking attributes
@@ -159,51 +520,147 @@ class SimpleGeo:
             else:
                 raise AttributeError('invalid attribute type')
 
+        # expressions built with Predicates are normalized, so equivalent filters share cache entries
+        ftr = feature['filter']
+        if isinstance(ftr, Expression):
+            ftr = str(ftr.normalize())
+
         args = {"max_features": feature['max_features'],
                 "attributes": attributes,
-                "filter": feature['filter'],
+                "filter": ftr,
                 "sort_by": feature['sort_by']}
+        return args, ts_attributes
 
-        fc = None
-        if self.__cache:
-            fc = self._get_cache(self.__wfs_server, "feature_collection", feature['name'], args)
-        if fc is None:
-            fc = self.__wfs.feature_collection(feature['name'], **args)
-            if self.__cache:
-                self._set_cache(self.__wfs_server, "feature_collection", feature['name'], args, fc)
+    def __feature_data(self, fc, ts_attributes):
+        """Builds the resulting DataFrame of a feature collection"""
+        with self.__metrics.timer('frame.build', features=fc['total']):
+            geo_data = self._feature_frame(fc)
+        return self.__enrich(geo_data, ts_attributes)
+
+    def __enrich(self, geo_data, ts_attributes):
+        if len(geo_data) > 0 and len(ts_attributes) > 0:
+            self.__add_time_series(geo_data, ts_attributes)
+        return geo_data
 
-        if len(fc['features']) == 0:
+    @staticmethod
+    def _feature_frame(fc):
+        """Builds the DataFrame of a feature collection"""
+        if fc['total'] == 0:
             geo_data = pd.DataFrame()
             geo_data.total_features = 0
         else:
-            geo_data = pd.DataFrame(fc['features'])
             if 'geometry' in fc:
-                geo_data = GeoDataFrame(geo_data, geometry='geometry', crs=fc['crs'])
+                columns = {'geometry': fc['geometry']}
+                columns.update(fc['properties'])
+                geo_data = gpd.GeoDataFrame(columns, geometry='geometry', crs=crs_name(fc['crs']))
+            else:
+                geo_data = pd.DataFrame(fc['properties'])
             geo_data.total_features = fc['total_features']
+        geo_data.fingerprint = fc.get('fingerprint')
+        return geo_data
 
-            if len(ts_attributes) > 0:
-                for ts_att in ts_attributes:
-                    df = pd.DataFrame()
-                    for index, row in geo_data.iterrows():
-                        if type(ts_att['start_date']) is int:
-                            start_date = (
-                                datetime.datetime.strptime(row[ts_att['datetime']],
-                                                           '%Y-%m-%dT%H:%M:%SZ') + datetime.timedelta(
-                                    days=ts_att['start_date'])).strftime("%Y-%m-%d")
-                            end_date = (
-                                datetime.datetime.strptime(row[ts_att['datetime']],
-                                                           '%Y-%m-%dT%H:%M:%SZ') + datetime.timedelta(
-                                    days=ts_att['end_date'])).strftime("%Y-%m-%d")
-                        ts = ts_att['time_series'].period(start_date, end_date)
-                        ts_data = ts.get(row['geometry'])
-                        df = pd.concat([df, ts_data])
-                        # print(ts_data)
-                    # print(df)
-
-                    for k in df.keys():
-                        geo_data[k] = df.loc[:, k].tolist()
+    def __add_time_series(self, geo_data, ts_attributes):
+        """Adds the time series attributes to the features.
 
-        return geo_data
+        Each distinct (location, period) is requested a single time, concurrently.
+        """
+        for ts_att in ts_attributes:
+            coverage = ts_att['time_series']['coverage']['name']
+            attributes = ts_att['time_series']['coverage']['attributes']
+            keys, distinct = self._distinct_time_series_keys(self._time_series_keys(geo_data, ts_att),
+                                                             self.__coverage_grid(coverage) if self.__snap else None)
+
+            def fetch(key):
+                return self.__fetch_time_series(coverage, attributes, *key)
+
+            series = dict(zip(distinct, ordered_map(fetch, distinct, workers=self.__workers,
+                                                    max_in_flight=self.__max_in_flight)))
+            self._assign_time_series(geo_data, keys, series)
+
+    @staticmethod
+    def _time_series_keys(geo_data, ts_att):
+        """Computes the (latitude, longitude, start_date, end_date) of the time series of every feature.
+
+        Features that are not points are located by a representative point, and integer start/end dates are
+        offsets in days from the ts_att['datetime'] attribute.
+        """
+        positions = geo_data.geometry
+        if not (positions.geom_type == 'Point').all():
+            positions = positions.representative_point()
+
+        if type(ts_att['start_date']) is int:
+            dates = pd.to_datetime(geo_data[ts_att['datetime']], format='%Y-%m-%dT%H:%M:%SZ')
+            start_dates = (dates + pd.to_timedelta(ts_att['start_date'], unit='D')).dt.strftime("%Y-%m-%d")
+            end_dates = (dates + pd.to_timedelta(ts_att['end_date'], unit='D')).dt.strftime("%Y-%m-%d")
+        else:
+            start_dates = [ts_att['start_date']] * len(geo_data)
+            end_dates = [ts_att['end_date']] * len(geo_data)
+
+        return list(zip(positions.y.tolist(), positions.x.tolist(), start_dates, end_dates))
+
+    @staticmethod
+    def _distinct_time_series_keys(keys, grid=None):
+        """Moves the (latitude, longitude, ...) keys of time series to the centre of their pixel of grid, when it is
+        given (see _snap), and returns them with the distinct ones, in order of first appearance"""
+        if grid is not None:
+            keys = [SimpleGeo._snap(grid, *key[:2]) + tuple(key[2:]) for key in keys]
+        return keys, list(dict.fromkeys(keys))
+
+    @staticmethod
+    def _assign_time_series(geo_data, keys, series):
+        """Assigns one column per time series attribute, taking the series of each feature from series (a dict
+        by key). A series with a single value becomes a scalar, longer series become lists."""
+        columns = series[keys[0]].keys()
+        for column in columns:
+            values = [series[key][column].tolist() for key in keys]
+            geo_data[column] = [value[0] if len(value) == 1 else value for value in values]
+
+    def iter_time_series(self, time_series, positions, workers=None, max_in_flight=None, rate=None):
+        """Retrieve the time series of many positions concurrently, yielding them in the order of positions.
+
+        A failed position does not stop the others: its error is yielded in place of its time series.
+
+        Args:
+            time_series (TimeSeries): the coverage, attributes and period of the time series
+            positions (list, tuple): the positions (shapely Points)
+            workers (int, optional): the number of positions requested concurrently, the workers of the client by
+                default
+            max_in_flight (int, optional): the maximum number of positions requested but not yet yielded
+            rate (float, optional): the maximum number of WTSS requests per second, None for no limit
+
+        Yields:
+            tuple: (position, time series, None), or (position, None, error) if the request failed
+        """
+        if time_series['start_date'] is None:
+            raise AttributeError('it is necessary to set period/date of the time serie')
+        if self.__wtss is None:
+            raise AttributeError('wtss server is not defined')
+        coverage = time_series['coverage']['name']
+        attributes = time_series['coverage']['attributes']
+        limiter = RateLimiter(rate) if rate is not None else None
+
+        def fetch(key):
+            try:
+                return self.__fetch_time_series(coverage, attributes, *key, time_series['start_date'],
+                                                time_series['end_date'], limiter=limiter), None
+            except Exception as e:
+                return None, e
+
+        # positions in the same pixel are requested once
+        positions = list(positions)
+        keys, distinct = self._distinct_time_series_keys([(pos.y, pos.x) for pos in positions],
+                                                         self.__coverage_grid(coverage) if self.__snap else None)
+        results = zip(distinct, ordered_map(fetch, distinct, workers=self.__workers if workers is None else workers,
+                                            max_in_flight=self.__max_in_flight if max_in_flight is None
+                                            else max_in_flight))
+        fetched = {}
+        for pos, key in zip(positions, keys):
+            # the first position of a key comes after the first positions of the keys before it
+            while key not in fetched:
+                done, result = next(results)
+                fetched[done] = result
+            data, error = fetched[key]
+            yield pos, data, error
 
     def __get_time_series(self, time_series, **kwargs):
 
@@ -217,63 +674,277 @@ class SimpleGeo:
         else:
             raise AttributeError('it is necessary to set period/date of the time serie')
 
+        return self.__fetch_time_series(coverage, attributes, latitude, longitude, start_date, end_date,
+                                        limiter=kwargs.get('limiter'))
+
+    def __fetch_time_series(self, coverage, attributes, latitude, longitude, start_date, end_date, limiter=None):
+        """Requests a time series to the WTSS server, or to the cache"""
         if self.__wtss is None:
             raise AttributeError('wtss server is not defined')
 
-        cv = None
-        args = {'attributes': attributes, 'latitude': latitude, 'longitude': longitude, 'start_date': start_date,
-                'end_date': end_date}
-        if self.__cache:
-            cv = self._get_cache(self.__wtss_server, "time_series", coverage, args)
-        if cv is None:
+        if self._as_date(start_date) > self._as_date(end_date):
+            raise AttributeError('start_date must not be after end_date')
+
+        if self.__snap:
+            latitude, longitude = self._snap(self.__coverage_grid(coverage), latitude, longitude)
+
+        if not self.__cache:
+            if limiter is not None:
+                limiter.acquire()
+            cv = self.__wtss_time_series(coverage, attributes, latitude, longitude, start_date, end_date)
+            return self._time_series_frame(cv.attributes, cv.timeline)
+
+        # one entry per location keeps the values of every date fetched so far and the date intervals they cover,
+        # with the values of each date in the order of the sorted attributes (the order of its cache key)
+        args = {'attributes': attributes, 'latitude': latitude, 'longitude': longitude}
+        order = sorted(set(attributes))
+        entry = self._get_cache(self.__wtss_server, "time_series", coverage, args)
+        entry = {'intervals': [], 'values': {}} if entry is None else \
+            {'intervals': list(entry['intervals']), 'values': dict(entry['values'])}
+        start = self._as_date(start_date)
+        end = self._as_date(end_date)
+        missing = self._missing_intervals(entry['intervals'], start, end)
+        fetched = {}
+        for missing_start, missing_end in missing:
+            if limiter is not None:
+                limiter.acquire()
+            cv = self.__wtss_time_series(coverage, attributes, latitude, longitude, missing_start.isoformat(),
+                                         missing_end.isoformat())
+            columns = [cv.attributes[attribute] for attribute in order]
+            for i, date in enumerate(cv.timeline):
+                fetched[self._as_date(date)] = tuple(column[i] for column in columns)
+        if missing:
+            # other threads may have stored intervals of the same location meanwhile: merge with the current entry
+            with self.__time_series_lock:
+                current = self._get_cache(self.__wtss_server, "time_series", coverage, args)
+                if current is not None:
+                    entry = {'intervals': list(current['intervals']), 'values': dict(current['values'])}
+                entry['values'].update(fetched)
+                for missing_start, missing_end in missing:
+                    entry['intervals'] = self._add_interval(entry['intervals'], missing_start, missing_end)
+                self._set_cache(self.__wtss_server, "time_series", coverage, args, entry)
+
+        timeline = sorted(date for date in entry['values'] if start <= date <= end)
+        values = {attribute: [entry['values'][date][order.index(attribute)] for date in timeline]
+                  for attribute in attributes}
+        return self._time_series_frame(values, timeline)
+
+    def __wtss_time_series(self, coverage, attributes, latitude, longitude, start_date, end_date):
+        with self.__metrics.timer('wtss.request', coverage=coverage, latitude=latitude, longitude=longitude) as event:
             cv = self.__wtss.time_series(coverage, attributes, latitude, longitude, start_date, end_date)
-            if self.__cache:
-                self._set_cache(self.__wtss_server, "time_series", coverage, args, cv)
+            event['dates'] = len(cv.timeline)
+        return cv
+
+    @staticmethod
+    def _as_date(value):
+        """Converts a 'YYYY-MM-DD' string, datetime or date to a date"""
+        if isinstance(value, str):
+            return datetime.date.fromisoformat(value[:10])
+        if isinstance(value, datetime.datetime):
+            return value.date()
+        return value
+
+    @staticmethod
+    def _missing_intervals(intervals, start, end):
+        """Returns the (start, end) date intervals of [start, end] not covered by a sorted list of disjoint
+        intervals"""
+        if start > end:
+            return []
+        missing = []
+        for covered_start, covered_end in intervals:
+            if covered_end < start:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > start:
+                missing.append((start, covered_start - datetime.timedelta(days=1)))
+            start = max(start, covered_end + datetime.timedelta(days=1))
+            if start > end:
+                return missing
+        missing.append((start, end))
+        return missing
 
-        data = pd.DataFrame(cv.attributes, index=cv.timeline)
-        data.total = len(cv.timeline)
+    @staticmethod
+    def _add_interval(intervals, start, end):
+        """Adds an interval to a sorted list of disjoint intervals, merging the overlapping and adjacent ones"""
+        merged = []
+        for covered_start, covered_end in sorted(intervals + [(start, end)]):
+            if merged and covered_start <= merged[-1][1] + datetime.timedelta(days=1):
+                merged[-1] = (merged[-1][0], max(merged[-1][1], covered_end))
+            else:
+                merged.append((covered_start, covered_end))
+        return merged
+
+    def __coverage_grid(self, coverage):
+        """Returns the (xmin, ymax, x resolution, y resolution) of a coverage, from describe_coverage"""
+        with self.__grids_lock:
+            grid = self.__grids.get(coverage)
+            if grid is None:
+                grid = self.__grids[coverage] = self._grid(self.describe_coverage(coverage))
+            return grid
+
+    @staticmethod
+    def _grid(desc):
+        """Returns the (xmin, ymax, x resolution, y resolution) of a coverage description"""
+        extent = desc['spatial_extent']
+        resolution = desc['spatial_resolution']
+        return float(extent['xmin']), float(extent['ymax']), float(resolution['x']), float(resolution['y'])
+
+    @staticmethod
+    def _snap(grid, latitude, longitude):
+        """Moves a (latitude, longitude) position to the centre of the coverage pixel it falls in"""
+        xmin, ymax, res_x, res_y = grid
+        column = math.floor((longitude - xmin) / res_x)
+        row = math.floor((ymax - latitude) / res_y)
+        return round(ymax - (row + 0.5) * res_y, 10), round(xmin + (column + 0.5) * res_x, 10)
+
+    @staticmethod
+    def _time_series_frame(attributes, timeline):
+        """Builds the DataFrame of a time series"""
+        data = pd.DataFrame(attributes, index=timeline)
+        data.total = len(timeline)
         return data
 
     def __get_coverage(self, coverage, **kwargs):
-        raise NotImplementedError("Not implemented")
+        invalid_parameters = set(kwargs) - {"bbox", "period", "chunks", "workers"}
+        if invalid_parameters:
+            raise AttributeError('invalid parameter(s): {}'.format(invalid_parameters))
+        if self.__wtss is None:
+            raise AttributeError('wtss server is not defined')
 
-    def _get_cache(self, server, resource_type, resource_name, kwargs):
+        bbox = kwargs.get('bbox')
+        if type(bbox) not in (list, tuple) or len(bbox) != 4:
+            raise AttributeError('bbox must be a tuple (minx, miny, maxx, maxy)')
+        period = kwargs.get('period')
+        if type(period) not in (list, tuple) or len(period) != 2 or not all(type(d) is str for d in period):
+            raise AttributeError('period must be a tuple of dates (YYYY-MM-DD)')
+        workers = kwargs.get('workers', self.__workers)
+        if type(workers) is not int or workers < 1:
+            raise AttributeError('workers must be an integer greater than 0')
+
+        name = coverage['name']
+        desc = self.describe_coverage(name)
+        attributes = list(coverage['attributes']) or [attribute['name'] for attribute in desc['attributes']]
+        start, end = self._as_date(period[0]), self._as_date(period[1])
+        timeline = [date for date in desc['timeline'] if start <= self._as_date(date) <= end]
+
+        grid = self.__coverage_grid(name)
+        xmin, ymax, res_x, res_y = grid
+        extent = desc['spatial_extent']
+        columns_count = int(round((float(extent['xmax']) - xmin) / res_x))
+        rows_count = int(round((ymax - float(extent['ymin'])) / res_y))
+        minx, miny, maxx, maxy = bbox
+        columns = range(max(0, math.floor((minx - xmin) / res_x)),
+                        min(columns_count, math.floor((maxx - xmin) / res_x) + 1))
+        rows = range(max(0, math.floor((ymax - maxy) / res_y)), min(rows_count, math.floor((ymax - miny) / res_y) + 1))
+
+        def fetch(latitude, longitude):
+            cv = self.__wtss_time_series(name, attributes, latitude, longitude, period[0], period[1])
+            return cv.timeline, cv.attributes
+
+        def key(chunk_columns, chunk_rows):
+            # the chunks keep the order of the attributes, so they are not sorted as attribute lists
+            return self._get_cache_hash(self.__wtss_server, "coverage_chunk", name,
+                                        {'attribute_order': ','.join(attributes), 'start_date': period[0],
+                                         'end_date': period[1], 'columns': chunk_columns, 'rows': chunk_rows})
+
+        return CoverageArray(fetch, columns, rows, timeline, attributes, grid, chunks=kwargs.get('chunks', (32, 32)),
+                             workers=workers, store=self.__cache_store if self.__cache else None, key=key)
+
+    def _get_cache(self, server, resource_type, resource_name, kwargs, columns=None):
         """ Try to get cached request"""
         hash_params = SimpleGeo._get_cache_hash(server, resource_type, resource_name, kwargs)
-        file_path = "{}/{}/{}.pkl".format(self.__cache_dir, resource_type, hash_params)
-        if os.path.isfile(file_path):
-            if os.path.getsize(file_path) > 0:
-                with open(file_path, 'rb') as handle:
-                    if self.__debug:
-                        print("Cache found !")
-                    content = cPickle.load(handle)
-                    return content
-        if self.__debug:
-            print("Cache not found !")
-        return None
+        return self.__cache_store.get(resource_type, hash_params, columns=columns)
 
     def _set_cache(self, server, resource_type, resource_name, kwargs, content):
         """ Store a response on cache"""
         hash_params = SimpleGeo._get_cache_hash(server, resource_type, resource_name, kwargs)
-        path_cache = "{}/{}".format(self.__cache_dir, resource_type)
-        if not os.path.exists(path_cache):
-            os.makedirs(path_cache)
-        file_path = "{}/{}.pkl".format(path_cache, hash_params)
-        with open(file_path, 'wb') as handle:
-            cPickle.dump(content, handle)
+        self.__cache_store.set(resource_type, hash_params, content)
+
+    def __stale_validators(self, server, resource_type, resource_name, kwargs):
+        """Returns None when a cached entry can be used without revalidation, or the validators to revalidate it
+        with (empty when its response had none, so it has to be requested again)"""
+        if self.__revalidate_after is None:
+            return None
+        validators = self.__cache_store.get("validators",
+                                            SimpleGeo._get_cache_hash(server, resource_type, resource_name, kwargs))
+        if validators is None:
+            return {}
+        if time.time() - validators['checked_at'] <= self.__revalidate_after:
+            return None
+        return {k: v for k, v in validators.items() if k != 'checked_at'}
+
+    def __revalidated(self, server, resource_type, resource_name, kwargs, content, fetch):
+        """Returns a cached entry, revalidating it when it is stale, or a new response stored in the cache.
+
+        Args:
+            content: the cached entry, None if there is none
+            fetch (callable): requests the resource as fetch(validators); the request is conditional when
+                validators has an etag or a last_modified, returning None on 304 Not Modified, and the validators
+                of the response are stored in the dict
+
+        Returns:
+            tuple: the entry and whether it was requested again
+        """
+        validators = {}
+        if content is not None:
+            validators = self.__stale_validators(server, resource_type, resource_name, kwargs)
+            if validators is None:
+                return content, False
+
+        response = fetch(validators)
+        if content is not None:
+            self.__metrics.emit('cache.revalidate', resource_type=resource_type, modified=response is not None)
+        hash_params = SimpleGeo._get_cache_hash(server, resource_type, resource_name, kwargs)
+        if response is None:
+            self.__cache_store.touch(resource_type, hash_params)
+        else:
+            self.__cache_store.set(resource_type, hash_params, response)
+        if self.__revalidate_after is not None:
+            self.__cache_store.set("validators", hash_params, dict(validators, checked_at=time.time()))
+        return (content, False) if response is None else (response, True)
+
+    def cache_stats(self):
+        """Returns the hit/miss/eviction counters and the memory and disk usage of the cache"""
+        return self.__cache_store.stats()
+
+    def stats(self):
+        """Returns the totals of every event (see Metrics.snapshot) and, in 'cache', the cache counters"""
+        stats = self.__metrics.snapshot()
+        stats['cache'] = self.__cache_store.stats()
+        return stats
+
+    def reset_stats(self):
+        self.__metrics.reset()
+
+    def add_hook(self, hook):
+        """Registers a function called as hook(event, fields) on every event (see Metrics)"""
+        self.__metrics.add_hook(hook)
+
+    def remove_hook(self, hook):
+        self.__metrics.remove_hook(hook)
 
     @staticmethod
     def _get_cache_hash(server, resource_type, resource_name, kwargs):
         """Creates an hash from request parameters"""
-        params = "{}.{}.{}.{}".format(server, resource_type, resource_name, json.dumps(kwargs))
+        params = "{}.{}.{}.{}".format(server, resource_type, resource_name,
+                                      json.dumps(SimpleGeo._cache_key_value(kwargs), sort_keys=True))
         return hashlib.sha256(params.encode('utf-8')).hexdigest()
 
+    @staticmethod
+    def _cache_key_value(value, name=None):
+        """Normalizes request parameters for their cache key: equal numbers (10, 10.0, NumPy scalars) are the same
+        and lists of attributes are sorted, so requests that only differ in them share cache entries"""
+        if isinstance(value, dict):
+            return {key: SimpleGeo._cache_key_value(item, key) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            items = [SimpleGeo._cache_key_value(item) for item in value]
+            if name == 'attributes' and all(type(item) is str for item in items):
+                return sorted(set(items))
+            return items
+        if isinstance(value, numbers.Number) and type(value) is not bool:
+            return float(value)
+        return value
+
     def clear_cache(self):
-        if self.__debug:
-            print("Cleaning cache!")
-        if os.path.exists(self.__cache_dir):
-            for root, dirs, files in os.walk(self.__cache_dir, topdown=False):
-                for name in files:
-                    os.remove(os.path.join(root, name))
-                for name in dirs:
-                    os.rmdir(os.path.join(root, name))
+        self.__cache_store.clear()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright (C) 2017 National Institute For Space Research (INPE) - Brazil.
+#
+#  This file is part of simple_geo.py toolkit.
+#
+#  simple_geo.py toolkit is free software: you can
+#  redistribute it and/or modify it under the terms of the
+#  GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License,
+#  or (at your option) any later version.
+#
+#  simple_geo.py toolkit is distributed in the hope that
+#  it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with simple_geo.py toolkit. See LICENSE. If not, write to
+#  e-sensing team at <esensing-team@dpi.inpe.br>.
+#
+
+
+import hashlib
+
+from SimpleGeo._lazy import lazy_import
+from SimpleGeo.geojson import geometry_size
+from SimpleGeo.predicates import Predicates
+
+np = lazy_import('numpy')
+shapely = lazy_import('shapely')
+
+
+class SpatialIndex:
+    """STRtree over the geometries of a feature layer.
+
+    Queries return the positions of the matching geometries. The geometries are the geometry column of the layer,
+    so a stored index only keeps its node capacity and fingerprint: it is loaded unbound and rebuilt against the
+    column of the layer with rebuild. The fingerprint identifies the geometries it was built from, so a stored
+    index is only reused for the same layer.
+    """
+
+    def __init__(self, geometries, node_capacity=10, fingerprint=None):
+        """Create a spatial index.
+        Args:
+            geometries (array): the shapely geometries of the layer (None for features without geometry), None
+                for an unbound index, which has to be rebuilt before it is queried
+            node_capacity (int, optional): the maximum number of children of a tree node
+            fingerprint (str, optional): the fingerprint of geometries, computed when not given
+        """
+        self.node_capacity = node_capacity
+        self.geometries = None
+        self.fingerprint = fingerprint
+        self.__tree = None
+        if geometries is not None:
+            self.geometries = np.asarray(geometries, dtype=object)
+            self.fingerprint = fingerprint or SpatialIndex.fingerprint_of(self.geometries)
+            self.__tree = shapely.STRtree(self.geometries, node_capacity=node_capacity)
+
+    def __len__(self):
+        return 0 if self.geometries is None else len(self.geometries)
+
+    def __sizeof__(self):
+        if self.geometries is None:
+            return object.__sizeof__(self)
+        # the tree takes about a pointer and an envelope per geometry
+        return object.__sizeof__(self) + self.geometries.nbytes + geometry_size(self.geometries) + \
+            len(self.geometries) * 40
+
+    def __reduce__(self):
+        return SpatialIndex, (None, self.node_capacity, self.fingerprint)
+
+    def rebuild(self, geometries):
+        """Returns the index built with the same node capacity and fingerprint over geometries, the geometry column
+        of the layer it was built from"""
+        return SpatialIndex(geometries, self.node_capacity, self.fingerprint)
+
+    @staticmethod
+    def fingerprint_of(geometries):
+        """Returns a hash of the WKB of geometries, in order"""
+        digest = hashlib.sha256()
+        for wkb in shapely.to_wkb(np.asarray(geometries, dtype=object)):
+            digest.update(b'\0' if wkb is None else wkb)
+        return digest.hexdigest()
+
+    def query(self, geometry, predicate=None):
+        """Returns the sorted positions of the geometries related to a geometry.
+
+        Args:
+            geometry (Geometry): the query geometry
+            predicate (str, optional): the shapely predicate tested as geometry.<predicate>(indexed geometry)
+                ('intersects', 'contains', 'within', ...), None to return the geometries whose envelope
+                intersects the envelope of geometry
+        """
+        return np.sort(self.__query(geometry, predicate))
+
+    def query_bulk(self, geometries, predicate=None):
+        """Queries many geometries at once.
+
+        Returns:
+            array: a (2, n) array with the position of each query geometry and of each related indexed geometry
+        """
+        return self.__query(np.asarray(geometries, dtype=object), predicate)
+
+    def __query(self, geometry, predicate):
+        if self.__tree is None:
+            raise AttributeError('the spatial index is not bound to its geometries, use rebuild')
+        return self.__tree.query(geometry, predicate=predicate)
+
+    def bbox(self, minx, miny, maxx, maxy):
+        """Returns the sorted positions of the geometries that intersect a bounding box"""
+        return self.query(shapely.box(minx, miny, maxx, maxy), predicate='intersects')
+
+    def locate(self, geometries, predicate='within'):
+        """Returns, for each geometry, the position of the first indexed geometry it is related to, or -1.
+
+        With the default predicate this is a point-in-polygon lookup of many points at once.
+        """
+        result = np.full(len(geometries), -1, dtype=np.int64)
+        source, target = self.query_bulk(geometries, predicate=predicate)
+        # the first match of each query geometry
+        order = np.lexsort((target, source))
+        source, target = source[order], target[order]
+        first = np.ones(len(source), dtype=bool)
+        first[1:] = source[1:] != source[:-1]
+        result[source[first]] = target[first]
+        return result
+
+
+class Layer:
+    """A feature layer kept locally with its spatial index.
+
+    Created by SimpleGeo.materialize. Queries of the layer that it contains are answered from it by SimpleGeo.get,
+    and it can be queried directly with filter expressions, bounding boxes and point lookups.
+    """
+
+    def __init__(self, frame, index, args, complete=True):
+        """Create a layer.
+        Args:
+            frame (GeoDataFrame): the features of the layer
+            index (SpatialIndex): the spatial index of frame's geometries
+            args (dict): the query arguments the layer was fetched with (see SimpleGeo._feature_args)
+            complete (bool, optional): False if the layer was truncated by max_features
+        """
+        self.frame = frame
+        self.index = index
+        self.args = args
+        self.complete = complete
+
+    def __len__(self):
+        return len(self.frame)
+
+    def query(self, expression):
+        """Returns the features that match a filter expression (or CQL string) built with Predicates"""
+        expression = Predicates.parse(expression)
+        if expression is None:
+            return self.frame
+        return self.frame[expression.evaluate(self.frame, self.index).values]
+
+    def bbox(self, minx, miny, maxx, maxy):
+        """Returns the features that intersect a bounding box"""
+        return self.frame.iloc[self.index.bbox(minx, miny, maxx, maxy)]
+
+    def locate(self, geometries, predicate='within'):
+        """Returns, for each geometry, the position in frame of the first feature it is related to, or -1"""
+        return self.index.locate(geometries, predicate=predicate)
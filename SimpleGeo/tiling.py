@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright (C) 2017 National Institute For Space Research (INPE) - Brazil.
+#
+#  This file is part of simple_geo.py toolkit.
+#
+#  simple_geo.py toolkit is free software: you can
+#  redistribute it and/or modify it under the terms of the
+#  GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License,
+#  or (at your option) any later version.
+#
+#  simple_geo.py toolkit is distributed in the hope that
+#  it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with simple_geo.py toolkit. See LICENSE. If not, write to
+#  e-sensing team at <esensing-team@dpi.inpe.br>.
+#
+
+
+from SimpleGeo._lazy import lazy_import
+from SimpleGeo.predicates import BBox, Predicates, Spatial
+
+shapely = lazy_import('shapely')
+
+
+def area_of_interest(cql):
+    """Returns the bounds (minx, miny, maxx, maxy) of the area a filter is restricted to by its top level
+    WITHIN, INTERSECTS and BBOX terms, or None"""
+    expression = Predicates.parse(cql)
+    if expression is None:
+        return None
+    bounds = None
+    for term in expression.conjuncts():
+        if not isinstance(term, (Spatial, BBox)):
+            continue
+        term_bounds = tuple(shapely.bounds(term.geometry))
+        if bounds is None:
+            bounds = term_bounds
+        else:
+            bounds = (max(bounds[0], term_bounds[0]), max(bounds[1], term_bounds[1]),
+                      min(bounds[2], term_bounds[2]), min(bounds[3], term_bounds[3]))
+    return bounds
+
+
+def grid(bounds, nx, ny):
+    """Splits bounds in a grid of nx by ny tiles, row by row"""
+    minx, miny, maxx, maxy = bounds
+    width = (maxx - minx) / nx
+    height = (maxy - miny) / ny
+    tiles = []
+    for j in range(ny):
+        for i in range(nx):
+            tiles.append((minx + i * width, miny + j * height,
+                          maxx if i == nx - 1 else minx + (i + 1) * width,
+                          maxy if j == ny - 1 else miny + (j + 1) * height))
+    return tiles
+
+
+def tile_filter(cql, tile):
+    """Restricts a filter to the features that intersect a tile"""
+    if not cql:
+        return Predicates.BBOX(*tile)
+    return Predicates.AND(cql, Predicates.BBOX(*tile))
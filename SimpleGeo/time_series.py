@@ -20,6 +20,139 @@
 #  e-sensing team at <esensing-team@dpi.inpe.br>.
 #
 
+import warnings
+
+from SimpleGeo._lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+
+class TimeSeriesArray:
+    """The time series of many positions in one (points, time, attributes) array with a shared timeline.
+
+    Dates missing from the series of a point, and every date of a point whose request failed, are NaN. Indexing
+    and iterating give the DataFrame of each point (None for failed points), as the time series of a single
+    position.
+
+    Attributes:
+        values (ndarray): the (points, time, attributes) values
+        timeline (list): the dates shared by all points
+        attributes (list): the attribute names
+        latitude (ndarray): the latitude of each point
+        longitude (ndarray): the longitude of each point
+        errors (dict): the error of each failed point, by index
+    """
+
+    def __init__(self, values, timeline, attributes, latitude, longitude, errors=None):
+        self.values = values
+        self.timeline = list(timeline)
+        self.attributes = list(attributes)
+        self.latitude = np.asarray(latitude, dtype=float)
+        self.longitude = np.asarray(longitude, dtype=float)
+        self.errors = errors or {}
+
+    @staticmethod
+    def from_series(positions, series, errors=None):
+        """Stacks the time series (DataFrames, None for failed positions) of a list of positions.
+
+        series may be an iterator: each DataFrame is reduced to its values as soon as it is read, and the points
+        with the same timeline share it.
+        """
+        timelines = {}
+        points = []
+        attributes = None
+        for frame in series:
+            if frame is None:
+                points.append(None)
+                continue
+            if attributes is None:
+                attributes = list(frame.columns)
+            timeline = timelines.setdefault(tuple(frame.index), tuple(frame.index))
+            points.append((timeline, frame[attributes].to_numpy(dtype=float)))
+        attributes = attributes or []
+
+        timeline = sorted(set(date for dates in timelines for date in dates))
+        index = pd.Index(timeline)
+        positions_of = {dates: index.get_indexer(list(dates)) for dates in timelines}
+        values = np.full((len(points), len(timeline), len(attributes)), np.nan)
+        for i, point in enumerate(points):
+            if point is not None:
+                values[i, positions_of[point[0]]] = point[1]
+        return TimeSeriesArray(values, timeline, attributes, [p.y for p in positions], [p.x for p in positions],
+                               errors)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('index out of range')
+        if i in self.errors:
+            return None
+        data = pd.DataFrame(self.values[i], index=self.timeline, columns=self.attributes)
+        data.total = len(self.timeline)
+        return data
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return "TimeSeriesArray(points={}, dates={}, attributes={}, errors={})".format(
+            len(self), len(self.timeline), self.attributes, len(self.errors))
+
+    def to_frame(self):
+        """Returns the series in long format: one row per (point, date), with the point index, latitude,
+        longitude, date and one column per attribute"""
+        points, dates = len(self), len(self.timeline)
+        data = {'point': np.repeat(np.arange(points), dates),
+                'latitude': np.repeat(self.latitude, dates),
+                'longitude': np.repeat(self.longitude, dates),
+                'date': np.tile(np.asarray(self.timeline, dtype=object), points)}
+        flat = self.values.reshape(points * dates, len(self.attributes))
+        for a, attribute in enumerate(self.attributes):
+            data[attribute] = flat[:, a]
+        return pd.DataFrame(data)
+
+    def __stat(self, function):
+        with warnings.catch_warnings():
+            # points whose series are all missing give NaN
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return pd.DataFrame(function(self.values, axis=1), columns=self.attributes)
+
+    def mean(self):
+        """Mean of each attribute of each point over time, ignoring missing values"""
+        return self.__stat(np.nanmean)
+
+    def median(self):
+        """Median of each attribute of each point over time, ignoring missing values"""
+        return self.__stat(np.nanmedian)
+
+    def std(self):
+        """Standard deviation of each attribute of each point over time, ignoring missing values"""
+        return self.__stat(np.nanstd)
+
+    def min(self):
+        """Minimum of each attribute of each point over time, ignoring missing values"""
+        return self.__stat(np.nanmin)
+
+    def max(self):
+        """Maximum of each attribute of each point over time, ignoring missing values"""
+        return self.__stat(np.nanmax)
+
+    def count(self):
+        """Number of values of each attribute of each point that are not missing"""
+        return pd.DataFrame(np.sum(~np.isnan(self.values), axis=1), columns=self.attributes)
+
 
 class TimeSeries:
     def __init__(self, simple_geo, coverage, **kwargs):
@@ -54,10 +187,53 @@ class TimeSeries:
     def date(self, start_date):
         return self.period(start_date, start_date)
 
-    def get(self, pos):
+    def get(self, pos, **kwargs):
+        """Retrieve the time series of a position, or of a list of positions.
+
+        Args:
+            pos (Point, list, tuple): the position, or the list of positions
+            **kwargs: Keyword arguments, for a list of positions (see iter):
+                workers (int, optional): the number of positions requested concurrently
+                max_in_flight (int, optional): the maximum number of positions requested but not yet returned
+                rate (float, optional): the maximum number of WTSS requests per second
+
+        Returns:
+            DataFrame, TimeSeriesArray: the time series, or the time series of the positions in their order, with
+                the errors of the positions whose request failed in errors
+        """
         if type(pos) in (list, tuple):
-            tss = []
-            for p in pos:
-                tss.append(self.__simple_geo.get(self, pos=p))
-            return tss
+            errors = {}
+
+            def series():
+                for i, (p, data, error) in enumerate(self.iter(pos, **kwargs)):
+                    if error is not None:
+                        errors[i] = error
+                    yield data
+
+            return TimeSeriesArray.from_series(pos, series(), errors)
         return self.__simple_geo.get(self, pos=pos)
+
+    def iter(self, pos, **kwargs):
+        """Retrieve the time series of a list of positions concurrently, yielding them in the order of the positions.
+
+        Args:
+            pos (list, tuple): the positions
+            **kwargs: Keyword arguments: workers, max_in_flight and rate (see get)
+
+        Yields:
+            tuple: (position, time series, None), or (position, None, error) if the request failed
+        """
+        return self.__simple_geo.iter_time_series(self, pos, **kwargs)
+
+    async def aget(self, pos):
+        """Retrieve the time series of a position, or of a list of positions concurrently, as get.
+
+        Returns:
+            DataFrame, TimeSeriesArray: the time series, or the time series of the positions in their order, with
+                the errors of the positions whose request failed in errors
+        """
+        if type(pos) in (list, tuple):
+            results = await self.__simple_geo.gather_time_series(self, pos)
+            errors = {i: error for i, (_, error) in enumerate(results) if error is not None}
+            return TimeSeriesArray.from_series(pos, [data for data, _ in results], errors)
+        return await self.__simple_geo.aget(self, pos=pos)
@@ -21,10 +21,21 @@
 #
 
 import json
-from xml.dom import minidom
-import requests
-from shapely.geometry import Point, Polygon, MultiPolygon
+import threading
+import time
 from http.client import responses
+from ._lazy import lazy_import, optional_import
+from .concurrency import ordered_map
+from .geojson import FeatureDecoder, concat_geometries, concat_properties
+from .metrics import Metrics, print_hook
+from .tiling import area_of_interest, grid, tile_filter
+
+minidom = lazy_import('xml.dom.minidom')
+requests = lazy_import('requests')
+urllib3 = lazy_import('urllib3')
+
+# optional, used by the stream mode
+ijson = optional_import('ijson')
 
 try:
     # For Python 3.0 and later
@@ -40,17 +51,37 @@ class WFS:
         host (str): the WFS server URL.
     """
 
+    # feature descriptions by (server URL, type name), with the time they were stored, shared by the clients of
+    # the same server
+    _schemas = {}
+    _schemas_lock = threading.Lock()
+
     def __init__(self, host, **kwargs):
         """Create a WFS client attached to the given host address (an URL).
         Args:
             host (str): the server URL.
             debug (bool): enable debug mode
+            auth (tuple, optional): the ("user", "pass") credentials
+            pool_size (int, optional): the number of connections kept alive to the server
+            timeout (float, tuple, optional): the connect/read timeout of each request, in seconds
+            retries (int, optional): the number of retries of a request that failed to connect or got a
+                502, 503 or 504 response
+            backoff (float, optional): the backoff factor between retries, in seconds
+            schema_ttl (float, optional): the number of seconds a feature description is kept in memory,
+                None keeps it until invalidate_schema is called and 0 disables the schema cache. The schema cache
+                is shared by the clients of the same server URL
+            stream (bool, optional): read GetFeature responses incrementally, decoding each feature as it
+                arrives instead of loading the whole document (requires the ijson package)
+            metrics (Metrics, optional): the collector of the request and decoding events, a new one by default
+            version (str, optional): the WFS protocol version, '1.0.0' (the default), '2.0.0' or 'auto' to use
+                2.0.0 when the GetCapabilities response of the server offers it. With 2.0.0, counts are
+                requested with resultType=hits and pages with count/startIndex.
         """
         self.host = host
-        self.base_path = "wfs?service=wfs&version=1.0.0&outputFormat=application/json"
         self.__debug = False
 
-        invalid_parameters = set(kwargs) - {"debug", "auth"}
+        invalid_parameters = set(kwargs) - {"debug", "auth", "pool_size", "timeout", "retries", "backoff",
+                                            "schema_ttl", "stream", "metrics", "version"}
         if invalid_parameters:
             raise AttributeError('invalid parameter(s): {}'.format(invalid_parameters))
 
@@ -59,6 +90,23 @@ class WFS:
                 raise AttributeError('debug must be a boolean')
             self.__debug = kwargs['debug']
 
+        self.__version = '1.0.0'
+        if 'version' in kwargs:
+            if kwargs['version'] not in ('1.0.0', '2.0.0', 'auto'):
+                raise AttributeError("version must be '1.0.0', '2.0.0' or 'auto'")
+            # negotiated on the first request
+            self.__version = None if kwargs['version'] == 'auto' else kwargs['version']
+        self.__version_lock = threading.Lock()
+
+        if kwargs.get('metrics') is not None:
+            if not isinstance(kwargs['metrics'], Metrics):
+                raise AttributeError('metrics must be a Metrics object')
+            self.metrics = kwargs['metrics']
+        else:
+            self.metrics = Metrics()
+            if self.__debug:
+                self.metrics.add_hook(print_hook)
+
         self.__auth = None
 
         if 'auth' in kwargs:
@@ -69,75 +117,260 @@ class WFS:
                     raise AttributeError('auth must be a tuple with 2 values ("user", "pass")')
                 self.__auth = kwargs['auth']
 
-    def _get(self, uri):
-        if self.__debug:
-            print("GET", uri)
-        r = requests.get(uri, auth=self.__auth)
-
-        if self.__debug:
-            print(r.status_code)
+        pool_size = 10
+        if 'pool_size' in kwargs:
+            if type(kwargs['pool_size']) is not int or kwargs['pool_size'] < 1:
+                raise AttributeError('pool_size must be an integer greater than 0')
+            pool_size = kwargs['pool_size']
+
+        self.__timeout = None
+        if 'timeout' in kwargs:
+            if kwargs['timeout'] is not None and type(kwargs['timeout']) not in (int, float, tuple):
+                raise AttributeError('timeout must be a number or a tuple (connect, read)')
+            self.__timeout = kwargs['timeout']
+
+        retries = 3
+        if 'retries' in kwargs:
+            if type(kwargs['retries']) is not int or kwargs['retries'] < 0:
+                raise AttributeError('retries must be a non negative integer')
+            retries = kwargs['retries']
+
+        backoff = 0.5
+        if 'backoff' in kwargs:
+            if type(kwargs['backoff']) not in (int, float) or kwargs['backoff'] < 0:
+                raise AttributeError('backoff must be a non negative number')
+            backoff = kwargs['backoff']
+
+        self.__schema_ttl = 3600
+        if 'schema_ttl' in kwargs:
+            if kwargs['schema_ttl'] is not None and (type(kwargs['schema_ttl']) not in (int, float) or
+                                                     kwargs['schema_ttl'] < 0):
+                raise AttributeError('schema_ttl must be a non negative number or None')
+            self.__schema_ttl = kwargs['schema_ttl']
+
+        self.__stream = False
+        if 'stream' in kwargs:
+            if not type(kwargs['stream']) is bool:
+                raise AttributeError('stream must be a boolean')
+            if kwargs['stream'] and ijson is None:
+                raise ImportError('stream mode requires the ijson package')
+            self.__stream = kwargs['stream']
+
+        # A single session keeps the connections alive between requests. Its connection pool is thread safe, so
+        # it is shared by the threads fetching pages concurrently.
+        retry = urllib3.util.retry.Retry(total=retries, backoff_factor=backoff, status_forcelist=(502, 503, 504),
+                      allowed_methods=None, raise_on_status=False)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.__session = requests.Session()
+        self.__session.mount('http://', adapter)
+        self.__session.mount('https://', adapter)
+        self.__session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+        self.__session.auth = self.__auth
+
+    def close(self):
+        """Closes the connections kept alive to the server."""
+        self.__session.close()
+
+    @property
+    def version(self):
+        """The WFS protocol version of the requests, negotiated with the server when created with version='auto'"""
+        if self.__version is None:
+            with self.__version_lock:
+                if self.__version is None:
+                    doc = self._get("{}/wfs?service=wfs&request=GetCapabilities&acceptVersions=2.0.0,1.0.0".format(
+                        self.host))
+                    self.__version = '2.0.0' if self._parse_version(doc) == '2.0.0' else '1.0.0'
+        return self.__version
+
+    @property
+    def base_path(self):
+        return "wfs?service=wfs&version={}&outputFormat=application/json".format(self.version)
+
+    def _type_names(self):
+        """The name of the parameter with the feature type of a request"""
+        return 'typeNames' if self.version == '2.0.0' else 'typeName'
+
+    @staticmethod
+    def _parse_version(doc):
+        """Returns the version of a GetCapabilities document"""
+        return minidom.parseString(doc).documentElement.getAttribute('version')
+
+    def _get(self, uri, validators=None):
+        headers = self._conditional_headers(validators)
+        with self.metrics.timer('wfs.request', method='GET', uri=uri) as event:
+            r = self.__session.get(uri, headers=headers, timeout=self.__timeout)
+            event['status'] = r.status_code
+            event['bytes'] = len(r.content)
+
+        if r.status_code == 304 and headers:
+            self._update_validators(validators, r.headers, modified=False)
+            return None
 
         if r.status_code != 200:
             raise Exception("HTTP GET request failed: {}".format(responses[r.status_code]))
 
+        self._update_validators(validators, r.headers)
         return r.content
 
-    def _post(self, uri, data=None):
-        if self.__debug:
-            print("POST", uri)
-        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-        r = requests.post(uri, data=data, headers=headers, auth=self.__auth)
+    def _post(self, uri, data=None, validators=None):
+        headers = self._conditional_headers(validators)
+        conditional = bool(headers)
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        with self.metrics.timer('wfs.request', method='POST', uri=uri) as event:
+            r = self.__session.post(uri, data=data, headers=headers, timeout=self.__timeout)
+            event['status'] = r.status_code
+            event['bytes'] = len(r.content)
 
-        if self.__debug:
-            print(r.status_code)
+        if r.status_code == 304 and conditional:
+            self._update_validators(validators, r.headers, modified=False)
+            return None
 
         if r.status_code != 200:
             raise Exception("HTTP POST request failed: {}".format(responses[r.status_code]))
 
+        self._update_validators(validators, r.headers)
         return r.text
 
-    def list_features(self):
+    def _post_stream(self, uri, data=None, validators=None):
+        """Sends a POST request whose response body is read incrementally from the returned response, or returns
+        None when a conditional request (see list_features) was answered with 304 Not Modified."""
+        headers = self._conditional_headers(validators)
+        conditional = bool(headers)
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        # the body is not read yet: this is the time to the response headers, the bytes are in wfs.decode
+        with self.metrics.timer('wfs.request', method='POST', uri=uri) as event:
+            r = self.__session.post(uri, data=data, headers=headers, timeout=self.__timeout, stream=True)
+            event['status'] = r.status_code
+
+        if r.status_code == 304 and conditional:
+            r.close()
+            self._update_validators(validators, r.headers, modified=False)
+            return None
+
+        if r.status_code != 200:
+            r.close()
+            raise Exception("HTTP POST request failed: {}".format(responses[r.status_code]))
+
+        self._update_validators(validators, r.headers)
+        # let urllib3 undo the gzip encoding while streaming
+        r.raw.decode_content = True
+        return r
+
+    @staticmethod
+    def _conditional_headers(validators):
+        """Builds the If-None-Match and If-Modified-Since headers of a conditional request"""
+        headers = {}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    @staticmethod
+    def _update_validators(validators, headers, modified=True):
+        """Stores the ETag and Last-Modified headers of a response in validators. A new version of the resource
+        replaces the previous validators, a 304 response only updates those it sends."""
+        if validators is None:
+            return
+        if modified:
+            validators.clear()
+        if headers.get('ETag'):
+            validators['etag'] = headers['ETag']
+        if headers.get('Last-Modified'):
+            validators['last_modified'] = headers['Last-Modified']
+
+    def list_features(self, validators=None):
         """Returns the list of all available features in service.
 
+        Args:
+            validators (dict, optional): the 'etag' and 'last_modified' validators of a previous response, sent as
+                If-None-Match and If-Modified-Since headers. The dict is updated with the validators of the new
+                response, so a dict given empty collects them.
+
         Returns:
-            dict: with a single key/value pair
+            dict: with a single key/value pair, or None when the validators were given and the server answered
+                304 Not Modified
 
         Raises:
             ValueError: if feature name parameter is missing
             Exception: if the service returns a exception
         """
         url = "{}/{}&request=GetCapabilities".format(self.host, self.base_path)
-        if self.__debug:
-            print(url)
-
-        doc = self._get(url)
 
-        if self.__debug:
-            print(doc)
+        doc = self._get(url, validators)
+        if doc is None:
+            return None
 
         # TODO verificar se veio erro
         #if 'exception' in doc:
         #    raise Exception(doc["exception"])
 
+        return self._parse_capabilities(doc)
+
+    @staticmethod
+    def _parse_capabilities(doc):
+        """Extracts the feature names of a GetCapabilities document"""
         xmldoc = minidom.parseString(doc)
-        itemlist = xmldoc.getElementsByTagName('FeatureType')
+        # the elements of 2.0.0 documents may have a namespace prefix
+        itemlist = xmldoc.getElementsByTagNameNS('*', 'FeatureType')
 
         features = dict()
         features[u'features'] = []
 
         for s in itemlist:
-            features[u'features'].append(s.childNodes[0].firstChild.nodeValue)
+            features[u'features'].append(s.getElementsByTagNameNS('*', 'Name')[0].firstChild.nodeValue)
 
         return features
 
-    def describe_feature(self, ft_name):
+    def get_schema(self, ft_name):
+        """Returns the description of a given feature stored on the schema cache, or None if it is not there or
+        has expired."""
+        if self.__schema_ttl == 0:
+            return None
+        with WFS._schemas_lock:
+            entry = WFS._schemas.get(self.__schema_key(ft_name))
+            if entry is None:
+                return None
+            if self.__schema_ttl is not None and time.time() - entry[1] > self.__schema_ttl:
+                del WFS._schemas[self.__schema_key(ft_name)]
+                return None
+            return entry[0]
+
+    def set_schema(self, ft_name, feature):
+        """Stores the description of a given feature (as returned by describe_feature) on the schema cache."""
+        if self.__schema_ttl == 0:
+            return
+        with WFS._schemas_lock:
+            WFS._schemas[self.__schema_key(ft_name)] = (feature, time.time())
+
+    def invalidate_schema(self, ft_name=None):
+        """Removes the description of a given feature, or of all features of the server when ft_name is None,
+        from the schema cache."""
+        host, _ = self.__schema_key(ft_name)
+        with WFS._schemas_lock:
+            if ft_name is None:
+                for key in [key for key in WFS._schemas if key[0] == host]:
+                    del WFS._schemas[key]
+            else:
+                WFS._schemas.pop(self.__schema_key(ft_name), None)
+
+    def __schema_key(self, ft_name):
+        return self.host.rstrip('/'), ft_name
+
+    def describe_feature(self, ft_name, validators=None):
         """Returns the metadata of a given feature.
 
+        The description is kept on the schema cache, so the DescribeFeatureType request is only made once
+        per feature while it does not expire (see schema_ttl).
+
         Args:
             ft_name (str): the feature name whose schema you are interested in.
+            validators (dict, optional): the validators of a conditional request (see list_features)
 
         Returns:
-            dict: a dictionary with some metadata about the informed feature.
+            dict: a dictionary with some metadata about the informed feature, or None when the validators were
+                given and the server answered 304 Not Modified
 
         Raises:
             ValueError: if feature parameter is missing.
@@ -148,17 +381,26 @@ class WFS:
         if not ft_name:
             raise ValueError("Missing feature name.")
 
-        doc = self._get("{}/{}&request=DescribeFeatureType&typeName={}".format(self.host, self.base_path, ft_name))
+        feature = self.get_schema(ft_name)
+        if feature is not None:
+            return feature
 
-        if self.__debug:
-            print(doc)
+        doc = self._get("{}/{}&request=DescribeFeatureType&{}={}".format(self.host, self.base_path,
+                                                                         self._type_names(), ft_name), validators)
+        if doc is None:
+            return None
 
         # TODO verificar se veio erro
         #if 'exception' in doc:
         #    raise Exception(doc["exception"])
 
-        js = json.loads(doc)
+        feature = self._parse_description(json.loads(doc))
+        self.set_schema(ft_name, feature)
+        return feature
 
+    @staticmethod
+    def _parse_description(js):
+        """Builds the feature metadata from a DescribeFeatureType document"""
         feature = dict()
         feature['name'] = js['featureTypes'][0]['typeName']
         feature['namespace'] = js['targetPrefix']
@@ -173,15 +415,25 @@ class WFS:
                 feature['geometry'] = attr
         #if 'geometry' not in feature:
         #    raise Exception("Unsupported geometry type. Supported geometries: ", feature, supported_geometries )
-        if self.__debug:
-            print("Feature without geometry.")
         return feature
 
-    def feature_collection(self, ft_name, **kwargs):
+    def feature_collection(self, ft_name, page_size=None, workers=1, max_in_flight=None, validators=None, **kwargs):
         """Retrieve the feature collection given feature.
 
+        Returns:
+            dict: the decoded collection, with the keys total_features (number of matching features), total
+                (number of returned features), crs, ids (list of feature ids), properties (dict with a list of
+                values per attribute) and, for features with geometry, geometry (array of shapely geometries)
+
         Args:
             ft_name (str): the feature name whose you are interested in.
+            page_size (int, optional): when given, the collection is requested in pages of page_size records
+                (see iter_features) and merged
+            workers (int, optional): the number of pages requested concurrently
+            max_in_flight (int, optional): the maximum number of pages requested but not yet merged
+            validators (dict, optional): the validators of a conditional request (see list_features). They only
+                apply to a collection requested at once: a paged collection is always requested and leaves the
+                dict empty, as the validators of its first page do not tell whether the other pages changed.
              **kwargs: Keyword arguments:
                 max_features (int, optional): the number of records to get
                 attributes(list, tuple, str, optional): the list, tuple or string of attributes you are interested in
@@ -191,6 +443,7 @@ class WFS:
                     (http://docs.geoserver.org/latest/en/user/filter/function_reference.html#filter-function-reference)
                 sort_by(list, tuple, str, optional(: the list, tuple or string of attributes used to sort resulting
                     collection
+                start_index(int, optional): the position of the first record to get
 
         Raises:
             ValueError: if latitude or longitude is out of range or any mandatory parameter is missing.
@@ -200,22 +453,251 @@ class WFS:
         if not ft_name:
             raise ValueError("Missing feature name.")
 
-        invalid_parameters = set(kwargs) - {"max_features", "attributes", "filter", "sort_by"}
+        invalid_parameters = set(kwargs) - {"max_features", "attributes", "filter", "sort_by", "start_index"}
 
         if invalid_parameters:
             raise AttributeError('invalid parameter(s): {}'.format(invalid_parameters))
 
+        if page_size is not None:
+            if validators is not None:
+                validators.clear()
+            return self._merge_feature_collections(
+                self.iter_features(ft_name, page_size=page_size, workers=workers, max_in_flight=max_in_flight,
+                                   **kwargs))
+
         feature_desc = self.describe_feature(ft_name)
+        data = self._get_feature_data(ft_name, feature_desc, **kwargs)
+        return self._get_feature(data, feature_desc, validators)
+
+    def iter_features(self, ft_name, page_size=1000, workers=1, max_in_flight=None, **kwargs):
+        """Iterate over the feature collection of a given feature, one page at a time.
+
+        Pages are requested with startIndex/maxFeatures (count in WFS 2.0.0), so only one page is held in memory
+        at a time.
+        Without sort_by the paging relies on the natural order of the server, which GeoServer keeps stable.
+        When workers > 1, the pages after the first one are requested concurrently (the first page tells how
+        many features match) and still yielded in order.
+
+        Args:
+            ft_name (str): the feature name whose you are interested in.
+            page_size (int, optional): the number of records requested on each GetFeature request
+            workers (int, optional): the number of pages requested concurrently
+            max_in_flight (int, optional): the maximum number of pages requested but not yet yielded,
+                2 * workers by default
+            **kwargs: Keyword arguments: same as feature_collection, max_features limits the total number of
+                records yielded and start_index the position of the first one.
+
+        Yields:
+            dict: a feature collection (see feature_collection) for each page.
+
+        Raises:
+            ValueError: if any mandatory parameter is missing.
+            AttributeError: if found an unexpected parameter or unexpected type
+            Exception: if the service returns a exception
+        """
+        if not ft_name:
+            raise ValueError("Missing feature name.")
+
+        invalid_parameters = set(kwargs) - {"max_features", "attributes", "filter", "sort_by", "start_index"}
+        if invalid_parameters:
+            raise AttributeError('invalid parameter(s): {}'.format(invalid_parameters))
+
+        if type(page_size) is not int or page_size < 1:
+            raise AttributeError('page_size must be an integer greater than 0')
+
+        if type(workers) is not int or workers < 1:
+            raise AttributeError('workers must be an integer greater than 0')
+
+        max_features = kwargs.pop('max_features', None)
+        start_index = kwargs.pop('start_index', None) or 0
+
+        # the schema is the same for every page
+        feature_desc = self.describe_feature(ft_name)
+
+        def fetch(page):
+            data = self._get_feature_data(ft_name, feature_desc, start_index=page[0], max_features=page[1], **kwargs)
+            return self._get_feature(data, feature_desc)
+
+        count = min(page_size, max_features) if max_features else page_size
+        fc = fetch((start_index, count))
+        if fc['total'] == 0:
+            return
+        yield fc
+        fetched = fc['total']
+        if fetched < count:
+            return
+
+        if workers > 1 and type(fc['total_features']) is int:
+            end = fc['total_features'] - start_index
+            if max_features:
+                end = min(end, max_features)
+            pages = [(start_index + first, min(page_size, end - first)) for first in range(fetched, end, page_size)]
+            for fc in ordered_map(fetch, pages, workers=workers, max_in_flight=max_in_flight):
+                if fc['total'] > 0:
+                    yield fc
+            return
+
+        while not max_features or fetched < max_features:
+            count = page_size
+            if max_features:
+                count = min(page_size, max_features - fetched)
+            fc = fetch((start_index + fetched, count))
+            if fc['total'] == 0:
+                break
+            yield fc
+            fetched += fc['total']
+            if fc['total'] < count:
+                break
+
+    def tiled_feature_collection(self, ft_name, tiles=4, bbox=None, tile_features=10000, page_size=None, workers=4,
+                                 max_in_flight=None, **kwargs):
+        """Retrieve a feature collection with one query per tile of its area of interest.
+
+        The area of interest (the bounds of the WITHIN, INTERSECTS and BBOX terms of the filter, or bbox) is split
+        in tiles, and each tile is requested with the filter AND-ed with its BBOX, so the server runs small queries
+        on its spatial index. Tiles are requested concurrently and merged in order, and the features that cross
+        tile borders, returned by more than one tile, are kept only once (by feature id). max_features limits the
+        merged features once the duplicates are removed, and total_features is the number of distinct features, or
+        'unknown' when max_features left some out.
+
+        Args:
+            ft_name (str): the feature name whose you are interested in.
+            tiles (int, tuple, str, optional): n for a grid of n by n tiles, (nx, ny) for a grid of nx by ny tiles,
+                or 'adaptive' to split the area in quadrants until each tile has at most tile_features features
+            bbox (tuple, optional): the (minx, miny, maxx, maxy) area of interest, which must cover all the
+                features of interest, by default the bounds of the spatial terms of the filter
+            tile_features (int, optional): the maximum number of features of an adaptive tile
+            page_size (int, optional): when given, each tile is requested in pages of page_size records
+            workers (int, optional): the number of tiles requested concurrently
+            max_in_flight (int, optional): the maximum number of tiles requested but not yet merged
+            **kwargs: Keyword arguments: same as feature_collection, except sort_by and start_index
+
+        Raises:
+            AttributeError: if found an unexpected parameter or unexpected type, or if there is no area of interest
+            Exception: if the service returns a exception
+        """
+        if not ft_name:
+            raise ValueError("Missing feature name.")
+
+        invalid_parameters = set(kwargs) - {"max_features", "attributes", "filter"}
+        if invalid_parameters:
+            raise AttributeError('invalid parameter(s) for tiled queries: {}'.format(invalid_parameters))
+
+        if type(workers) is not int or workers < 1:
+            raise AttributeError('workers must be an integer greater than 0')
+
+        if type(tile_features) is not int or tile_features < 1:
+            raise AttributeError('tile_features must be an integer greater than 0')
+
+        ftr = kwargs.pop('filter', None) or ""
+        max_features = kwargs.pop('max_features', None)
+        if bbox is None:
+            bbox = area_of_interest(ftr)
+            if bbox is None:
+                raise AttributeError('tiled queries need a WITHIN, INTERSECTS or BBOX filter, or a bbox')
+        if len(bbox) != 4:
+            raise AttributeError('bbox must be a tuple (minx, miny, maxx, maxy)')
+
+        if tiles == 'adaptive':
+            tile_list = self.__adaptive_tiles(ft_name, ftr, bbox, tile_features, workers)
+        elif type(tiles) is int and tiles > 0:
+            tile_list = grid(bbox, tiles, tiles)
+        elif type(tiles) is tuple and len(tiles) == 2 and all(type(n) is int and n > 0 for n in tiles):
+            tile_list = grid(bbox, *tiles)
+        else:
+            raise AttributeError("tiles must be a positive integer, a tuple (nx, ny) or 'adaptive'")
+
+        if max_features:
+            # a tile never needs more than max_features features: the merged result is limited to max_features
+            # after the duplicates are removed, and removing them only drops features
+            kwargs['max_features'] = max_features
+
+        def fetch(tile):
+            return self.feature_collection(ft_name, page_size=page_size, filter=tile_filter(ftr, tile), **kwargs)
+
+        seen = set()
+        fcs = []
+        count = 0
+        # the number of matching features is only known when every tile was fetched whole
+        total_features = None
+        for position, fc in enumerate(ordered_map(fetch, tile_list, workers=workers, max_in_flight=max_in_flight)):
+            if max_features and fc['total'] >= max_features:
+                total_features = 'unknown'
+            fc = self._unique_features(fc, seen)
+            if fc['total'] > 0:
+                fcs.append(fc)
+                count += fc['total']
+            if max_features and count >= max_features:
+                if position < len(tile_list) - 1:
+                    total_features = 'unknown'
+                break
+
+        fc = self._merge_feature_collections(fcs)
+        fc['total_features'] = fc['total'] if total_features is None else total_features
+        if max_features and fc['total'] > max_features:
+            fc = self._take_features(fc, range(max_features))
+        return fc
+
+    def __adaptive_tiles(self, ft_name, ftr, bbox, tile_features, workers, max_depth=8):
+        """Splits bbox in quadrants until each tile has at most tile_features features, dropping empty tiles"""
+        def count(tile):
+            return self.feature_collection_len(ft_name, filter=tile_filter(ftr, tile))
+
+        tiles = []
+        pending = [tuple(bbox)]
+        for depth in range(max_depth + 1):
+            if not pending:
+                break
+            split = []
+            for tile, total in zip(pending, ordered_map(count, pending, workers=workers)):
+                if total == 0:
+                    continue
+                if type(total) is int and total > tile_features and depth < max_depth:
+                    split += grid(tile, 2, 2)
+                else:
+                    tiles.append(tile)
+            pending = split
+        return tiles
+
+    @staticmethod
+    def _unique_features(fc, seen):
+        """Removes from a feature collection the features whose ids are in seen, and adds its ids to seen"""
+        keep = []
+        for i, fid in enumerate(fc['ids']):
+            if fid is None or fid not in seen:
+                keep.append(i)
+                seen.add(fid)
+        if len(keep) == len(fc['ids']):
+            return fc
+        return WFS._take_features(fc, keep)
+
+    @staticmethod
+    def _take_features(fc, positions):
+        """Returns a feature collection with the features at the given positions"""
+        positions = list(positions)
+        taken = dict(fc)
+        taken['ids'] = [fc['ids'][i] for i in positions]
+        taken['properties'] = {key: [values[i] for i in positions] for key, values in fc['properties'].items()}
+        if 'geometry' in fc:
+            taken['geometry'] = fc['geometry'][positions]
+        taken['total'] = len(positions)
+        return taken
+
+    def _get_feature_data(self, ft_name, feature_desc, **kwargs):
+        """Builds the GetFeature request parameters"""
         geometry_name = None
         if 'geometry' in feature_desc:
             geometry_name = feature_desc['geometry']['name']
 
         data = {
-            'typeName': ft_name
+            self._type_names(): ft_name
         }
 
         if 'max_features' in kwargs:
-            data['maxFeatures'] = kwargs['max_features']
+            data['count' if self.version == '2.0.0' else 'maxFeatures'] = kwargs['max_features']
+
+        if 'start_index' in kwargs:
+            data['startIndex'] = kwargs['start_index']
 
         if 'attributes' in kwargs:
             if type(kwargs['attributes']) in [list, tuple]:
@@ -235,50 +717,136 @@ class WFS:
             data['sortBy'] = kwargs['sort_by']
 
         if 'filter' in kwargs:
-            if type(kwargs['filter']) is not str:
+            if not isinstance(kwargs['filter'], str):
                 raise AttributeError('filter must be a string')
             if geometry_name is not None:
                 data['CQL_FILTER'] = kwargs['filter'].replace("#geom#", geometry_name)
             else:
                 data['CQL_FILTER'] = kwargs['filter']
 
+        return data
+
+    def _get_feature(self, data, feature_desc, validators=None):
+        """Runs a GetFeature request and decodes the returned features, or returns None when a conditional
+        request was answered with 304 Not Modified"""
+        uri = "{}/{}&request=GetFeature".format(self.host, self.base_path)
+        body = self._get_feature_body(data)
+
+        if self.__stream:
+            r = self._post_stream(uri, data=body, validators=validators)
+            if r is None:
+                return None
+            with r:
+                with self.metrics.timer('wfs.decode') as event:
+                    fc = self._decode_stream(r.raw, self._decoder(feature_desc, self.metrics))
+                    event['features'] = fc['total']
+                    event['bytes'] = r.raw.tell()
+            return fc
+
+        doc = self._post(uri, data=body, validators=validators)
+        if doc is None:
+            return None
+
+        if 'exception' in doc:
+            raise Exception(doc["exception"])
+
+        with self.metrics.timer('wfs.parse', bytes=len(doc)):
+            js = json.loads(doc)
+        return self._decode_collection(js, feature_desc, self.metrics)
+
+    @staticmethod
+    def _get_feature_body(data):
+        """Encodes the GetFeature request parameters"""
         body = ""
         for key, value in data.items():
             if value:
                 body += "&{}={}".format(key, value)
-        doc = self._post("{}/{}&request=GetFeature".format(self.host, self.base_path), data=body[1:])
+        return body[1:]
 
-        if 'exception' in doc:
-            raise Exception(doc["exception"])
+    @staticmethod
+    def _decoder(feature_desc, metrics=None):
+        """Creates the decoder of the features of a given feature description"""
+        geometry_type = None
+        if 'geometry' in feature_desc:
+            geometry_type = feature_desc['geometry']['type']
+        return FeatureDecoder(geometry_type, metrics=metrics)
+
+    @staticmethod
+    def _decode_collection(js, feature_desc, metrics=None):
+        """Decodes a GetFeature document, emitting a wfs.decode event when metrics is given"""
+        start = time.perf_counter()
+        decoder = WFS._decoder(feature_desc, metrics)
+        decoder.extend(js['features'])
+
+        fc = decoder.finish()
+        if metrics is not None:
+            metrics.emit('wfs.decode', seconds=time.perf_counter() - start, features=decoder.count)
+        fc['total_features'] = WFS._total_features(js.get('numberMatched'), js.get('totalFeatures'))
+        fc['total'] = decoder.count
+        fc['crs'] = js.get('crs')
+        return fc
 
-        js = json.loads(doc)
+    @staticmethod
+    def _decode_stream(stream, decoder):
+        """Decodes a GetFeature response from a file-like object, one feature at a time"""
+        number_matched = None
+        total_features = None
+        crs = None
+        builder = None
+        try:
+            for prefix, event, value in ijson.parse(stream, use_float=True):
+                if prefix == 'features.item' and event == 'start_map':
+                    builder = ijson.ObjectBuilder()
+                if builder is not None:
+                    builder.event(event, value)
+                    if prefix == 'features.item' and event == 'end_map':
+                        decoder.add(builder.value)
+                        builder = None
+                elif prefix == 'numberMatched':
+                    number_matched = value
+                elif prefix == 'totalFeatures':
+                    total_features = value
+                elif prefix == 'crs.properties.name':
+                    crs = {'type': 'name', 'properties': {'name': value}}
+        except ijson.JSONError:
+            raise Exception("Invalid GetFeature response.")
+
+        fc = decoder.finish()
+        fc['total_features'] = WFS._total_features(number_matched, total_features)
+        fc['total'] = decoder.count
+        fc['crs'] = crs
+        return fc
 
-        fc = dict()
-        fc['total_features'] = js['totalFeatures']
-        fc['total'] = len(js['features'])
-        fc['features'] = []
-        for item in js['features']:
-            if geometry_name is not None:
-                if feature_desc['geometry']['type'] == 'gml:Point':
-                    feature = {'geometry': Point(item['geometry']['coordinates'][0], item['geometry']['coordinates'][1])}
-                elif feature_desc['geometry']['type'] == 'gml:MultiPolygon':
-                    polygons = []
-                    for polygon in item['geometry']['coordinates']:
-                        polygons += [Polygon(lr) for lr in polygon]
-                    feature = {'geometry': MultiPolygon(polygons)}
-                elif feature_desc['geometry']['type'] == 'gml:Polygon':
-                    feature = {'geometry': Polygon(item['geometry']['coordinates'][0])}
-                else:
-                    raise Exception('Unsupported geometry type.')
-            else:
-                feature = {}
-            feature.update(item['properties'])
-            fc['features'].append(feature)
-        fc['crs'] = js['crs']
+    @staticmethod
+    def _total_features(number_matched, total_features):
+        """The number of matching features of a response: numberMatched of WFS 2.0.0, which may be 'unknown',
+        or the totalFeatures of GeoServer"""
+        if type(number_matched) is int:
+            return number_matched
+        return total_features if total_features is not None else number_matched
+
+    @staticmethod
+    def _merge_feature_collections(fcs):
+        """Concatenates the pages of a feature collection"""
+        fc = {'total_features': 0, 'total': 0, 'ids': [], 'crs': None}
+        properties = []
+        geometries = []
+        for page in fcs:
+            fc['total_features'] = page['total_features']
+            fc['total'] += page['total']
+            fc['ids'] += page['ids']
+            fc['crs'] = page['crs']
+            properties.append((page['properties'], page['total']))
+            if 'geometry' in page:
+                geometries.append(page['geometry'])
+        fc['properties'] = concat_properties(properties)
+        if geometries:
+            fc['geometry'] = concat_geometries(geometries)
         return fc
 
     def feature_collection_len(self, ft_name, **kwargs):
-        """Retrieve the feature collection length
+        """Retrieve the feature collection length. In WFS 2.0.0 it is a resultType=hits request, which returns no
+        features, otherwise a GetFeature request of one feature.
             Args:
             ft_name (str): the feature name whose you are interested in.
             **kwargs: Keyword arguments:
@@ -297,8 +865,37 @@ class WFS:
         invalid_parameters = set(kwargs) - {"within", "filter"}
         if invalid_parameters:
             raise AttributeError('invalid parameter(s): {}'.format(invalid_parameters))
-
-        kwargs['max_features'] = 1
-        fc = self.feature_collection(ft_name, **kwargs)
-
-        return fc['total_features']
+        # filter=None counts every feature
+        if kwargs.get('filter') is None:
+            kwargs.pop('filter', None)
+
+        if self.version != '2.0.0':
+            kwargs['max_features'] = 1
+            fc = self.feature_collection(ft_name, **kwargs)
+            return fc['total_features']
+
+        # the geometry name is only needed to resolve the spatial terms of the filter
+        feature_desc = {}
+        if '#geom#' in (kwargs.get('filter') or ''):
+            feature_desc = self.describe_feature(ft_name)
+        data = self._get_feature_data(ft_name, feature_desc, **kwargs)
+        data['resultType'] = 'hits'
+        doc = self._post("{}/{}&request=GetFeature".format(self.host, self.base_path),
+                         data=self._get_feature_body(data))
+        return self._parse_hits(doc)
+
+    @staticmethod
+    def _parse_hits(doc):
+        """Returns the numberMatched of a resultType=hits response, as an int unless the server answered 'unknown'"""
+        if doc.lstrip().startswith('{'):
+            js = json.loads(doc)
+            number_matched = WFS._total_features(js.get('numberMatched'), js.get('totalFeatures'))
+        else:
+            root = minidom.parseString(doc.encode('utf-8')).documentElement
+            if 'Exception' in root.localName:
+                raise Exception("Invalid hits response: {}".format(doc))
+            number_matched = root.getAttribute('numberMatched')
+        try:
+            return int(number_matched)
+        except (TypeError, ValueError):
+            return number_matched
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright (C) 2017 National Institute For Space Research (INPE) - Brazil.
+#
+#  This file is part of simple_geo.py toolkit.
+#
+#  simple_geo.py toolkit is free software: you can
+#  redistribute it and/or modify it under the terms of the
+#  GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License,
+#  or (at your option) any later version.
+#
+#  simple_geo.py toolkit is distributed in the hope that
+#  it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with simple_geo.py toolkit. See LICENSE. If not, write to
+#  e-sensing team at <esensing-team@dpi.inpe.br>.
+#
+
+
+import datetime
+import json
+from http.client import responses
+
+from SimpleGeo._lazy import lazy_import
+
+requests = lazy_import('requests')
+
+
+class TimeSeriesResult:
+    """The time series of a position: timeline (list of dates) and attributes (dict of lists of values)"""
+
+    def __init__(self, attributes, timeline):
+        self.attributes = attributes
+        self.timeline = timeline
+
+
+class WTSSClient:
+    """Minimal client of the WTSS HTTP API (list_coverages, describe_coverage and time_series).
+
+    It has the interface of the wtss.wtss client used by SimpleGeo, whose later releases replaced it with a
+    different API, and is used when that client is not installed.
+    """
+
+    def __init__(self, host):
+        """Create a WTSS client.
+        Args:
+            host (str): WTSS server URL
+        """
+        self.host = host
+        self.__session = requests.Session()
+
+    def __request(self, operation, **params):
+        r = self.__session.get("{}/wtss/{}".format(self.host, operation), params=params)
+        if r.status_code != 200:
+            raise Exception("HTTP GET request failed: {}".format(responses.get(r.status_code, r.status_code)))
+        return json.loads(r.content)
+
+    def list_coverages(self):
+        return self.__request('list_coverages')
+
+    def describe_coverage(self, name):
+        return self.__request('describe_coverage', name=name)
+
+    def time_series(self, coverage, attributes, latitude, longitude, start_date, end_date):
+        result = self.__request('time_series', coverage=coverage, attributes=",".join(attributes),
+                                latitude=str(latitude), longitude=str(longitude), start_date=start_date,
+                                end_date=end_date)['result']
+        return TimeSeriesResult({attr['attribute']: attr['values'] for attr in result['attributes']},
+                                [datetime.datetime.strptime(date, "%Y-%m-%d").date() for date in result['timeline']])
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright (C) 2017 National Institute For Space Research (INPE) - Brazil.
+#
+#  This file is part of simple_geo.py toolkit.
+#
+#  simple_geo.py toolkit is free software: you can
+#  redistribute it and/or modify it under the terms of the
+#  GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License,
+#  or (at your option) any later version.
+#
+#  simple_geo.py toolkit is distributed in the hope that
+#  it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with simple_geo.py toolkit. See LICENSE. If not, write to
+#  e-sensing team at <esensing-team@dpi.inpe.br>.
+#
+
+
+"""Import time benchmark of simple_geo.py.
+
+Each statement is timed in --repeat fresh interpreters. The exit status is 1 if the median time of any statement is
+greater than --max-seconds, or if any of them imports one of the heavy dependencies, which must only be imported
+when a request needs them.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --repeat 20 --max-seconds 0.1
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+STATEMENTS = ['import SimpleGeo',
+              'from SimpleGeo import SimpleGeo, Predicates',
+              'from SimpleGeo import AsyncSimpleGeo']
+
+HEAVY_MODULES = ['pandas', 'geopandas', 'shapely', 'numpy', 'requests', 'xml.dom.minidom', 'wtss', 'pyarrow',
+                 'aiohttp']
+
+PROBE = '''
+import sys, time, json
+start = time.perf_counter()
+{}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'modules': [m for m in {!r} if m in sys.modules]}}))
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def probe(statement):
+    """Runs a statement in a fresh interpreter, returning its time and the heavy modules it imported"""
+    out = subprocess.run([sys.executable, '-c', PROBE.format(statement, HEAVY_MODULES)], cwd=ROOT, check=True,
+                         stdout=subprocess.PIPE).stdout
+    return json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import time benchmark of simple_geo.py')
+    parser.add_argument('--repeat', type=int, default=10, help='the number of fresh interpreters of each statement')
+    parser.add_argument('--max-seconds', type=float, default=0.25, help='the allowed median time of each statement')
+    options = parser.parse_args(argv)
+
+    status = 0
+    print('{:45} {:>9} {:>9}  {}'.format('statement', 'p50', 'max', 'heavy modules'))
+    for statement in STATEMENTS:
+        runs = [probe(statement) for _ in range(options.repeat)]
+        seconds = [run['seconds'] for run in runs]
+        modules = sorted(set(module for run in runs for module in run['modules']))
+        median = statistics.median(seconds)
+        print('{:45} {:>9.4f} {:>9.4f}  {}'.format(statement, median, max(seconds), ', '.join(modules) or '-'))
+        if median > options.max_seconds:
+            print('REGRESSION {}: {:.4f}s > {:.4f}s'.format(statement, median, options.max_seconds))
+            status = 1
+        if modules:
+            print('REGRESSION {}: imports {}'.format(statement, ', '.join(modules)))
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
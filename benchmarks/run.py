@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright (C) 2017 National Institute For Space Research (INPE) - Brazil.
+#
+#  This file is part of simple_geo.py toolkit.
+#
+#  simple_geo.py toolkit is free software: you can
+#  redistribute it and/or modify it under the terms of the
+#  GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License,
+#  or (at your option) any later version.
+#
+#  simple_geo.py toolkit is distributed in the hope that
+#  it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with simple_geo.py toolkit. See LICENSE. If not, write to
+#  e-sensing team at <esensing-team@dpi.inpe.br>.
+#
+
+"""Offline benchmarks of simple_geo.py against the stand-in servers of benchmarks.server.
+
+Each benchmark runs once to warm up and then --repeat times, reporting the latency percentiles of the runs, the
+throughput (features, or time series, per second at the median latency) and the peak memory allocated by Python
+during one extra run traced with tracemalloc. With --baseline, the results are compared with a previous --json
+report and the exit status is 1 if any median latency or peak memory regressed by more than --tolerance.
+
+    python -m benchmarks.run --features 50000 --geometry polygon --latency 0.01
+    python -m benchmarks.run --json before.json
+    python -m benchmarks.run --baseline before.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+if not __package__:
+    # run as a script (python benchmarks/run.py)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import context  # noqa: F401
+from benchmarks.server import StandInServer
+
+from SimpleGeo import SimpleGeo, WFS
+from SimpleGeo.cache import pyarrow
+from SimpleGeo.wfs import ijson
+
+BENCHMARKS = {}
+
+
+class Skip(Exception):
+    """Raised by a benchmark that can not run in this environment"""
+
+
+def benchmark(name):
+    """Registers a benchmark.
+
+    The decorated function receives the options of the run and does the setup of one run, returning a function
+    that runs it and returns the number of items processed. Only the returned function is timed.
+    """
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+@benchmark('wfs_feature_collection')
+def wfs_feature_collection(options):
+    wfs = WFS(options.url, version=options.wfs_version)
+
+    def run():
+        return wfs.feature_collection(options.layer)['total']
+    return run
+
+
+@benchmark('wfs_feature_collection_paged')
+def wfs_feature_collection_paged(options):
+    wfs = WFS(options.url, pool_size=max(10, options.workers), version=options.wfs_version)
+    page_size = max(1000, options.features // (2 * options.workers))
+
+    def run():
+        return wfs.feature_collection(options.layer, page_size=page_size, workers=options.workers)['total']
+    return run
+
+
+@benchmark('wfs_feature_count')
+def wfs_feature_count(options):
+    wfs = WFS(options.url, version=options.wfs_version)
+
+    def run():
+        return wfs.feature_collection_len(options.layer)
+    return run
+
+
+@benchmark('simple_geo_get')
+def simple_geo_get(options):
+    s = SimpleGeo(wfs=options.url, wfs_version=options.wfs_version)
+
+    def run():
+        return len(s.feature(options.layer).get())
+    return run
+
+
+@benchmark('simple_geo_get_stream')
+def simple_geo_get_stream(options):
+    if ijson is None:
+        raise Skip('ijson is not installed')
+    s = SimpleGeo(wfs=options.url, stream=True, wfs_version=options.wfs_version)
+
+    def run():
+        return len(s.feature(options.layer).get())
+    return run
+
+
+@benchmark('time_series_enrichment')
+def time_series_enrichment(options):
+    s = SimpleGeo(wfs=options.url, wtss=options.url, workers=options.workers, wfs_version=options.wfs_version)
+    ts = {'time_series': {'coverage': {'name': 'bench', 'attributes': ['ndvi', 'evi']}},
+          'start_date': '2016-01-01', 'end_date': '2016-12-31', 'datetime': 'timestamp'}
+
+    def run():
+        f = s.feature(options.layer).attributes(['fid', 'timestamp', ts]).max_features(options.ts_points)
+        return len(f.get())
+    return run
+
+
+def _cache_benchmark(cache_format, warm):
+    def setup(options):
+        if cache_format == 'parquet' and pyarrow is None:
+            raise Skip('pyarrow is not installed')
+        cache_dir = os.path.join(options.work_dir, 'cache_{}'.format(cache_format))
+        if not warm:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        # a new client each run, so warm runs read from disk instead of the memory tier
+        s = SimpleGeo(wfs=options.url, cache=True, cache_dir=cache_dir, cache_format=cache_format,
+                      wfs_version=options.wfs_version)
+
+        def run():
+            return len(s.feature(options.layer).get())
+        return run
+    return setup
+
+
+for _format in ('pickle', 'parquet'):
+    benchmark('cache_{}_cold'.format(_format))(_cache_benchmark(_format, warm=False))
+    benchmark('cache_{}_warm'.format(_format))(_cache_benchmark(_format, warm=True))
+
+
+def measure(setup, options):
+    """Runs a benchmark, returning its report"""
+    setup(options)()
+    latencies = []
+    items = 0
+    for _ in range(options.repeat):
+        run = setup(options)
+        start = time.perf_counter()
+        items = run()
+        latencies.append(time.perf_counter() - start)
+
+    run = setup(options)
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    latencies = np.array(latencies)
+    median = float(np.percentile(latencies, 50))
+    return {'runs': len(latencies), 'items': items,
+            'p50': median, 'p90': float(np.percentile(latencies, 90)), 'p99': float(np.percentile(latencies, 99)),
+            'max': float(latencies.max()), 'throughput': items / median if median > 0 else None,
+            'peak_memory': peak}
+
+
+def compare(results, baseline, tolerance):
+    """Returns the regressions of results against a baseline report"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if 'error' in result or before is None or 'error' in before:
+            continue
+        for metric in ('p50', 'peak_memory'):
+            if before[metric] and result[metric] > before[metric] * (1 + tolerance):
+                regressions.append('{}: {} {:.4g} -> {:.4g} (+{:.0%})'.format(
+                    name, metric, before[metric], result[metric], result[metric] / before[metric] - 1))
+    return regressions
+
+
+def print_report(results):
+    print('{:32} {:>6} {:>9} {:>9} {:>9} {:>9} {:>12} {:>10}'.format(
+        'benchmark', 'items', 'p50 (s)', 'p90 (s)', 'p99 (s)', 'max (s)', 'items/s', 'peak (MB)'))
+    for name, result in results.items():
+        if 'error' in result or 'skipped' in result:
+            print('{:32} {}'.format(name, result.get('error') or 'skipped: ' + result['skipped']))
+            continue
+        print('{:32} {:>6} {:>9.4f} {:>9.4f} {:>9.4f} {:>9.4f} {:>12.1f} {:>10.1f}'.format(
+            name, result['items'], result['p50'], result['p90'], result['p99'], result['max'],
+            result['throughput'] or 0, result['peak_memory'] / 2 ** 20))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline benchmarks of simple_geo.py')
+    parser.add_argument('--features', type=int, default=10000, help='the number of features of the layers')
+    parser.add_argument('--geometry', choices=['point', 'polygon', 'multipolygon'], default='polygon',
+                        help='the geometry type of the benchmarked layer')
+    parser.add_argument('--latency', type=float, default=0.0, help='the delay of each server response, in seconds')
+    parser.add_argument('--repeat', type=int, default=5, help='the number of timed runs of each benchmark')
+    parser.add_argument('--wfs-version', choices=['1.0.0', '2.0.0', 'auto'], default='1.0.0',
+                        help='the WFS protocol version of the clients')
+    parser.add_argument('--workers', type=int, default=4, help='the workers of the concurrent benchmarks')
+    parser.add_argument('--ts-points', type=int, default=200, help='the number of features enriched with time series')
+    parser.add_argument('--only', help='comma separated names of the benchmarks to run')
+    parser.add_argument('--url', help='the url of a running stand-in server, started by default')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare the results with this report of a previous run')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='the allowed regression, 0.2 for 20%%')
+    options = parser.parse_args(argv)
+    options.layer = 'bench:{}'.format(options.geometry)
+
+    names = list(BENCHMARKS)
+    if options.only:
+        names = [name.strip() for name in options.only.split(',')]
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            parser.error('unknown benchmark(s): {}'.format(', '.join(sorted(unknown))))
+
+    server = None
+    if options.url is None:
+        server = StandInServer(features=options.features, latency=options.latency)
+        options.url = server.start()
+    options.work_dir = tempfile.mkdtemp(prefix='simple_geo_bench_')
+
+    results = {}
+    try:
+        for name in names:
+            try:
+                results[name] = measure(BENCHMARKS[name], options)
+            except Skip as e:
+                results[name] = {'skipped': str(e)}
+            except Exception as e:
+                results[name] = {'error': '{}: {}'.format(type(e).__name__, e)}
+    finally:
+        shutil.rmtree(options.work_dir, ignore_errors=True)
+        if server is not None:
+            server.stop()
+
+    print('{} features, {} layer, {}s latency, {} runs'.format(options.features, options.geometry, options.latency,
+                                                              options.repeat))
+    print_report(results)
+    if options.json:
+        with open(options.json, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+    status = 1 if any('error' in result for result in results.values()) else 0
+    if options.baseline:
+        with open(options.baseline) as handle:
+            regressions = compare(results, json.load(handle), options.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
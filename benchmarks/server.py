@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+#
+#   Copyright (C) 2017 National Institute For Space Research (INPE) - Brazil.
+#
+#  This file is part of simple_geo.py toolkit.
+#
+#  simple_geo.py toolkit is free software: you can
+#  redistribute it and/or modify it under the terms of the
+#  GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License,
+#  or (at your option) any later version.
+#
+#  simple_geo.py toolkit is distributed in the hope that
+#  it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with simple_geo.py toolkit. See LICENSE. If not, write to
+#  e-sensing team at <esensing-team@dpi.inpe.br>.
+#
+
+"""Local stand-in for the WFS (GeoServer) and WTSS servers used by the benchmarks.
+
+Serves synthetic layers (bench:point, bench:polygon, bench:multipolygon) with the GetCapabilities,
+DescribeFeatureType and GetFeature requests of WFS 1.0.0 (GeoJSON output, CQL_FILTER, maxFeatures/startIndex
+paging, propertyName, sortBy) and the list_coverages, describe_coverage and time_series operations of WTSS.
+
+Run it on its own with:
+
+    python -m benchmarks.server --features 100000 --latency 0.02 --port 8080
+"""
+
+import argparse
+import datetime
+import gzip
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+GEOMETRY_TYPES = {'point': 'gml:Point', 'polygon': 'gml:Polygon', 'multipolygon': 'gml:MultiPolygon'}
+CLASSES = ['Floresta', 'Pasto', 'Agricultura', 'Agua']
+COVERAGE = {'name': 'bench', 'attributes': [{'name': 'ndvi'}, {'name': 'evi'}],
+            'spatial_extent': {'xmin': -60.0, 'xmax': -40.0, 'ymin': -20.0, 'ymax': 0.0},
+            'spatial_resolution': {'x': 0.25, 'y': 0.25},
+            'timeline': [(datetime.date(2016, 1, 1) + datetime.timedelta(days=16 * i)).isoformat()
+                         for i in range(23)]}
+
+
+def synthetic_feature(i, geometry_type):
+    """Builds the i-th feature of a synthetic layer: features are laid on a grid of 0.01 degrees"""
+    x, y = -55.0 + (i % 1000) * 0.01, -15.0 + (i // 1000) * 0.01
+    if geometry_type == 'point':
+        geometry = {'type': 'Point', 'coordinates': [x, y]}
+    else:
+        ring = [[x, y], [x + .008, y], [x + .008, y + .008], [x, y + .008], [x, y]]
+        if geometry_type == 'polygon':
+            geometry = {'type': 'Polygon', 'coordinates': [ring]}
+        else:
+            hole = [[x + .002, y + .002], [x + .004, y + .002], [x + .004, y + .004], [x + .002, y + .002]]
+            geometry = {'type': 'MultiPolygon', 'coordinates': [[ring, hole], [[[x + .009, y], [x + .0095, y],
+                                                                              [x + .0095, y + .0005],
+                                                                              [x + .009, y]]]]}
+    return {'type': 'Feature', 'id': 'layer.{}'.format(i), 'geometry': geometry,
+            'properties': {'fid': i, 'classe': CLASSES[i % len(CLASSES)], 'uf': 'UF{}'.format(i % 27),
+                           'area': round(0.5 + (i % 97) * 0.25, 2),
+                           'timestamp': '2016-{:02d}-{:02d}T00:00:00Z'.format(1 + i % 12, 1 + i % 28)}}
+
+
+class Layers:
+    """The synthetic layers, built on first use"""
+
+    def __init__(self, features):
+        self.features = features
+        self.__layers = {}
+        self.__frames = {}
+        self.__lock = threading.Lock()
+
+    def get(self, geometry_type):
+        with self.__lock:
+            if geometry_type not in self.__layers:
+                self.__layers[geometry_type] = [synthetic_feature(i, geometry_type) for i in range(self.features)]
+            return self.__layers[geometry_type]
+
+    def frame(self, geometry_type):
+        """The GeoDataFrame of a layer, used to evaluate CQL filters"""
+        import geopandas
+        import shapely.geometry
+
+        features = self.get(geometry_type)
+        with self.__lock:
+            if geometry_type not in self.__frames:
+                self.__frames[geometry_type] = geopandas.GeoDataFrame(
+                    [f['properties'] for f in features],
+                    geometry=[shapely.geometry.shape(f['geometry']) for f in features])
+            return self.__frames[geometry_type]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # small responses are written as headers then body, which Nagle's algorithm delays on kept-alive connections
+    disable_nagle_algorithm = True
+    layers = None
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def __params(self):
+        url = urlparse(self.path)
+        params = {k.lower(): v[0] for k, v in parse_qs(url.query).items()}
+        if self.command == 'POST':
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+            # the client does not url encode the GetFeature body
+            for pair in body.split('&'):
+                if '=' in pair:
+                    key, value = pair.split('=', 1)
+                    params[key.lower()] = value
+        return url.path, params
+
+    def __send(self, body, content_type='application/json', status=200):
+        if isinstance(body, str):
+            body = body.encode()
+        headers = {'Content-Type': content_type}
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=1)
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        headers['Content-Length'] = str(len(body))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self):
+        if self.latency:
+            time.sleep(self.latency)
+        path, params = self.__params()
+        try:
+            if path.startswith('/wtss/'):
+                return self.__send(json.dumps(self.wtss(path[len('/wtss/'):], params)))
+            request = params.get('request', '')
+            if request == 'GetCapabilities':
+                return self.__send(self.capabilities(params), 'text/xml')
+            if request == 'DescribeFeatureType':
+                return self.__send(json.dumps(self.description(params)))
+            if request == 'GetFeature' and params.get('resulttype') == 'hits':
+                return self.__send(self.hits(params), 'text/xml')
+            if request == 'GetFeature':
+                return self.__send(json.dumps(self.get_feature(params)))
+            self.__send(json.dumps({'exception': 'unknown request'}), status=400)
+        except Exception as e:
+            self.__send(json.dumps({'exception': str(e)}), status=400)
+
+    @staticmethod
+    def capabilities(params):
+        # WFS 2.0.0 when the client accepts it
+        version = '2.0.0' if '2.0.0' in params.get('acceptversions', '') else '1.0.0'
+        names = ''.join('<FeatureType><Name>bench:{}</Name></FeatureType>'.format(name) for name in GEOMETRY_TYPES)
+        return '<WFS_Capabilities version="{}"><FeatureTypeList>{}</FeatureTypeList></WFS_Capabilities>'.format(
+            version, names)
+
+    @staticmethod
+    def geometry_type(params):
+        name = (params.get('typename') or params.get('typenames') or '').split(':')[-1]
+        if name not in GEOMETRY_TYPES:
+            raise ValueError('unknown feature type {}'.format(name))
+        return name
+
+    def description(self, params):
+        name = self.geometry_type(params)
+        return {'targetPrefix': 'bench', 'featureTypes': [{'typeName': name, 'properties': [
+            {'name': 'geom', 'localType': name, 'type': GEOMETRY_TYPES[name]},
+            {'name': 'fid', 'localType': 'int', 'type': 'xsd:int'},
+            {'name': 'classe', 'localType': 'string', 'type': 'xsd:string'},
+            {'name': 'uf', 'localType': 'string', 'type': 'xsd:string'},
+            {'name': 'area', 'localType': 'number', 'type': 'xsd:double'},
+            {'name': 'timestamp', 'localType': 'dateTime', 'type': 'xsd:dateTime'}]}]}
+
+    def matching(self, params):
+        name = self.geometry_type(params)
+        features = self.layers.get(name)
+        cql = params.get('cql_filter', '')
+        if cql:
+            from SimpleGeo.predicates import Predicates
+
+            expression = Predicates.parse(cql.replace('(geom,', '(#geom#,'))
+            mask = expression.evaluate(self.layers.frame(name)).values
+            features = [feature for feature, keep in zip(features, mask) if keep]
+        return features
+
+    def hits(self, params):
+        return '<wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs/2.0" numberMatched="{}" ' \
+               'numberReturned="0"/>'.format(len(self.matching(params)))
+
+    def get_feature(self, params):
+        features = self.matching(params)
+        if params.get('sortby'):
+            attribute = params['sortby'].split(',')[0].split(' ')[0].strip('()')
+            features = sorted(features, key=lambda f: f['properties'][attribute])
+        total = len(features)
+        start = int(params.get('startindex') or 0)
+        count = params.get('maxfeatures') or params.get('count')
+        features = features[start:start + int(count)] if count else features[start:]
+        if params.get('propertyname'):
+            keep = set(params['propertyname'].split(','))
+            features = [dict(f, properties={k: v for k, v in f['properties'].items() if k in keep})
+                        for f in features]
+        return {'type': 'FeatureCollection', 'totalFeatures': total, 'numberMatched': total,
+                'numberReturned': len(features), 'features': features,
+                'crs': {'type': 'name', 'properties': {'name': 'urn:ogc:def:crs:EPSG::4326'}}}
+
+    @staticmethod
+    def wtss(operation, params):
+        if operation == 'list_coverages':
+            return {'coverages': [COVERAGE['name']]}
+        if operation == 'describe_coverage':
+            return COVERAGE
+        if operation == 'time_series':
+            start, end = params['start_date'], params['end_date']
+            timeline = [date for date in COVERAGE['timeline'] if start <= date <= end]
+            latitude, longitude = float(params['latitude']), float(params['longitude'])
+            attributes = params['attributes'].split(',')
+            # each attribute has its own values, one unit apart
+            names = [attribute['name'] for attribute in COVERAGE['attributes']]
+            return {'result': {'attributes': [{'attribute': attribute,
+                                               'values': [round(abs(latitude * longitude) % 1 + i * 0.01 +
+                                                                names.index(attribute), 4)
+                                                          for i in range(len(timeline))]}
+                                              for attribute in attributes],
+                               'timeline': timeline},
+                    'query': {'coverage': params['coverage'], 'latitude': latitude, 'longitude': longitude}}
+        raise ValueError('unknown operation {}'.format(operation))
+
+
+def serve(features=10000, latency=0.0, port=0):
+    """Starts a stand-in server on a background thread of this process, returning (url, server)"""
+    handler = type('BenchmarkHandler', (Handler,), {'layers': Layers(features), 'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return 'http://127.0.0.1:{}'.format(server.server_address[1]), server
+
+
+class StandInServer:
+    """Runs the stand-in server in a child process, so serving does not weigh on the measured client.
+
+    Example:
+        with StandInServer(features=50000, latency=0.01) as url:
+            SimpleGeo(wfs=url).feature('bench:polygon').get()
+    """
+
+    def __init__(self, features=10000, latency=0.0, port=0):
+        self.features = features
+        self.latency = latency
+        self.port = port
+        self.url = None
+        self.__process = None
+
+    def start(self):
+        self.__process = subprocess.Popen([sys.executable, '-m', 'benchmarks.server', '--features', str(self.features),
+                                           '--latency', str(self.latency), '--port', str(self.port)],
+                                          stdout=subprocess.PIPE, text=True,
+                                          cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        # the child prints its url once it is listening
+        self.url = self.__process.stdout.readline().strip()
+        if not self.url:
+            raise Exception('the stand-in server did not start')
+        return self.url
+
+    def stop(self):
+        if self.__process is not None:
+            self.__process.terminate()
+            self.__process.wait()
+            self.__process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stand-in WFS and WTSS server for the benchmarks')
+    parser.add_argument('--features', type=int, default=10000, help='the number of features of each layer')
+    parser.add_argument('--latency', type=float, default=0.0, help='the delay added to each response, in seconds')
+    parser.add_argument('--port', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    url, server = serve(args.features, args.latency, args.port)
+    print(url, flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -36,5 +36,5 @@ setup(name='SimpleGeo',
       author_email='esensing-team@dpi.inpe.br',
       url='https://github.com/e-sensing/simple_geo.py',
       license=license,
-      packages=find_packages(exclude=('examples', 'docs'))
+      packages=find_packages(exclude=('examples', 'docs', 'benchmarks'))
 )
@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+import shapely
+
+from SimpleGeo.cache import Cache, memory_size
+from SimpleGeo.metrics import Metrics
+
+
+def feature_collection(count):
+    geometry = shapely.buffer(shapely.points(np.random.rand(count, 2)), 0.01, quad_segs=8)
+    return {'total': count, 'total_features': count, 'ids': ['f.{}'.format(i) for i in range(count)],
+            'properties': {'uf': ['UF{}'.format(i % 27) for i in range(count)], 'area': np.random.rand(count)},
+            'geometry': geometry}
+
+
+def test_memory_tier_counts_loaded_size(tmp_path):
+    fc = feature_collection(2000)
+    cache = Cache(str(tmp_path))
+    cache.set("feature_collection", 'key', fc)
+
+    stats = cache.stats()
+    assert stats['memory_bytes'] == memory_size(fc)
+    assert stats['memory_bytes'] > os.path.getsize(str(tmp_path / "feature_collection" / "key.pkl"))
+    # the coordinates alone take 16 bytes each
+    assert stats['memory_bytes'] > shapely.get_num_coordinates(fc['geometry']).sum() * 16
+
+
+def test_memory_tier_is_bounded_by_loaded_size(tmp_path):
+    fc = feature_collection(2000)
+    cache = Cache(str(tmp_path), memory_size=memory_size(fc) * 3 // 2)
+    cache.set("feature_collection", 'first', fc)
+    cache.set("feature_collection", 'second', fc)
+
+    stats = cache.stats()
+    assert stats['memory_entries'] == 1
+    assert stats['memory_evictions'] == 1
+
+
+def test_quota_keeps_entries_used_from_memory(tmp_path):
+    cache = Cache(str(tmp_path), disk_quota=None)
+    for key in ('hot', 'cold'):
+        cache.set("entry", key, b'x' * 1000)
+        # older files
+        os.utime(str(tmp_path / "entry" / "{}.pkl".format(key)), (1, 1))
+    for _ in range(3):
+        assert cache.get("entry", 'hot') is not None
+    cache.disk_quota = 2500
+    cache.set("entry", 'new', b'x' * 1000)
+
+    assert sorted(os.listdir(str(tmp_path / "entry"))) == ['hot.pkl', 'new.pkl']
+
+
+def test_quota_does_not_remove_pinned_entries(tmp_path):
+    cache = Cache(str(tmp_path), disk_quota=2500, pinned={'validators'})
+    cache.set("validators", 'key', b'x' * 1000)
+    cache.set("entry", 'first', b'x' * 1000)
+    cache.set("entry", 'second', b'x' * 1000)
+
+    assert os.listdir(str(tmp_path / "validators")) == ['key.pkl']
+    assert os.listdir(str(tmp_path / "entry")) == ['second.pkl']
+
+
+def test_events_report_the_stored_size(tmp_path):
+    events = []
+    metrics = Metrics()
+    metrics.add_hook(lambda event, fields: events.append((event, fields.get('tier'), fields.get('bytes'))))
+    fc = feature_collection(100)
+    cache = Cache(str(tmp_path), metrics=metrics)
+    cache.set("feature_collection", 'key', fc)
+    cache.get("feature_collection", 'key')
+    Cache(str(tmp_path), metrics=metrics).get("feature_collection", 'key')
+    cache.get("feature_collection", 'other')
+
+    size = os.path.getsize(str(tmp_path / "feature_collection" / "key.pkl"))
+    assert events == [('cache.set', None, size), ('cache.hit', 'memory', size), ('cache.hit', 'disk', size),
+                      ('cache.miss', None, None)]
@@ -0,0 +1,35 @@
+import shapely
+
+from SimpleGeo.geojson import FeatureDecoder
+
+
+def point(i, properties):
+    return {'id': 'f.{}'.format(i), 'properties': properties,
+            'geometry': None if i == 2 else {'type': 'Point', 'coordinates': [i, -i]}}
+
+
+def test_columns_are_aligned_with_heterogeneous_properties():
+    items = [point(0, {'a': 1, 'b': 'x'}), point(1, {'a': 2}), point(2, {'a': 3}), point(3, {'a': 4}),
+             point(4, {'b': 'z', 'c': True}), point(5, {}), point(6, {'a': 7, 'b': 'w', 'c': False})]
+    decoder = FeatureDecoder('gml:Point', chunk_size=3)
+    decoder.extend(items)
+    columns = decoder.finish()
+
+    assert columns['properties'] == {'a': [1, 2, 3, 4, None, None, 7],
+                                     'b': ['x', None, None, None, 'z', None, 'w'],
+                                     'c': [None, None, None, None, True, None, False]}
+    assert columns['ids'] == ['f.{}'.format(i) for i in range(7)]
+    assert [None if g is None else (g.x, g.y) for g in columns['geometry']] == \
+        [(0, 0), (1, -1), None, (3, -3), (4, -4), (5, -5), (6, -6)]
+
+
+def test_polygons_are_built_in_chunks():
+    square = [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]
+    items = [{'id': i, 'properties': {'n': i}, 'geometry': {'type': 'Polygon', 'coordinates': square}}
+             for i in range(5)]
+    decoder = FeatureDecoder('gml:Polygon', chunk_size=2)
+    decoder.extend(items)
+    columns = decoder.finish()
+
+    assert len(columns['geometry']) == 5
+    assert shapely.area(columns['geometry']).tolist() == [1.0] * 5
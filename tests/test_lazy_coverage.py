@@ -0,0 +1,100 @@
+import threading
+
+import numpy as np
+import pytest
+
+from SimpleGeo.cache import Cache
+from SimpleGeo.lazy_coverage import CoverageArray
+
+TIMELINE = ['2016-01-01', '2016-01-17', '2016-02-02']
+# pixels of 1 degree from (0, 10): columns 2..6 and rows 1..3 are the region, in chunks of 2 x 2 pixels
+GRID = (0.0, 10.0, 1.0, 1.0)
+
+
+def pixel_values(latitude, longitude):
+    return {'a': [longitude * 10 + latitude + t for t in range(3)],
+            'b': [None if t == 1 else -longitude for t in range(3)]}
+
+
+def coverage(store=None, key=None):
+    fetched = []
+    lock = threading.Lock()
+
+    def fetch(latitude, longitude):
+        with lock:
+            fetched.append((latitude, longitude))
+        return TIMELINE, pixel_values(latitude, longitude)
+
+    array = CoverageArray(fetch, range(2, 7), range(1, 4), TIMELINE, ['a', 'b'], GRID, chunks=(2, 2), workers=3,
+                          store=store, key=key)
+    return array, fetched
+
+
+def dense():
+    values = np.empty((5, 3, 3, 2))
+    for x in range(5):
+        for y in range(3):
+            pixel = pixel_values(10.0 - (y + 1.5), x + 2.5)
+            values[x, y, :, 0] = pixel['a']
+            values[x, y, :, 1] = [np.nan if v is None else v for v in pixel['b']]
+    return values
+
+
+def test_pixel_centres():
+    array, _ = coverage()
+
+    assert array.shape == (5, 3, 3, 2)
+    assert array.x.tolist() == [2.5, 3.5, 4.5, 5.5, 6.5]
+    assert array.y.tolist() == [8.5, 7.5, 6.5]
+
+
+@pytest.mark.parametrize('key', [
+    (slice(None),),
+    (slice(1, 4), slice(1, 3)),
+    (slice(None, None, -1), slice(2, 0, -1)),
+    (slice(0, 5, 3), 2, slice(None), 1),
+    (-1, -1),
+    (3, slice(None), 0),
+])
+def test_indexing_across_chunk_boundaries(key):
+    array, _ = coverage()
+
+    np.testing.assert_array_equal(array[key], dense()[key])
+
+
+def test_indexing_only_fetches_the_overlapped_chunks():
+    array, fetched = coverage()
+
+    # x 1..2 and y 1 overlap the chunks (0, 0) and (1, 0), of 2 x 2 pixels each
+    array[1:3, 1]
+    assert len(fetched) == 8
+    with pytest.raises(IndexError):
+        array[5]
+
+
+# the reference reductions warn about the all-NaN slices of b
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+@pytest.mark.parametrize('axis', [None, 0, 2, (0, 1), (0, 1, 2)])
+def test_reductions_match_the_dense_array(axis):
+    array, _ = coverage()
+    values = dense()
+
+    np.testing.assert_allclose(array.sum(axis=axis), np.nansum(values, axis=axis))
+    np.testing.assert_allclose(array.mean(axis=axis), np.nanmean(values, axis=axis))
+    np.testing.assert_allclose(array.min(axis=axis), np.nanmin(values, axis=axis))
+    np.testing.assert_array_equal(array.count(axis=axis), np.sum(~np.isnan(values), axis=axis))
+
+
+def test_chunks_are_fetched_once_with_a_store(tmp_path):
+    store = Cache(str(tmp_path))
+
+    def key(columns, rows):
+        return 'chunk-{}-{}'.format(columns, rows)
+
+    array, fetched = coverage(store, key)
+    array.compute()
+    assert len(fetched) == 15
+
+    again, fetched = coverage(store, key)
+    np.testing.assert_array_equal(again.compute(), dense())
+    assert fetched == []
@@ -0,0 +1,46 @@
+import pandas as pd
+
+from SimpleGeo.predicates import Between, Comparison, Logical, Predicates, Raw
+
+
+def test_parse_comparison_stops_at_closing_quote():
+    assert type(Predicates.parse("classe='Pasto' uf='UF1'")) is Raw
+
+    expression = Predicates.parse("nome='O''Brien'")
+    assert type(expression) is Comparison
+    assert expression.evaluate(pd.DataFrame({'nome': ["O'Brien", "O"]})).tolist() == [True, False]
+
+
+def test_parse_hand_written_operators():
+    for cql in ("classe='Pasto' AND uf='UF1'", "classe='Pasto' and  uf='UF1'", "(classe='Pasto')+AND+(uf='UF1')"):
+        expression = Predicates.parse(cql)
+        assert type(expression) is Logical and expression.operator == 'AND'
+        assert [(op.attribute, op.value) for op in expression.operands] == [('classe', 'Pasto'), ('uf', 'UF1')]
+
+    expression = Predicates.parse("classe='Pasto' OR uf='UF1' AND area BETWEEN '1' AND '2'")
+    assert expression.operator == 'OR'
+    assert [type(op) for op in expression.operands[1].operands] == [Comparison, Between]
+
+    # operators inside quoted values
+    assert Predicates.parse("classe='Pasto AND uf' OR uf='UF1'").operands[0].value == 'Pasto AND uf'
+
+
+def test_comparisons_do_not_match_nulls():
+    frame = pd.DataFrame({'uf': ['UF1', None, 'UF2'], 'area': [1.0, None, 3.0]})
+    assert Predicates.NE('uf', 'UF1').evaluate(frame).tolist() == [False, False, True]
+    assert Predicates.NE('area', '1').evaluate(frame).tolist() == [False, False, True]
+    assert Predicates.BT('area', '0', '5').evaluate(frame).tolist() == [True, False, True]
+
+
+
+def test_values_that_do_not_convert_match_nothing():
+    frame = pd.DataFrame({'area': [1.0, 2.5], 'ativo': [True, False], 'data': ['2016-01-01', '2016-02-01']})
+
+    assert Predicates.EQ('area', 'grande').evaluate(frame).tolist() == [False, False]
+    assert Predicates.NE('area', 'grande').evaluate(frame).tolist() == [False, False]
+    assert Predicates.BT('area', 'a', 'z').evaluate(frame).tolist() == [False, False]
+    assert Predicates.GT('area', '2').evaluate(frame).tolist() == [False, True]
+    assert Predicates.EQ('ativo', 'true').evaluate(frame).tolist() == [True, False]
+    assert Predicates.EQ('ativo', 'sim').evaluate(frame).tolist() == [False, False]
+    # not a valid date: compared as text
+    assert Predicates.LT('data', '2016-13-01').evaluate(frame).tolist() == [True, True]
@@ -0,0 +1,63 @@
+from SimpleGeo.cache import Cache
+from SimpleGeo.predicates import Predicates
+from SimpleGeo.semantic_cache import SemanticCache
+from SimpleGeo.simple_geo import SimpleGeo
+
+ARGS = {'attributes': [], 'filter': '', 'max_features': None, 'sort_by': []}
+FC = {'total': 3, 'total_features': 3, 'ids': ['f.1', 'f.2', 'f.3'],
+      'properties': {'classe': ['Pasto', 'Pasto', 'Soja'], 'uf': ['UF1', 'UF2', 'UF1']}}
+
+
+def cached_layer(path, **kwargs):
+    store = Cache(str(path))
+    semantic_cache = SemanticCache(store, SimpleGeo._get_cache_hash, SimpleGeo._feature_frame, **kwargs)
+    store.set("feature_collection", SimpleGeo._get_cache_hash('server', "feature_collection", 'layer', ARGS), FC)
+    semantic_cache.register('server', 'layer', ARGS, FC)
+    return store, semantic_cache
+
+
+def index_of(store):
+    return store.get("query_index", SimpleGeo._get_cache_hash('server', "query_index", 'layer', {}))
+
+
+def test_lookup_narrows_hand_written_filter(tmp_path):
+    store, semantic_cache = cached_layer(tmp_path)
+
+    narrowed = dict(ARGS, filter="classe='Pasto' AND uf='UF1'")
+    geo_data = semantic_cache.lookup('server', 'layer', narrowed)
+    assert geo_data[['classe', 'uf']].values.tolist() == [['Pasto', 'UF1']]
+
+    assert semantic_cache.lookup('server', 'layer', dict(ARGS, filter="classe='Pasto' uf='UF1'")) is None
+
+
+def test_index_is_bounded(tmp_path):
+    store, semantic_cache = cached_layer(tmp_path, max_queries=2)
+    for uf in ('UF1', 'UF2', 'UF3'):
+        semantic_cache.register('server', 'layer', dict(ARGS, filter=str(Predicates.EQ('uf', uf))), FC)
+
+    assert [entry[0]['filter'] for entry in index_of(store)] == ["uf='UF2'", "uf='UF3'"]
+
+
+def test_lookup_forgets_queries_no_longer_cached(tmp_path):
+    store, semantic_cache = cached_layer(tmp_path)
+    store.delete("feature_collection", SimpleGeo._get_cache_hash('server', "feature_collection", 'layer', ARGS))
+
+    assert semantic_cache.lookup('server', 'layer', dict(ARGS, filter=str(Predicates.EQ('uf', 'UF1')))) is None
+    assert index_of(store) == []
+
+
+def test_lookup_reads_only_the_needed_columns_of_every_attribute_query(tmp_path, monkeypatch):
+    store, semantic_cache = cached_layer(tmp_path)
+    get = store.get
+    requested = []
+
+    def spy(resource_type, key, columns=None):
+        if resource_type == "feature_collection":
+            requested.append(columns)
+        return get(resource_type, key, columns=columns)
+
+    monkeypatch.setattr(store, 'get', spy)
+    geo_data = semantic_cache.lookup('server', 'layer', dict(ARGS, attributes=['uf'], filter="classe='Pasto'"))
+
+    assert requested == [['classe', 'uf']]
+    assert geo_data['uf'].tolist() == ['UF1', 'UF2']
@@ -0,0 +1,50 @@
+import pickle
+
+import pytest
+import shapely
+
+from benchmarks.server import serve
+from SimpleGeo import SimpleGeo
+from SimpleGeo.spatial_index import SpatialIndex
+
+
+def test_fingerprint_identifies_the_indexed_geometries():
+    points = [shapely.Point(0, 0), shapely.Point(1, 1)]
+    index = SpatialIndex(points)
+
+    assert index.fingerprint == SpatialIndex.fingerprint_of(points)
+    # same number of features, different layer
+    assert index.fingerprint != SpatialIndex.fingerprint_of([shapely.Point(1, 1), shapely.Point(0, 0)])
+    assert index.fingerprint != SpatialIndex.fingerprint_of([shapely.Point(0, 0), None])
+
+
+def test_stored_index_is_rebuilt_against_the_layer_geometries():
+    points = [shapely.Point(0, 0), shapely.Point(1, 1)]
+    stored = pickle.dumps(SpatialIndex(points, node_capacity=4))
+    # only the node capacity and the fingerprint are stored
+    assert b'\x01\x01\x00\x00\x00' not in stored
+
+    index = pickle.loads(stored)
+    with pytest.raises(AttributeError):
+        index.bbox(0.5, 0.5, 2, 2)
+    index = index.rebuild(points)
+    assert index.node_capacity == 4
+    assert index.fingerprint == SpatialIndex.fingerprint_of(points)
+    assert list(index.bbox(0.5, 0.5, 2, 2)) == [1]
+
+
+def test_materialize_reuses_the_stored_index_without_hashing(tmp_path, monkeypatch):
+    url, server = serve(features=20)
+    try:
+        s = SimpleGeo(wfs=url, cache=True, cache_dir=str(tmp_path))
+        layer = s.materialize(s.feature('bench:polygon'))
+
+        def fingerprint_of(geometries):
+            raise AssertionError('the fingerprint was computed again')
+
+        monkeypatch.setattr(SpatialIndex, 'fingerprint_of', staticmethod(fingerprint_of))
+        again = SimpleGeo(wfs=url, cache=True, cache_dir=str(tmp_path)).materialize(s.feature('bench:polygon'))
+        assert again.index.fingerprint == layer.index.fingerprint
+        assert list(again.bbox(-55, -15, -45, -5)['fid']) == list(layer.bbox(-55, -15, -45, -5)['fid'])
+    finally:
+        server.shutdown()
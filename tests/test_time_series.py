@@ -0,0 +1,177 @@
+import datetime
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import Point
+
+from benchmarks.server import serve
+from SimpleGeo import SimpleGeo
+from SimpleGeo.time_series import TimeSeriesArray
+
+
+def day(month, day_of_month=1):
+    return datetime.date(2016, month, day_of_month)
+
+
+def test_missing_intervals():
+    covered = [(day(2), day(3, 31)), (day(6), day(6, 30))]
+
+    assert SimpleGeo._missing_intervals([], day(1), day(12, 31)) == [(day(1), day(12, 31))]
+    assert SimpleGeo._missing_intervals(covered, day(1), day(12, 31)) == \
+        [(day(1), day(1, 31)), (day(4), day(5, 31)), (day(7), day(12, 31))]
+    assert SimpleGeo._missing_intervals(covered, day(2, 10), day(3, 20)) == []
+    assert SimpleGeo._missing_intervals(covered, day(3, 10), day(4, 20)) == [(day(4), day(4, 20))]
+    assert SimpleGeo._missing_intervals(covered, day(5), day(4)) == []
+
+
+def test_add_interval_merges_overlapping_and_adjacent():
+    intervals = SimpleGeo._add_interval([(day(2), day(3, 31))], day(6), day(6, 30))
+    assert intervals == [(day(2), day(3, 31)), (day(6), day(6, 30))]
+    assert SimpleGeo._add_interval(intervals, day(4), day(5, 31)) == [(day(2), day(6, 30))]
+    assert SimpleGeo._add_interval(intervals, day(3, 15), day(4, 10)) == [(day(2), day(4, 10)), (day(6), day(6, 30))]
+
+
+def series_array():
+    first = pd.DataFrame({'ndvi': [0.1, 0.2], 'evi': [1.1, 1.2]}, index=[day(1), day(2)])
+    # another timeline, with the columns in another order
+    last = pd.DataFrame({'evi': [2.2, 2.3], 'ndvi': [0.3, np.nan]}, index=[day(2), day(3)])
+    positions = [Point(-50, -10), Point(-51, -11), Point(-52, -12)]
+    return TimeSeriesArray.from_series(positions, iter([first, None, last]), {1: ValueError('failed')})
+
+
+def test_series_array_shares_the_timeline():
+    array = series_array()
+
+    assert array.shape == (3, 3, 2)
+    assert array.timeline == [day(1), day(2), day(3)]
+    assert array.attributes == ['ndvi', 'evi']
+    np.testing.assert_array_equal(array.values[0], [[0.1, 1.1], [0.2, 1.2], [np.nan, np.nan]])
+    assert np.isnan(array.values[1]).all()
+    np.testing.assert_array_equal(array.values[2], [[np.nan, np.nan], [0.3, 2.2], [np.nan, 2.3]])
+    assert array.latitude.tolist() == [-10, -11, -12]
+    assert array.longitude.tolist() == [-50, -51, -52]
+
+
+def test_series_array_indexing():
+    array = series_array()
+
+    np.testing.assert_array_equal(array[0]['evi'], [1.1, 1.2, np.nan])
+    assert list(array[0].index) == array.timeline
+    assert array[0].total == 3
+    assert array[1] is None
+    assert array[-1]['evi'].tolist()[1:] == [2.2, 2.3]
+    np.testing.assert_array_equal(array[np.int64(2)]['evi'], array[-1]['evi'])
+    sliced = array[::2]
+    assert len(sliced) == 2 and sliced[1]['ndvi'].tolist()[1] == 0.3
+    assert [frame is None for frame in array] == [False, True, False]
+    with pytest.raises(IndexError):
+        array[3]
+    with pytest.raises(IndexError):
+        array[-4]
+
+
+def test_series_array_frame_and_statistics():
+    array = series_array()
+
+    frame = array.to_frame()
+    assert len(frame) == 9
+    assert list(frame.columns) == ['point', 'latitude', 'longitude', 'date', 'ndvi', 'evi']
+    assert frame[frame['point'] == 2]['evi'].tolist()[1:] == [2.2, 2.3]
+    np.testing.assert_allclose(array.mean()['ndvi'], [0.15, np.nan, 0.3])
+    assert array.count()['evi'].tolist() == [2, 0, 2]
+
+
+@pytest.fixture
+def server():
+    url, server = serve(features=10)
+    yield url
+    server.shutdown()
+
+
+def test_concurrent_periods_of_a_location_are_merged(server, tmp_path):
+    s = SimpleGeo(wtss=server, cache=True, cache_dir=str(tmp_path))
+    months = [(day(m), (day(m + 1) if m < 12 else datetime.date(2017, 1, 1)) - datetime.timedelta(days=1))
+              for m in range(1, 13)]
+    barrier = threading.Barrier(len(months))
+
+    def fetch(start, end):
+        ts = s.time_series(s.coverage('bench').attributes(['ndvi'])).period(start.isoformat(), end.isoformat())
+        barrier.wait()
+        ts.get(Point(-50.0, -10.0))
+
+    threads = [threading.Thread(target=fetch, args=month) for month in months]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    s.reset_stats()
+    year = s.time_series(s.coverage('bench').attributes(['ndvi'])).period('2016-01-01', '2016-12-31') \
+        .get(Point(-50.0, -10.0))
+    assert 'wtss.request' not in s.stats()
+    assert len(year) == 23
+
+
+def test_inverted_period_is_rejected(server, tmp_path):
+    s = SimpleGeo(wtss=server, cache=True, cache_dir=str(tmp_path))
+    with pytest.raises(AttributeError):
+        s.time_series(s.coverage('bench').attributes(['ndvi'])).period('2016-12-31', '2016-01-01') \
+            .get(Point(-50.0, -10.0))
+
+
+def test_cached_location_is_shared_by_attribute_orders_and_equal_coordinates(server, tmp_path):
+    s = SimpleGeo(wtss=server, cache=True, cache_dir=str(tmp_path))
+    first = s.time_series(s.coverage('bench').attributes(['ndvi', 'evi'])).period('2016-01-01', '2016-12-31') \
+        .get(Point(-50, -10))
+
+    s.reset_stats()
+    second = s.time_series(s.coverage('bench').attributes(['evi', 'ndvi'])).period('2016-01-01', '2016-12-31') \
+        .get(Point(-50.0, -10.0))
+    assert 'wtss.request' not in s.stats()
+    assert list(second.columns) == ['evi', 'ndvi']
+    assert second['ndvi'].tolist() == first['ndvi'].tolist()
+    assert second['evi'].tolist() == first['evi'].tolist()
+
+
+def test_points_in_the_same_pixel_are_requested_once(server):
+    # pixels of 0.25 degrees from (-60, 0): the first two points share one
+    points = [Point(-50.01, -10.01), Point(-50.2, -10.2), Point(-49.9, -10.1)]
+
+    s = SimpleGeo(wtss=server, snap=True)
+    ts = s.time_series(s.coverage('bench').attributes(['ndvi'])).period('2016-01-01', '2016-12-31')
+    s.reset_stats()
+    series = ts.get(points, workers=4)
+    assert s.stats()['wtss.request']['count'] == 2
+    assert series.values[0].tolist() == series.values[1].tolist()
+    assert series.values[0].tolist() != series.values[2].tolist()
+    assert [p for p, _, _ in ts.iter(points)] == points
+
+    s = SimpleGeo(wtss=server)
+    ts = s.time_series(s.coverage('bench').attributes(['ndvi'])).period('2016-01-01', '2016-12-31')
+    ts.get(points)
+    assert s.stats()['wtss.request']['count'] == 3
+
+
+def test_async_points_in_the_same_pixel_are_requested_once(server):
+    asyncio = pytest.importorskip('asyncio')
+    pytest.importorskip('aiohttp')
+    from SimpleGeo import AsyncSimpleGeo
+
+    # the grid of the coverage is read with describe_coverage, so only time_series requests are counted
+    uris = []
+
+    def hook(event, fields):
+        if event == 'wtss.request':
+            uris.append(fields['uri'])
+
+    async def get(points):
+        async with AsyncSimpleGeo(wtss=server, snap=True, hooks=[hook]) as s:
+            ts = s.time_series(s.coverage('bench').attributes(['ndvi'])).period('2016-01-01', '2016-12-31')
+            series = await ts.aget(points)
+            return series, len([uri for uri in uris if uri.endswith('/time_series')])
+
+    series, requests = asyncio.run(get([Point(-50.01, -10.01), Point(-50.2, -10.2), Point(-49.9, -10.1)]))
+    assert requests == 2
+    assert series.values[0].tolist() == series.values[1].tolist()
@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+from benchmarks.server import serve
+from SimpleGeo import WFS
+from SimpleGeo.predicates import Predicates
+
+
+@pytest.fixture
+def server():
+    url, server = serve(features=10)
+    yield url
+    server.shutdown()
+
+
+@pytest.mark.parametrize('version', ['1.0.0', '2.0.0'])
+def test_feature_collection_len_without_filter(server, version):
+    wfs = WFS(server, version=version)
+
+    assert wfs.feature_collection_len('bench:point', filter=None) == 10
+    assert wfs.feature_collection_len('bench:point') == 10
+    assert wfs.feature_collection_len('bench:point', filter=str(Predicates.LT('fid', 3))) == 3
+
+
+def fids(pages):
+    return [fid for fc in pages for fid in fc['properties']['fid']]
+
+
+def test_iter_features_pages(server):
+    wfs = WFS(server)
+
+    pages = list(wfs.iter_features('bench:point', page_size=4))
+    assert [fc['total'] for fc in pages] == [4, 4, 2]
+    assert fids(pages) == list(range(10))
+
+    pages = list(wfs.iter_features('bench:point', page_size=4, start_index=3, max_features=5))
+    assert [fc['total'] for fc in pages] == [4, 1]
+    assert fids(pages) == [3, 4, 5, 6, 7]
+
+    # the page after the last full one is empty and not yielded
+    assert [fc['total'] for fc in wfs.iter_features('bench:point', page_size=5)] == [5, 5]
+    assert list(wfs.iter_features('bench:point', page_size=4, filter=str(Predicates.GT('fid', 20)))) == []
+    with pytest.raises(AttributeError):
+        next(wfs.iter_features('bench:point', page_size=0))
+
+
+class SlowFirstPagesWFS(WFS):
+    """Answers the first pages last, and records how many pages are requested at the same time"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _get_feature(self, data, feature_desc, validators=None):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep((10 - data.get('startIndex', 0)) * 0.01)
+            return super()._get_feature(data, feature_desc, validators)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+@pytest.mark.parametrize('kwargs, expected', [
+    ({}, list(range(10))),
+    ({'start_index': 1, 'max_features': 7}, list(range(1, 8))),
+])
+def test_concurrent_pages_are_yielded_in_order(server, kwargs, expected):
+    wfs = SlowFirstPagesWFS(server)
+
+    pages = list(wfs.iter_features('bench:point', page_size=2, workers=4, **kwargs))
+    assert fids(pages) == expected
+    assert 1 < wfs.max_in_flight <= 4
+
+    fc = wfs.feature_collection('bench:point', page_size=2, workers=4, **kwargs)
+    assert fc['properties']['fid'] == expected
+    assert fc['total'] == len(expected)
+
+
+def test_feature_descriptions_are_shared_by_the_clients_of_a_server(server):
+    first = WFS(server)
+    first.describe_feature('bench:point')
+
+    second = WFS(server + '/')
+    second.describe_feature('bench:point')
+    assert 'wfs.request' not in second.metrics.snapshot()
+
+    second.invalidate_schema()
+    assert first.get_schema('bench:point') is None
+    # a client without schema cache does not use the shared one
+    first.describe_feature('bench:point')
+    assert WFS(server, schema_ttl=0).get_schema('bench:point') is None
+
+
+def test_tiled_max_features_applies_to_the_distinct_features(server):
+    wfs = WFS(server)
+    # tiles of 0.025 degrees: some polygons of 0.008 degrees cross their borders
+    bbox = (-55.0, -15.01, -54.9, -14.99)
+
+    fc = wfs.tiled_feature_collection('bench:polygon', tiles=(4, 1), bbox=bbox, workers=2)
+    assert fc['properties']['fid'] == list(range(10))
+    assert fc['total'] == fc['total_features'] == 10
+
+    fc = wfs.tiled_feature_collection('bench:polygon', tiles=(4, 1), bbox=bbox, workers=2, max_features=4)
+    assert fc['properties']['fid'] == [0, 1, 2, 3]
+    assert fc['total'] == 4
+    assert fc['total_features'] == 'unknown'
+
+    fc = wfs.tiled_feature_collection('bench:polygon', tiles=(4, 1), bbox=bbox, workers=2, max_features=20)
+    assert fc['properties']['fid'] == list(range(10))
+    assert fc['total_features'] == 10
@@ -0,0 +1,24 @@
+import datetime
+
+from shapely.geometry import Point
+
+from benchmarks.server import serve
+from SimpleGeo import SimpleGeo
+from SimpleGeo.wtss_client import WTSSClient
+
+
+def test_time_series_from_stand_in_server():
+    url, server = serve(features=10)
+    try:
+        client = WTSSClient(url)
+        assert client.list_coverages() == {'coverages': ['bench']}
+        result = client.time_series('bench', ['ndvi'], -10.0, -50.0, '2016-01-01', '2016-02-01')
+        assert result.timeline[0] == datetime.date(2016, 1, 1)
+        assert len(result.attributes['ndvi']) == len(result.timeline)
+
+        s = SimpleGeo(wtss=url)
+        frame = s.time_series(s.coverage('bench').attributes(['ndvi'])).period('2016-01-01', '2016-02-01') \
+            .get(Point(-50.0, -10.0))
+        assert frame['ndvi'].tolist() == result.attributes['ndvi']
+    finally:
+        server.shutdown()